@@ -0,0 +1,796 @@
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing.connection import wait
+
+from dotenv import load_dotenv
+
+from agent_worker import EVENT, FAILED, READY, RESULT, STATS, worker_main
+from page_cache import SCRAPE_COST
+
+load_dotenv()
+
+# Number of warm worker processes, each with its own Bright Data MCP session
+POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "2"))
+
+# Seconds a chat job may take from submission to result, queueing included
+JOB_TIMEOUT = float(os.getenv("AGENT_JOB_TIMEOUT", "300"))
+
+# Jobs allowed to wait for a worker, further jobs are refused
+MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", str(POOL_SIZE * 4)))
+
+# Seconds overloaded clients are asked to wait before retrying
+RETRY_AFTER = int(os.getenv("AGENT_RETRY_AFTER", "30"))
+
+# Seconds to wait before replacing a worker that died while starting up
+RESTART_DELAY = float(os.getenv("AGENT_RESTART_DELAY", "5"))
+
+# A worker is recycled after serving this many jobs, 0 disables
+MAX_JOBS_PER_WORKER = int(os.getenv("AGENT_MAX_JOBS_PER_WORKER", "50"))
+
+# A worker is recycled once it and its npx/node children use more memory
+# than this, in MB. 0 disables
+MAX_WORKER_RSS_MB = float(os.getenv("AGENT_MAX_WORKER_RSS_MB", "1024"))
+
+# Seconds a recycled worker gets to finish its job and stop before it is killed
+DRAIN_TIMEOUT = float(os.getenv("AGENT_DRAIN_TIMEOUT", str(JOB_TIMEOUT + 30)))
+
+# Seconds finished jobs are kept for GET /jobs/{id}, and how many at most
+JOB_RESULT_TTL = float(os.getenv("AGENT_JOB_RESULT_TTL", "3600"))
+MAX_FINISHED_JOBS = int(os.getenv("AGENT_MAX_FINISHED_JOBS", "200"))
+
+# Seconds a successful answer is reused for the same message, and how many
+# answers are kept. 0 disables the cache
+RESULT_CACHE_TTL = float(os.getenv("AGENT_RESULT_CACHE_TTL", "1800"))
+RESULT_CACHE_SIZE = int(os.getenv("AGENT_RESULT_CACHE_SIZE", "500"))
+
+# Seconds between keep-alive comments on an idle event stream
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Seconds between health checks of the workers
+MONITOR_INTERVAL = 1.0
+
+# Seconds between memory measurements of the workers
+MEMORY_CHECK_INTERVAL = float(os.getenv("AGENT_MEMORY_CHECK_INTERVAL", "10"))
+
+# Worker states
+STARTING = "starting"
+IDLE = "idle"
+BUSY = "busy"
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED_STATUS = "failed"
+
+# Event types that end a job's event stream
+FINAL_EVENTS = (DONE, FAILED_STATUS)
+
+
+class PoolOverloadedError(Exception):
+    """Raised when the job queue is full."""
+
+
+def parse_chat_request(data):
+    """
+    Validate a /chat or /jobs request body.
+
+    Returns:
+        tuple: The message and the optional timeout in seconds
+
+    Raises:
+        ValueError: With the error message to send back to the client
+    """
+    if not isinstance(data, dict) or 'message' not in data:
+        raise ValueError('Missing message in request body')
+
+    user_input = data['message']
+    if not isinstance(user_input, str) or not user_input.strip():
+        raise ValueError('Message cannot be empty')
+
+    timeout = data.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool)
+                                or not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise ValueError('Timeout must be a positive number of seconds')
+    return user_input, timeout
+
+
+def format_event(event):
+    """A job event as a Server-Sent Events message."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def last_event_id(value):
+    """Index of the first event to send to a client resuming with a Last-Event-ID header."""
+    try:
+        return int(value) + 1 if value is not None else 0
+    except ValueError:
+        return 0
+
+
+def normalize_message(message):
+    """Key of a chat message for the result cache: case and whitespace don't matter."""
+    return " ".join(message.split()).casefold()
+
+
+class _Worker:
+    def __init__(self, worker_id, process, conn):
+        self.id = worker_id
+        self.process = process
+        # Each worker has its own pipe, so a worker that is killed mid-message
+        # can't block the others
+        self.conn = conn
+        self.state = STARTING
+        self.job_id = None
+        self.job_started = None
+        self.jobs_done = 0
+        self.started_at = time.time()
+        self.rss = None
+        # Set once the worker is being replaced, it takes no new jobs
+        self.draining = False
+        self.stop_sent_at = None
+
+
+def _process_tree(pid):
+    """pid and all its descendants, read from /proc. Just [pid] where /proc is unavailable."""
+    children = defaultdict(list)
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return [pid]
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, the parent pid follows it
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children[ppid].append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, ()))
+    return tree
+
+
+def _rss(pid):
+    """Resident memory of a process in bytes, None if it can't be read."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _tree_rss(pid):
+    sizes = [_rss(member) for member in _process_tree(pid)]
+    sizes = [size for size in sizes if size is not None]
+    return sum(sizes) if sizes else None
+
+
+def _kill_tree(process):
+    """Kill a worker together with the npx and node processes it started."""
+    if process.pid is None:
+        return
+    for member in reversed(_process_tree(process.pid)):
+        try:
+            os.kill(member, signal.SIGKILL)
+        except OSError:
+            pass
+    process.join(5)
+
+
+class Job:
+    """
+    A chat job and the log of its progress events.
+
+    Events are dicts with an increasing 'id' and a 'type': 'status' when the
+    job is queued or starts running, 'tool_call', 'tool_result' and 'message'
+    for the agent's steps, 'page_extracted' with the token counts of each
+    scraped page, and finally 'done' or 'failed'.
+    """
+
+    def __init__(self, message, timeout):
+        self.id = uuid.uuid4().hex[:12]
+        self.message = message
+        self.key = normalize_message(message)
+        self.future = Future()
+        # /chat callers still waiting for the job, and whether a /jobs caller
+        # holds it. A job nobody waits for any more is dropped from the queue
+        self.waiters = 0
+        self.kept = False
+        # (deadline, timeout, future) of each /chat caller, who may give up
+        # sooner than the job's own deadline
+        self.callers = []
+        self.submitted_at = time.time()
+        self.deadline = self.submitted_at + timeout
+        self.status = QUEUED
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._changed = threading.Condition()
+        self._listeners = []
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED_STATUS)
+
+    def add_event(self, event):
+        with self._changed:
+            self.events.append({'id': len(self.events), 'time': round(time.time(), 3), **event})
+            self._changed.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def wait_for_events(self, after, timeout):
+        """Block until there are events past index `after`, return them (empty on timeout)."""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > after, timeout)
+            return self.events[after:]
+
+    def all_sent(self, after):
+        """Whether a client holding the events before index `after` has the final one."""
+        with self._changed:
+            return after >= len(self.events) > 0 and self.events[-1]['type'] in FINAL_EVENTS
+
+    def subscribe(self, listener):
+        """Call listener() from the pool's thread whenever an event is added."""
+        with self._changed:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._changed:
+            self._listeners.remove(listener)
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'user_input': self.message,
+            'queued_seconds': round((self.started_at or end) - self.submitted_at, 1),
+            'elapsed_seconds': round(end - self.submitted_at, 1),
+            'events': len(self.events),
+        }
+        steps = [event for event in self.events if event['type'] not in ('status', *FINAL_EVENTS)]
+        if steps:
+            data['last_step'] = steps[-1]
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.status == FAILED_STATUS:
+            data['error'] = self.error
+        return data
+
+
+class AgentPool:
+    """
+    Long-lived pool of agent worker processes.
+
+    Each worker starts its Bright Data MCP session, loads the tools and
+    builds the model once, then serves chat jobs one at a time. Jobs wait in
+    a FIFO queue until a worker is idle. Workers that die are replaced, and
+    a job that runs past its deadline has its worker killed and replaced.
+
+    To contain leaks in LangChain and the Node MCP server, a worker is
+    recycled after MAX_JOBS_PER_WORKER jobs or once its process tree uses
+    more than MAX_WORKER_RSS_MB. Its replacement starts warming up at once,
+    while the old worker finishes its current job and stops cleanly.
+    """
+
+    def __init__(self, size=POOL_SIZE, target=worker_main, max_queue=MAX_QUEUE):
+        self.size = size
+        self.max_queue = max_queue
+        self._target = target
+        self._mp = multiprocessing.get_context('spawn')
+        self._workers = {}
+        self._connections = {}
+        self._wakeup_reader, self._wakeup_writer = self._mp.Pipe(duplex=False)
+        self._pending = deque()
+        self._jobs = {}
+        self._finished = OrderedDict()
+        # Queued and running jobs by message key, and recent answers by message key
+        self._inflight = {}
+        self._results = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._running = False
+        self._restart_after = 0.0
+        self._listener = None
+        self._memory_checked = 0.0
+        self.stats = {
+            'jobs_completed': 0,
+            'jobs_failed': 0,
+            'jobs_timed_out': 0,
+            'jobs_rejected': 0,
+            'result_cache_hits': 0,
+            'requests_coalesced': 0,
+            'workers_started': 0,
+            'worker_exits': 0,
+            'workers_recycled_jobs': 0,
+            'workers_recycled_memory': 0,
+            'startup_seconds_total': 0.0,
+            'workers_ready': 0,
+        }
+        # Page cache and extraction counters, summed over the workers' reports
+        self.worker_stats = defaultdict(lambda: defaultdict(int))
+
+    def start(self):
+        """Start the workers and the threads that dispatch jobs and watch the workers."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for _ in range(self.size):
+                self._spawn()
+        self._listener = threading.Thread(target=self._listen, name="agent-pool-listener", daemon=True)
+        self._listener.start()
+        threading.Thread(target=self._monitor, name="agent-pool-monitor", daemon=True).start()
+        print(f"Agent pool started with {self.size} workers")
+
+    def _spawn(self):
+        worker_id = next(self._ids)
+        conn, child_conn = self._mp.Pipe()
+        process = self._mp.Process(target=self._target, args=(worker_id, child_conn),
+                                   name=f"agent-worker-{worker_id}", daemon=True)
+        process.start()
+        # Only the worker keeps its end open, so the pool sees EOF when it exits
+        child_conn.close()
+        worker = _Worker(worker_id, process, conn)
+        self._workers[worker_id] = worker
+        self._connections[conn] = worker
+        self.stats['workers_started'] += 1
+        self._wakeup_writer.send(None)
+
+    def submit(self, message, timeout=None):
+        """
+        Queue a chat message like submit_job and return a future of its result.
+
+        Each caller gets its own future and deadline, so one caller
+        cancelling or timing out doesn't affect others sharing the job. Once
+        every caller has given up, a job that hasn't started yet is dropped.
+        """
+        future = Future()
+        job = self._submit(message, timeout, waiter=future)
+
+        def relay(done):
+            try:
+                if done.cancelled():
+                    future.cancel()
+                elif done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result())
+            except InvalidStateError:
+                # The caller cancelled first
+                pass
+
+        def abandon(done):
+            if job.future.done():
+                # The caller got the job's outcome
+                return
+            with self._lock:
+                job.waiters -= 1
+                if job.waiters == 0 and not job.kept and job.status == QUEUED:
+                    job.future.cancel()
+
+        future.add_done_callback(abandon)
+        job.future.add_done_callback(relay)
+        return future
+
+    def submit_job(self, message, timeout=None):
+        """
+        Queue a chat message for the next idle worker.
+
+        A message answered within RESULT_CACHE_TTL gets a job that is already
+        done with the earlier result, marked 'cached'. A message that is
+        already queued or running gets that job, so concurrent identical
+        requests share one agent run. The shared job's deadline is extended
+        to the latest deadline of the requests sharing it. Messages are
+        compared ignoring case and whitespace.
+
+        Args:
+            message (str): The user message
+            timeout (float, optional): Seconds until the job's deadline, capped at
+                                       and defaulting to JOB_TIMEOUT
+
+        Returns:
+            Job: The queued job. Its future resolves to the worker's result
+                 dict, or raises RuntimeError if the agent failed and
+                 TimeoutError if no result came back within the timeout
+
+        Raises:
+            PoolOverloadedError: If MAX_QUEUE jobs are already waiting
+        """
+        return self._submit(message, timeout)
+
+    def _submit(self, message, timeout, waiter=None):
+        # waiter is the future of a /chat caller, None for a /jobs caller
+        timeout = JOB_TIMEOUT if timeout is None else min(timeout, JOB_TIMEOUT)
+        job = Job(message, timeout)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("Agent pool is not running")
+
+            cached = self._cached_result(job.key)
+            if cached is not None:
+                self.stats['result_cache_hits'] += 1
+                job.kept = True
+                self._jobs[job.id] = job
+                self._finish(job.id, result={**cached, 'cached': True}, counted=False)
+                return job
+
+            shared = self._inflight.get(job.key)
+            if shared is not None and not shared.future.cancelled():
+                self.stats['requests_coalesced'] += 1
+                shared.deadline = max(shared.deadline, job.deadline)
+                self._add_waiter(shared, waiter, job.deadline, timeout)
+                return shared
+
+            if len(self._pending) >= self.max_queue:
+                self.stats['jobs_rejected'] += 1
+                raise PoolOverloadedError(
+                    f"{len(self._pending)} chat requests are already waiting for an agent")
+            self._add_waiter(job, waiter, job.deadline, timeout)
+            self._jobs[job.id] = job
+            self._inflight[job.key] = job
+            self._pending.append(job)
+            job.add_event({'type': 'status', 'status': QUEUED})
+            self._dispatch()
+        return job
+
+    @staticmethod
+    def _add_waiter(job, waiter, deadline, timeout):
+        # Called with the lock held
+        if waiter is None:
+            job.kept = True
+        else:
+            job.waiters += 1
+            job.callers.append((deadline, timeout, waiter))
+
+    def _expired_callers(self):
+        # Called with the lock held. The futures are failed by the caller
+        # once the lock is released, since that runs their callbacks
+        now = time.time()
+        expired = []
+        for job in self._jobs.values():
+            for caller in [caller for caller in job.callers if caller[0] < now or caller[2].done()]:
+                job.callers.remove(caller)
+                if not caller[2].done():
+                    expired.append((caller[2], TimeoutError(
+                        f"Agent did not answer within {caller[1]:g} seconds")))
+        return expired
+
+    def _cached_result(self, key):
+        # Called with the lock held
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.time():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def _cache_result(self, job, result):
+        # Called with the lock held
+        if not RESULT_CACHE_TTL or not RESULT_CACHE_SIZE or result.get('cached') or not result.get('response'):
+            return
+        self._results[job.key] = (result, time.time() + RESULT_CACHE_TTL)
+        self._results.move_to_end(job.key)
+        while len(self._results) > RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+
+    def _drop(self, job):
+        # Called with the lock held. Forget a job that finished or was abandoned
+        self._jobs.pop(job.id, None)
+        if self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+
+    def get(self, job_id):
+        """A queued, running or recently finished job, or None."""
+        with self._lock:
+            return self._jobs.get(job_id) or self._finished.get(job_id)
+
+    def _next_job(self):
+        # Called with the lock held. The first queued job still worth running,
+        # or None
+        now = time.time()
+        while self._pending:
+            job = self._pending.popleft()
+            if job.future.cancelled() or job.deadline < now:
+                self._discard(job)
+            else:
+                return job
+        return None
+
+    def _discard(self, job):
+        # Called with the lock held, for a job taken off the queue unstarted
+        if job.future.cancelled():
+            # The callers gave up while the job was queued
+            self._drop(job)
+        else:
+            self._finish(job.id, error=TimeoutError("No agent worker became available in time"))
+
+    def _dispatch(self):
+        # Called with the lock held
+        for worker in self._workers.values():
+            if not self._pending:
+                return
+            if worker.state != IDLE or worker.draining:
+                continue
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                worker.conn.send((job.id, job.message))
+            except OSError:
+                # The worker is gone, the monitor replaces it
+                self._pending.appendleft(job)
+                worker.draining = True
+                continue
+            worker.state = BUSY
+            worker.job_id = job.id
+            worker.job_started = job.started_at = time.time()
+            job.status = RUNNING
+            job.add_event({'type': 'status', 'status': RUNNING})
+
+    def _finish(self, job_id, result=None, error=None, counted=True):
+        # Called with the lock held. Results served from the cache aren't
+        # counted as completed jobs
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        self._drop(job)
+        job.finished_at = time.time()
+        if error is None:
+            if counted:
+                self.stats['jobs_completed'] += 1
+            self._cache_result(job, result)
+            job.status, job.result = DONE, result
+            job.add_event({'type': 'done', 'result': result})
+            if not job.future.done():
+                job.future.set_result(result)
+        else:
+            self.stats['jobs_timed_out' if isinstance(error, TimeoutError) else 'jobs_failed'] += 1
+            job.status, job.error = FAILED_STATUS, str(error)
+            job.add_event({'type': 'failed', 'error': str(error)})
+            if not job.future.done():
+                job.future.set_exception(error)
+
+        self._finished[job.id] = job
+        cutoff = time.time() - JOB_RESULT_TTL
+        while self._finished and (len(self._finished) > MAX_FINISHED_JOBS
+                                  or next(iter(self._finished.values())).finished_at < cutoff):
+            self._finished.popitem(last=False)
+
+    def _listen(self):
+        while self._running:
+            with self._lock:
+                connections = dict(self._connections)
+            for conn in wait([self._wakeup_reader, *connections]):
+                if conn is self._wakeup_reader:
+                    conn.recv()
+                    continue
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # The worker exited, the monitor replaces it
+                    with self._lock:
+                        del self._connections[conn]
+                    conn.close()
+                    continue
+                with self._lock:
+                    self._handle(connections[conn], message)
+
+    def _handle(self, worker, message):
+        # Called with the lock held
+        if self._workers.get(worker.id) is not worker:
+            # A worker that was already replaced
+            return
+        kind = message[0]
+        if kind == READY:
+            worker.state = IDLE
+            self.stats['workers_ready'] += 1
+            self.stats['startup_seconds_total'] += message[1]['startup_time']
+        elif kind == STATS:
+            for section, counters in message[1].items():
+                for name, value in counters.items():
+                    self.worker_stats[section][name] += value
+        elif kind == EVENT:
+            job = self._jobs.get(message[1])
+            if job is not None:
+                job.add_event(message[2])
+        elif kind in (RESULT, FAILED):
+            job_id = message[1]
+            if kind == RESULT:
+                self._finish(job_id, result=message[2])
+            else:
+                self._finish(job_id, error=RuntimeError(message[2]))
+            worker.state = IDLE
+            worker.job_id = None
+            worker.job_started = None
+            worker.jobs_done += 1
+            if MAX_JOBS_PER_WORKER and worker.jobs_done >= MAX_JOBS_PER_WORKER:
+                self._recycle(worker, 'jobs')
+            elif worker.draining:
+                self._stop(worker)
+        self._dispatch()
+
+    def _recycle(self, worker, reason):
+        # Called with the lock held
+        if worker.draining:
+            return
+        memory = f", {worker.rss / 2**20:.0f} MB" if worker.rss is not None else ""
+        print(f"Recycling worker {worker.id} after {worker.jobs_done} jobs{memory} ({reason})")
+        worker.draining = True
+        self.stats[f'workers_recycled_{reason}'] += 1
+        if worker.state != BUSY:
+            self._stop(worker)
+
+    def _stop(self, worker):
+        # Called with the lock held. The worker closes its MCP session, which
+        # stops npx, then exits
+        if worker.stop_sent_at is None:
+            worker.stop_sent_at = time.time()
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+
+    def _measure(self):
+        with self._lock:
+            workers = list(self._workers.values())
+        # Reading /proc is slow enough to keep it outside the lock
+        sizes = {worker.id: _tree_rss(worker.process.pid) for worker in workers}
+        with self._lock:
+            for worker in workers:
+                worker.rss = sizes[worker.id]
+                if (MAX_WORKER_RSS_MB and worker.rss is not None
+                        and worker.rss > MAX_WORKER_RSS_MB * 2**20 and worker.state != STARTING):
+                    self._recycle(worker, 'memory')
+
+    def _monitor(self):
+        while self._running:
+            time.sleep(MONITOR_INTERVAL)
+            if time.time() - self._memory_checked >= MEMORY_CHECK_INTERVAL:
+                self._memory_checked = time.time()
+                self._measure()
+            with self._lock:
+                if not self._running:
+                    return
+                self._check_workers()
+                self._expire_pending()
+                self._dispatch()
+                expired = self._expired_callers()
+            for future, error in expired:
+                try:
+                    future.set_exception(error)
+                except InvalidStateError:
+                    pass
+
+    def _check_workers(self):
+        # Called with the lock held
+        now = time.time()
+        for worker in list(self._workers.values()):
+            job = self._jobs.get(worker.job_id) if worker.job_id else None
+            if job is not None and now > job.deadline and worker.process.is_alive():
+                print(f"Job {job.id} timed out on worker {worker.id}, replacing the worker")
+                _kill_tree(worker.process)
+                self._finish(job.id, error=TimeoutError(
+                    f"Agent did not answer within {job.deadline - job.submitted_at:g} seconds"))
+
+            if (worker.stop_sent_at is not None and now - worker.stop_sent_at > DRAIN_TIMEOUT
+                    and worker.process.is_alive()):
+                print(f"Worker {worker.id} did not stop in time, killing it")
+                _kill_tree(worker.process)
+
+            if worker.process.is_alive():
+                continue
+
+            del self._workers[worker.id]
+            self.stats['worker_exits'] += 1
+            if not worker.draining:
+                print(f"Worker {worker.id} exited with code {worker.process.exitcode}")
+            if worker.job_id:
+                self._finish(worker.job_id, error=RuntimeError("Agent worker exited during the job"))
+            if worker.state == STARTING:
+                # Don't restart in a tight loop when the workers can't start at all
+                self._restart_after = now + RESTART_DELAY
+
+        if now >= self._restart_after:
+            # Draining workers are replaced right away, so the pool stays warm
+            active = sum(1 for worker in self._workers.values() if not worker.draining)
+            for _ in range(self.size - active):
+                self._spawn()
+
+    def _expire_pending(self):
+        # Called with the lock held. Jobs have their own deadlines, so an
+        # expired one can be queued behind one that is still waiting
+        now = time.time()
+        for job in [job for job in self._pending if job.future.cancelled() or job.deadline < now]:
+            self._pending.remove(job)
+            self._discard(job)
+
+    def shutdown(self, timeout=10):
+        """Ask the workers to stop after their current job and terminate those that don't."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            workers = list(self._workers.values())
+            for worker in workers:
+                self._stop(worker)
+            for job in list(self._jobs.values()):
+                self._finish(job.id, error=RuntimeError("Agent pool is shutting down"))
+            self._pending.clear()
+
+        deadline = time.time() + timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.time(), 0))
+            if worker.process.is_alive():
+                _kill_tree(worker.process)
+        self._wakeup_writer.send(None)
+        self._listener.join(timeout)
+
+    def metrics(self):
+        """Worker states, per-worker memory and job counts, queue length, job counters, page cache and extraction savings."""
+        now = time.time()
+        with self._lock:
+            active = [worker for worker in self._workers.values() if not worker.draining]
+            states = [worker.state for worker in active]
+            workers = [{
+                'id': worker.id,
+                'pid': worker.process.pid,
+                'state': 'draining' if worker.draining else worker.state,
+                'jobs_done': worker.jobs_done,
+                'rss_mb': round(worker.rss / 2**20, 1) if worker.rss is not None else None,
+                'uptime_seconds': round(now - worker.started_at, 1),
+            } for worker in self._workers.values()]
+            stats = dict(self.stats)
+            page_cache = dict(self.worker_stats['page_cache'])
+            extraction = dict(self.worker_stats['extraction'])
+            queued = len(self._pending)
+        ready = stats.pop('workers_ready')
+        startup_total = stats.pop('startup_seconds_total')
+        return {
+            'size': self.size,
+            'warm_workers': states.count(IDLE) + states.count(BUSY),
+            'idle_workers': states.count(IDLE),
+            'busy_workers': states.count(BUSY),
+            'starting_workers': states.count(STARTING),
+            'draining_workers': len(workers) - len(active),
+            'queued_jobs': queued,
+            'max_queue': self.max_queue,
+            'avg_startup_seconds': round(startup_total / ready, 2) if ready else None,
+            **stats,
+            'page_cache': {
+                **page_cache,
+                'dollars_saved': round(page_cache.get('hits', 0) * SCRAPE_COST, 4),
+            },
+            'extraction': {
+                **extraction,
+                'tokens_saved': extraction.get('tokens_before', 0) - extraction.get('tokens_after', 0),
+            },
+            'workers': workers,
+        }
+
+
+agent_pool = AgentPool()
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import signal
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+from page_cache import page_cache
+from page_extract import page_extractor
+
+load_dotenv()
+
+# Bright Data MCP server, started once per worker process
+SERVER_CONFIG = {
+    'command': "npx",
+    'env': {
+        "API_TOKEN": os.getenv("API_TOKEN"),
+        "BROWSER_AUTH": os.getenv("BROWSER_AUTH"),
+        "WEB_UNLOCKER_ZONE": os.getenv("WEB_UNLOCKER_ZONE"),
+    },
+    'args': ["@brightdata/mcp"],
+}
+
+MODEL_CONFIG = {
+    'model': "gemini-2.0-flash",
+    'temperature': 0,
+    'max_tokens': None,
+    'timeout': None,
+    'max_retries': 2,
+}
+
+SYSTEM_PROMPT = "You can use multiple tools in sequence to answer complex questions. Think step by step."
+
+# Messages sent from a worker to the pool
+READY = "ready"
+EVENT = "event"
+RESULT = "result"
+FAILED = "failed"
+STATS = "stats"
+
+# Longest tool arguments and message text sent with a progress event
+EVENT_TEXT_CHARS = 2000
+
+
+def _text(content):
+    """Plain text of a message content, which may be a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(block if isinstance(block, str) else block.get('text', '')
+                       for block in content if isinstance(block, (str, dict)))
+    return str(content)
+
+
+def _urls(args):
+    """URLs passed to a tool, found in arguments named like 'url' or 'urls'."""
+    urls = []
+    for name, value in (args or {}).items():
+        if 'url' not in name.lower():
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, str):
+                urls.append(item)
+    return urls
+
+
+def worker_stats():
+    """Page cache and extraction counters since the last report."""
+    return {'page_cache': page_cache.take_stats(), 'extraction': page_extractor.take_stats()}
+
+
+def step_events(update):
+    """
+    Turn one langgraph "updates" chunk of the ReAct agent into progress events:
+    tool calls with the URLs they fetch, tool results and the model's text.
+    """
+    events = []
+    for node in update.values():
+        for message in (node or {}).get('messages', []):
+            if getattr(message, 'type', None) == 'tool':
+                events.append({'type': 'tool_result', 'tool': message.name,
+                               'chars': len(_text(message.content))})
+                continue
+            for call in getattr(message, 'tool_calls', None) or []:
+                events.append({'type': 'tool_call', 'tool': call['name'], 'urls': _urls(call['args']),
+                               'args': json.dumps(call['args'], default=str)[:EVENT_TEXT_CHARS]})
+            text = _text(message.content).strip()
+            if text:
+                events.append({'type': 'message', 'text': text[:EVENT_TEXT_CHARS]})
+    return events
+
+
+async def serve(worker_id, conn):
+    """
+    Start the Bright Data MCP session, load its tools and build the agent
+    once, then run chat jobs received on the pool connection one at a time
+    until a None job asks the worker to stop or the pool goes away.
+    """
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    from langchain_mcp_adapters.tools import load_mcp_tools
+    from langgraph.prebuilt import create_react_agent
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    start = time.time()
+    model = ChatGoogleGenerativeAI(**MODEL_CONFIG)
+    server_params = StdioServerParameters(
+        command=SERVER_CONFIG['command'],
+        env=SERVER_CONFIG['env'],
+        args=SERVER_CONFIG['args'],
+    )
+
+    loop = asyncio.get_running_loop()
+    current = {'job_id': None}
+
+    def report_page(tool, url, tokens_before, tokens_after):
+        conn.send((EVENT, current['job_id'], {'type': 'page_extracted', 'tool': tool, 'url': url,
+                                              'tokens_before': tokens_before, 'tokens_after': tokens_after}))
+    with open(os.devnull, 'w') as devnull:
+        async with stdio_client(server_params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                print(f"Worker {worker_id} ({os.getpid()}): Initializing Session")
+                await session.initialize()
+                print(f"Worker {worker_id} ({os.getpid()}): Initializing tools")
+                # Pages are cached as scraped and compacted on the way to the model
+                tools = page_cache.wrap_tools(await load_mcp_tools(session))
+                tools = page_extractor.wrap_tools(tools, on_page=report_page)
+                agent = create_react_agent(model, tools)
+                startup_time = time.time() - start
+                print(f"Worker {worker_id} ({os.getpid()}): Ready in {startup_time:.2f} seconds")
+                conn.send((READY, {'pid': os.getpid(), 'startup_time': startup_time}))
+
+                while True:
+                    try:
+                        job = await loop.run_in_executor(None, conn.recv)
+                    except EOFError:
+                        break
+                    if job is None:
+                        break
+                    job_id, user_input = job
+                    current['job_id'] = job_id
+                    start = time.time()
+                    try:
+                        messages = [
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": user_input},
+                        ]
+                        print(f"Worker {worker_id} ({os.getpid()}): Invoking Agent for job {job_id}")
+                        response = None
+                        # Stream the agent's steps so callers can follow the job
+                        async for update in agent.astream({"messages": messages}, stream_mode="updates"):
+                            for event in step_events(update):
+                                conn.send((EVENT, job_id, event))
+                            for node in update.values():
+                                for message in (node or {}).get('messages', []):
+                                    response = message.content
+                        execution_time = time.time() - start
+                        print(f"Worker {worker_id} ({os.getpid()}): Time taken: {execution_time:.4f} seconds")
+                        conn.send((STATS, worker_stats()))
+                        conn.send((RESULT, job_id, {
+                            'response': response,
+                            'execution_time': execution_time,
+                            'process_id': os.getpid(),
+                        }))
+                    except Exception as e:
+                        print(f"Worker {worker_id} ({os.getpid()}): Error in job {job_id}: {str(e)}")
+                        traceback.print_exc()
+                        conn.send((STATS, worker_stats()))
+                        conn.send((FAILED, job_id, str(e)))
+
+    print(f"Worker {worker_id} ({os.getpid()}): Stopped")
+
+
+def worker_main(worker_id, conn):
+    """Entry point of a pool worker process, must be at module level for multiprocessing"""
+    load_dotenv()
+    # Ctrl-C goes to the whole process group, let the pool stop workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(worker_id, conn))
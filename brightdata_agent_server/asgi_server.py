@@ -0,0 +1,212 @@
+import asyncio
+import os
+import traceback
+from contextlib import asynccontextmanager
+
+import uvicorn
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from agent_pool import (EVENT_KEEPALIVE_SECONDS, PoolOverloadedError, RETRY_AFTER,
+                        agent_pool, format_event, last_event_id, parse_chat_request)
+from flask_server import cron_request
+
+load_dotenv()
+
+
+def error_response(message, status_code, headers=None):
+    return JSONResponse({'error': message, 'status': 'error'}, status_code, headers=headers)
+
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def chat_endpoint(request):
+    """
+    Same contract as the Flask /chat endpoint, but the request waits for its
+    job without holding a thread, so one process can keep every worker of
+    the pool busy and queue requests up to the pool's limit.
+    """
+    try:
+        user_input, timeout = parse_chat_request(await _json_body(request))
+    except ValueError as invalid:
+        return error_response(str(invalid), 400)
+
+    print(f"Main process {os.getpid()}: Received user input: {user_input}")
+
+    try:
+        # Cancelled, e.g. on shutdown, the job is dropped if it is still queued
+        result = await asyncio.wrap_future(agent_pool.submit(user_input, timeout))
+    except PoolOverloadedError as overload:
+        return error_response(f'Server is overloaded: {str(overload)}', 503,
+                              {'Retry-After': str(RETRY_AFTER)})
+    except TimeoutError as timeout_error:
+        return error_response(f'Agent execution timed out: {str(timeout_error)}', 504)
+    except Exception as async_error:
+        print(f"Async error: {str(async_error)}")
+        traceback.print_exc()
+        return error_response(f'Agent execution failed: {str(async_error)}', 500)
+
+    return JSONResponse({
+        'status': 'success',
+        'data': {
+            'response': result['response'],
+            'execution_time': result['execution_time'],
+            'user_input': user_input,
+            'process_id': result.get('process_id', 'unknown'),
+            'cached': result.get('cached', False)
+        }
+    })
+
+
+async def create_job(request):
+    """Queue a chat message and return its job id right away"""
+    try:
+        user_input, timeout = parse_chat_request(await _json_body(request))
+    except ValueError as invalid:
+        return error_response(str(invalid), 400)
+
+    try:
+        job = agent_pool.submit_job(user_input, timeout)
+    except PoolOverloadedError as overload:
+        return error_response(f'Server is overloaded: {str(overload)}', 503,
+                              {'Retry-After': str(RETRY_AFTER)})
+
+    print(f"Main process {os.getpid()}: Queued job {job.id}: {user_input}")
+    return JSONResponse({
+        'status': 'success',
+        'data': {
+            **job.to_dict(),
+            'status_url': f'/jobs/{job.id}',
+            'events_url': f'/jobs/{job.id}/events'
+        }
+    }, 202, headers={'Location': f'/jobs/{job.id}'})
+
+
+async def get_job(request):
+    """Status of a job, with its result once it is done"""
+    job = agent_pool.get(request.path_params['job_id'])
+    if job is None:
+        return error_response('Unknown or expired job', 404)
+    return JSONResponse({'status': 'success', 'data': job.to_dict()})
+
+
+async def job_events(request):
+    """Stream a job's progress as Server-Sent Events until it finishes"""
+    job = agent_pool.get(request.path_params['job_id'])
+    if job is None:
+        return error_response('Unknown or expired job', 404)
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(changed.set)
+
+    async def stream(after):
+        job.subscribe(listener)
+        try:
+            while True:
+                changed.clear()
+                events = job.events[after:]
+                for event in events:
+                    yield format_event(event)
+                after += len(events)
+                # Also ends the stream of a client resuming after the final event
+                if job.all_sent(after):
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            job.unsubscribe(listener)
+
+    return StreamingResponse(stream(last_event_id(request.headers.get('last-event-id'))),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'chat-agent-api',
+        'process_id': os.getpid(),
+        'pool': agent_pool.metrics()
+    })
+
+
+async def metrics(request):
+    """Agent pool metrics"""
+    return JSONResponse(agent_pool.metrics())
+
+
+async def home(request):
+    """Home endpoint with usage information"""
+    return JSONResponse({
+        'message': 'Chat Agent API',
+        'process_id': os.getpid(),
+        'endpoints': {
+            'POST /chat': 'Send a message to the chat agent',
+            'POST /jobs': 'Queue a message for the chat agent, returns a job id',
+            'GET /jobs/<job_id>': 'Job status and result',
+            'GET /jobs/<job_id>/events': 'Job progress as Server-Sent Events',
+            'GET /health': 'Health check',
+            'GET /metrics': 'Agent pool metrics',
+            'GET /': 'This endpoint'
+        },
+        'usage': {
+            'method': 'POST',
+            'url': '/chat',
+            'body': {
+                'message': 'Your message here',
+                'timeout': 'Optional deadline in seconds'
+            }
+        }
+    })
+
+
+async def ping_servers(request):
+    await asyncio.gather(
+        asyncio.to_thread(cron_request, os.getenv("AGENT_SERVER")),
+        asyncio.to_thread(cron_request, os.getenv("MCP_SERVER")),
+    )
+    return PlainTextResponse("Active")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm the workers before the first request arrives
+    agent_pool.start()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(agent_pool.shutdown)
+
+
+app = Starlette(
+    routes=[
+        Route('/chat', chat_endpoint, methods=['POST']),
+        Route('/jobs', create_job, methods=['POST']),
+        Route('/jobs/{job_id}', get_job, methods=['GET']),
+        Route('/jobs/{job_id}/events', job_events, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/', home, methods=['GET']),
+        Route('/cron', ping_servers, methods=['GET']),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    print("Starting async Chat Agent API...")
+    print(f"Main process ID: {os.getpid()}")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory shared by all workers for scraped pages
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "data/page_cache")
+
+# Seconds a scraped page is served from the cache
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "86400"))
+
+# Compressed size the cache is trimmed to, least recently used pages first
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 2**20)))
+
+# Bright Data price of one scrape request, used to report the money saved
+# (Web Unlocker is billed per 1000 successful requests)
+SCRAPE_COST = float(os.getenv("BRIGHTDATA_COST_PER_REQUEST", "0.0015"))
+
+# The directory is trimmed after this many stored pages
+EVICT_EVERY = 20
+
+# Tools whose results are cached: stateless fetches of one page or dataset
+# record. Browser tools act on a live session and are never cached
+CACHED_TOOLS = ('scrape_as_markdown', 'scrape_as_html')
+CACHED_TOOL_PREFIXES = ('web_data_',)
+
+# Tracking parameters, which don't change the page content. Reddit's
+# 'context' and 'sort' do, so they stay part of the key
+TRACKING_PARAMS = {'fbclid', 'gclid', 'ref', 'ref_source', 'ref_campaign', 'share_id',
+                   'rdt', 'si', 'igshid'}
+
+# Hosts serving the same pages
+HOST_ALIASES = {
+    'reddit.com': 'www.reddit.com',
+    'old.reddit.com': 'www.reddit.com',
+    'new.reddit.com': 'www.reddit.com',
+    'np.reddit.com': 'www.reddit.com',
+    'm.reddit.com': 'www.reddit.com',
+}
+
+
+def normalize_url(url):
+    """
+    Canonical form of a URL for cache keys: lower-case scheme and host,
+    Reddit mirrors folded onto www.reddit.com, no default port, fragment,
+    tracking parameters or trailing slash, and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or 'https').lower()
+    host = (parts.hostname or '').lower()
+    host = HOST_ALIASES.get(host, host)
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not name.lower().startswith('utm_') and name.lower() not in TRACKING_PARAMS)
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def _tool_url(arguments):
+    url = arguments.get('url')
+    return url if isinstance(url, str) and url.strip() else None
+
+
+def cache_key(tool, arguments):
+    """The tool and all its arguments, with the URL normalized, as a stable string."""
+    arguments = dict(arguments)
+    arguments['url'] = normalize_url(arguments['url'])
+    return json.dumps([tool, arguments], sort_keys=True, default=str)
+
+
+class PageCache:
+    """
+    Disk cache of pages scraped through the Bright Data MCP tools.
+
+    Pages of the CACHED_TOOLS are keyed by tool and arguments, with the
+    URL normalized, stored zlib-compressed, one
+    file per page, served for PAGE_CACHE_TTL and trimmed to
+    PAGE_CACHE_MAX_BYTES by last use. The directory is shared by the pool's
+    workers, so a page scraped by one worker is reused by all of them.
+    """
+
+    def __init__(self, directory=PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stores_since_evict = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'bytes_saved': 0,
+            'stored_bytes_raw': 0,
+            'stored_bytes_compressed': 0,
+        }
+
+    def _path(self, tool, arguments):
+        key = hashlib.sha256(cache_key(tool, arguments).encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".z")
+
+    def get(self, tool, arguments):
+        """The cached result of a tool call, or None."""
+        path = self._path(tool, arguments)
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if time.time() - stat.st_mtime > self.ttl:
+                    raise FileNotFoundError(path)
+                entry = json.loads(zlib.decompress(f.read()))
+            # Mark as recently used for eviction, keeping the fetch time in mtime
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (OSError, ValueError, zlib.error):
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += entry['bytes']
+        return entry['content']
+
+    def put(self, tool, arguments, content):
+        raw = json.dumps({'key': cache_key(tool, arguments), 'fetched_at': time.time(),
+                          'bytes': len(content.encode('utf-8')), 'content': content}).encode('utf-8')
+        data = zlib.compress(raw, 6)
+        path = self._path(tool, arguments)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self.stats['stores'] += 1
+            self.stats['stored_bytes_raw'] += len(raw)
+            self.stats['stored_bytes_compressed'] += len(data)
+            self._stores_since_evict += 1
+            evict = self._stores_since_evict >= EVICT_EVERY
+            if evict:
+                self._stores_since_evict = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Delete expired pages, then least recently used ones until the cache fits max_bytes."""
+        entries = []
+        now = time.time()
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl or name.endswith('.tmp') and now - stat.st_mtime > 600:
+                    removed += self._remove(path)
+                else:
+                    entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(path)
+            total -= size
+
+        with self._lock:
+            self.stats['evictions'] += removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def take_stats(self):
+        """Counters since the last call, for the worker to report to the pool."""
+        with self._lock:
+            stats = dict(self.stats)
+            for name in self.stats:
+                self.stats[name] = 0
+        return stats
+
+    def wrap_tools(self, tools):
+        """
+        Serve the CACHED_TOOLS among the LangChain tools from load_mcp_tools
+        from the cache, and cache their successful results.
+        """
+        for tool in tools:
+            cached = tool.name in CACHED_TOOLS or tool.name.startswith(CACHED_TOOL_PREFIXES)
+            if tool.coroutine is None or not cached or 'url' not in (tool.args or {}):
+                continue
+            tool.coroutine = self._cached(tool.name, tool.coroutine)
+        return tools
+
+    def _cached(self, tool, call):
+        async def cached_call(**arguments):
+            url = _tool_url(arguments)
+            if url is None:
+                return await call(**arguments)
+
+            content = self.get(tool, arguments)
+            if content is not None:
+                # Same shape as the MCP adapter's result: text content and no artifacts
+                return content, None
+
+            result = await call(**arguments)
+            content, artifact = result if isinstance(result, tuple) else (result, None)
+            if isinstance(content, str) and content.strip() and not artifact:
+                try:
+                    self.put(tool, arguments, content)
+                except OSError as e:
+                    print(f"Couldn't cache {url}: {e}")
+            return result
+
+        return cached_call
+
+
+page_cache = PageCache()
@@ -0,0 +1,269 @@
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Most tokens of a scraped page passed on to the model. 0 keeps whole pages
+PAGE_TOKEN_BUDGET = int(os.getenv("PAGE_TOKEN_BUDGET", "4000"))
+
+# Tools whose markdown output is compacted
+EXTRACT_TOOLS = ('scrape_as_markdown',)
+
+# Rough characters per token of English text, close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Whole lines of site chrome: navigation, buttons and footers
+BOILERPLATE_LINES = {
+    'skip to main content', 'open menu', 'open navigation', 'go to reddit home', 'expand user menu',
+    'log in', 'sign up', 'get app', 'get the reddit app', 'scan this qr code to download the app now',
+    'or check it out in the app stores', 'create post', 'join', 'joined', 'reply', 'share', 'award',
+    'report', 'follow', 'upvote', 'downvote', 'more replies', 'continue this thread', 'view more comments',
+    'load more comments', 'search comments', 'expand comment search', 'comments section', 'go to comments',
+    'add a comment', 'open comment sort options', 'view discussions in other communities', 'promoted',
+    'advertisement', 'user agreement', 'privacy policy', 'content policy', 'moderator code of conduct',
+    'reddit rules', 'accessibility', 'back to top', 'archived post. new comments cannot be posted and votes cannot be cast',
+}
+
+# Lines that start the comments section, after which Reddit renders the sidebar
+COMMENTS_LINES = {'comments section', 'search comments', 'add a comment', 'sort by:'}
+
+# Comment sort options, dropped only in the "Sort by:" block they are listed in
+SORT_LABELS = {'best', 'top', 'new', 'old', 'controversial', 'q&a', 'hot', 'rising'}
+
+# Buttons of the vote and action bar under a post or comment. 'save' is only
+# dropped next to the other buttons, and a lone number only counts as a vote
+# score next to one of them
+ACTION_LINES = {'upvote', 'downvote', 'vote', 'reply', 'share', 'award', 'report', 'save'}
+
+# Headings of sidebar sections, skipped up to the next heading once the
+# comments section has started
+SIDEBAR_HEADINGS = {
+    'community info', 'about community', 'rules', 'moderators', 'related communities',
+    'community bookmarks', 'resources', 'popular posts', 'more posts you may like', 'trending today',
+    'recent posts', 'top posts',
+}
+
+LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+BARE_URL = re.compile(r'<?https?://\S+>?')
+HEADING = re.compile(r'^#{1,6}\s+(.*)$')
+FOOTER = re.compile(r'^reddit,? inc\.? ©', re.IGNORECASE)
+SCORE_LINE = re.compile(r'^(-?\d+(?:\.\d+)?)([kK]?)$')
+SCORE_TEXT = re.compile(r'(?<![\w.])(-?\d+(?:\.\d+)?)([kK]?)\s*(?:points?|upvotes?|votes?)\b|\bscore:?\s*(-?\d+)',
+                        re.IGNORECASE)
+
+
+def count_tokens(text):
+    """Estimated number of model tokens in text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _number(value, suffix):
+    return float(value) * (1000 if suffix else 1)
+
+
+def _normalize(text):
+    return " ".join(re.sub(r'[^\w\s]', ' ', text).split()).casefold()
+
+
+def _bare(line):
+    return line.strip('*_#>•·|-[]() ').casefold()
+
+
+def _clean_lines(markdown):
+    """
+    Lines of the page without images, link targets, boilerplate and sidebar
+    sections. The vote scores of comments are returned as numbers.
+    """
+    lines = []
+    for line in markdown.splitlines():
+        line = IMAGE.sub('', line)
+        line = LINK.sub(r'\1', line)
+        line = BARE_URL.sub('', line)
+        lines.append(" ".join(line.split()))
+    bares = [_bare(line) for line in lines]
+    filled = [i for i, line in enumerate(lines) if line]
+    # Neighbouring non-empty lines of every line, for the button and score context
+    previous = {i: bares[filled[n - 1]] if n else '' for n, i in enumerate(filled)}
+    following = {i: bares[filled[n + 1]] if n + 1 < len(filled) else '' for n, i in enumerate(filled)}
+
+    kept = []
+    in_comments = in_sidebar = in_sort = False
+    for i, line in enumerate(lines):
+        bare = bares[i]
+        heading = HEADING.match(line)
+        if heading:
+            in_sidebar = in_comments and _normalize(heading.group(1)) in SIDEBAR_HEADINGS
+            if in_sidebar:
+                continue
+        if in_sidebar:
+            continue
+        if not line:
+            kept.append(line)
+            continue
+
+        if bare in COMMENTS_LINES or bare.startswith('sort by'):
+            in_comments = True
+        if bare.startswith('sort by'):
+            in_sort = True
+            continue
+        if in_sort and (bare in SORT_LABELS or bare in BOILERPLATE_LINES):
+            continue
+        in_sort = False
+
+        if not bare or bare in BOILERPLATE_LINES or FOOTER.match(bare):
+            continue
+        near_buttons = previous[i] in ACTION_LINES or following[i] in ACTION_LINES
+        if bare == 'save' and near_buttons:
+            continue
+        score = SCORE_LINE.match(line.strip('*_ '))
+        if score and near_buttons:
+            # The vote count of the post is chrome, those of comments rank them
+            if in_comments:
+                kept.append(_number(*score.groups()))
+            continue
+        kept.append(line)
+    return kept
+
+
+def _blocks(lines):
+    """Paragraphs of the page with the vote score found in each, or None."""
+    blocks = []
+    current = []
+    score = None
+    for line in lines + ['']:
+        if isinstance(line, float):
+            # The vote bar follows the comment it belongs to
+            if not current and blocks and blocks[-1][1] is None:
+                blocks[-1] = (blocks[-1][0], line)
+            else:
+                score = line
+            continue
+        if not line:
+            if current:
+                blocks.append(("\n".join(current), score))
+            current, score = [], None
+            continue
+        found = SCORE_TEXT.search(line)
+        if found and score is None:
+            score = _number(found.group(1), found.group(2)) if found.group(1) else float(found.group(3))
+        current.append(line)
+    return blocks
+
+
+def _dedupe(blocks):
+    """Drop paragraphs and quoted lines that repeat earlier text of the page."""
+    seen = set()
+    unique = []
+    for text, score in blocks:
+        kept = []
+        for line in text.splitlines():
+            key = _normalize(line.lstrip('> '))
+            quoted = line.startswith('>')
+            if quoted and key in seen:
+                continue
+            if len(key) > 40:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        if kept:
+            unique.append(("\n".join(kept), score))
+    return unique
+
+
+def extract(markdown, budget=PAGE_TOKEN_BUDGET):
+    """
+    Compact a scraped page for the model.
+
+    Strips navigation, sidebars, images and link targets, drops repeated
+    paragraphs and quotes, then keeps the text before the first scored
+    block (the post) followed by the best scored comments, in page order,
+    until the token budget is spent.
+
+    Returns:
+        str: The compact text
+    """
+    blocks = _dedupe(_blocks(_clean_lines(markdown)))
+    if not budget:
+        return "\n\n".join(text for text, _ in blocks)
+
+    first_scored = next((i for i, (_, score) in enumerate(blocks) if score is not None), len(blocks))
+    # The post first, then comments by score, then unscored text in page order
+    order = list(range(first_scored)) + sorted(
+        range(first_scored, len(blocks)),
+        key=lambda i: (blocks[i][1] is None, -(blocks[i][1] or 0), i))
+
+    kept = set()
+    used = 0
+    for i in order:
+        tokens = count_tokens(blocks[i][0]) + 1
+        if used + tokens > budget:
+            if i >= first_scored:
+                # Lower scored comments must not take the place of better ones
+                break
+            if not kept:
+                # Keep at least the start of the post
+                kept.add(i)
+                blocks[i] = (blocks[i][0][:budget * CHARS_PER_TOKEN], blocks[i][1])
+                used = budget
+            continue
+        kept.add(i)
+        used += tokens
+    return "\n\n".join(blocks[i][0] for i in sorted(kept))
+
+
+class PageExtractor:
+    """
+    Compacts pages returned by the Bright Data scraping tools before the
+    model reads them, and counts the tokens it saves.
+    """
+
+    def __init__(self, budget=PAGE_TOKEN_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self.stats = {'pages': 0, 'tokens_before': 0, 'tokens_after': 0}
+
+    def take_stats(self):
+        """Counters since the last call, for the worker to report to the pool."""
+        with self._lock:
+            stats = dict(self.stats)
+            for name in self.stats:
+                self.stats[name] = 0
+        return stats
+
+    def wrap_tools(self, tools, on_page=None):
+        """
+        Compact the output of the EXTRACT_TOOLS among the LangChain tools from
+        load_mcp_tools. on_page, if given, is called with the tool name, URL
+        and token counts before and after for every page.
+        """
+        for tool in tools:
+            if tool.name in EXTRACT_TOOLS and tool.coroutine is not None:
+                tool.coroutine = self._extracting(tool.name, tool.coroutine, on_page)
+        return tools
+
+    def _extracting(self, tool, call, on_page):
+        async def extracting_call(**arguments):
+            result = await call(**arguments)
+            content, artifact = result if isinstance(result, tuple) else (result, None)
+            if not isinstance(content, str) or not content.strip():
+                return result
+
+            compact = extract(content, self.budget)
+            before, after = count_tokens(content), count_tokens(compact)
+            with self._lock:
+                self.stats['pages'] += 1
+                self.stats['tokens_before'] += before
+                self.stats['tokens_after'] += after
+            if on_page is not None:
+                on_page(tool, arguments.get('url'), before, after)
+            return (compact, artifact) if isinstance(result, tuple) else compact
+
+        return extracting_call
+
+
+page_extractor = PageExtractor()
@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from agent_pool import FAILED_STATUS, IDLE, QUEUED, RUNNING, AgentPool, _Worker
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+class QueueDeadlineTest(unittest.TestCase):
+    """Queued jobs with their own deadlines, on a pool without worker processes."""
+
+    def setUp(self):
+        self.pool = AgentPool(size=0)
+        self.pool._running = True
+
+    def idle_worker(self):
+        worker = _Worker(0, None, FakeConnection())
+        worker.state = IDLE
+        self.pool._workers[worker.id] = worker
+        return worker
+
+    def test_expired_job_behind_a_waiting_one_fails(self):
+        waiting = self.pool.submit_job("Best tacos in Austin?", 100)
+        expiring = self.pool.submit_job("Best bbq in Austin?", 1)
+        expiring.deadline = time.time() - 1
+        with self.pool._lock:
+            self.pool._expire_pending()
+        self.assertEqual(expiring.status, FAILED_STATUS)
+        self.assertIsInstance(expiring.future.exception(), TimeoutError)
+        self.assertEqual(waiting.status, QUEUED)
+        self.assertEqual(list(self.pool._pending), [waiting])
+
+    def test_expired_job_is_not_dispatched(self):
+        expired = self.pool.submit_job("Best tacos in Austin?", 1)
+        waiting = self.pool.submit_job("Best bbq in Austin?", 100)
+        expired.deadline = time.time() - 1
+        worker = self.idle_worker()
+        with self.pool._lock:
+            self.pool._dispatch()
+        self.assertEqual(worker.conn.sent, [(waiting.id, waiting.message)])
+        self.assertEqual(waiting.status, RUNNING)
+        self.assertEqual(expired.status, FAILED_STATUS)
+
+    def test_cancelled_job_doesnt_cost_a_worker_its_turn(self):
+        cancelled = self.pool.submit_job("Best tacos in Austin?", 100)
+        waiting = self.pool.submit_job("Best bbq in Austin?", 100)
+        cancelled.future.cancel()
+        worker = self.idle_worker()
+        with self.pool._lock:
+            self.pool._dispatch()
+        self.assertEqual(worker.conn.sent, [(waiting.id, waiting.message)])
+        self.assertIsNone(self.pool.get(cancelled.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from starlette.testclient import TestClient
+
+import asgi_server
+import flask_server
+from agent_pool import DONE, RUNNING, Job, agent_pool
+
+
+def finished_job():
+    job = Job("Best tacos in Austin?", 60)
+    job.add_event({'type': 'status', 'status': RUNNING})
+    job.add_event({'type': 'message', 'content': "Searching Reddit"})
+    job.status, job.result = DONE, "Veracruz"
+    job.add_event({'type': 'done', 'result': "Veracruz"})
+    return job
+
+
+class JobEventsTest(unittest.TestCase):
+    """/jobs/{id}/events of a finished job, on both servers."""
+
+    def setUp(self):
+        self.job = finished_job()
+        agent_pool._finished[self.job.id] = self.job
+        self.url = f'/jobs/{self.job.id}/events'
+        self.flask = flask_server.app.test_client()
+        self.asgi = TestClient(asgi_server.app)
+
+    def tearDown(self):
+        agent_pool._finished.pop(self.job.id, None)
+
+    def streams(self, headers=None):
+        yield self.flask.get(self.url, headers=headers).get_data(as_text=True)
+        yield self.asgi.get(self.url, headers=headers).text
+
+    def test_whole_stream_ends_with_the_final_event(self):
+        for body in self.streams():
+            self.assertEqual(body.count('id: '), 3)
+            self.assertTrue(body.rstrip().endswith('"result": "Veracruz"}'))
+
+    def test_resuming_after_the_final_event_ends_the_stream(self):
+        for body in self.streams({'Last-Event-ID': '2'}):
+            self.assertEqual(body, '')
+
+    def test_resuming_before_the_final_event_sends_the_rest(self):
+        for body in self.streams({'Last-Event-ID': '0'}):
+            self.assertEqual([line for line in body.splitlines() if line.startswith('id: ')],
+                             ['id: 1', 'id: 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import tempfile
+import unittest
+
+from page_cache import PageCache, cache_key
+
+
+class FakeTool:
+    """The parts of a LangChain MCP tool that PageCache wraps."""
+
+    def __init__(self, name, args=('url',)):
+        self.name = name
+        self.args = {arg: {} for arg in args}
+        self.calls = []
+        self.coroutine = self.run
+
+    async def run(self, **arguments):
+        self.calls.append(arguments)
+        return f"{self.name} {sorted(arguments.items())}", None
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = PageCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def call(self, tool, **arguments):
+        return asyncio.run(tool.coroutine(**arguments))
+
+    def test_scrapes_are_cached_by_normalized_url(self):
+        tool = FakeTool('scrape_as_markdown')
+        self.cache.wrap_tools([tool])
+        first = self.call(tool, url="https://old.reddit.com/r/Austin/?utm_source=x")
+        second = self.call(tool, url="https://www.reddit.com/r/Austin")
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(len(tool.calls), 1)
+
+    def test_browser_tools_are_not_cached(self):
+        tool = FakeTool('scraping_browser_navigate')
+        self.cache.wrap_tools([tool])
+        self.call(tool, url="https://www.reddit.com/r/Austin")
+        self.call(tool, url="https://www.reddit.com/r/Austin")
+        self.assertEqual(len(tool.calls), 2)
+
+    def test_other_arguments_are_part_of_the_key(self):
+        tool = FakeTool('web_data_reddit_posts', args=('url', 'num_of_posts'))
+        self.cache.wrap_tools([tool])
+        few = self.call(tool, url="https://www.reddit.com/r/Austin", num_of_posts=5)
+        many = self.call(tool, url="https://www.reddit.com/r/Austin", num_of_posts=50)
+        again = self.call(tool, num_of_posts=50, url="https://reddit.com/r/Austin/")
+        self.assertNotEqual(few[0], many[0])
+        self.assertEqual(many[0], again[0])
+        self.assertEqual(len(tool.calls), 2)
+
+    def test_cache_key_ignores_argument_order(self):
+        self.assertEqual(cache_key('t', {'url': "https://reddit.com/a", 'b': 1, 'a': 2}),
+                         cache_key('t', {'a': 2, 'b': 1, 'url': "https://www.reddit.com/a/"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import unittest
+
+from page_extract import _blocks, _clean_lines, _dedupe, count_tokens, extract
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class RedditThreadTest(unittest.TestCase):
+    """A Reddit thread as scrape_as_markdown returns it."""
+
+    def setUp(self):
+        self.page = fixture('reddit_thread.md')
+        self.lines = [line for line in _clean_lines(self.page) if isinstance(line, str) and line]
+        self.blocks = _dedupe(_blocks(_clean_lines(self.page)))
+
+    def test_post_headings_named_like_sidebar_sections_are_kept(self):
+        self.assertIn('## Rules', self.lines)
+        self.assertIn('## Resources', self.lines)
+        self.assertIn('## Top posts', self.lines)
+        self.assertTrue(any(line.startswith('The temple rules are stricter') for line in self.lines))
+        self.assertTrue(any(line.startswith("Japan Guide's Kansai pages") for line in self.lines))
+
+    def test_sidebar_after_comments_is_dropped(self):
+        text = "\n".join(self.lines)
+        for sidebar in ('Community Info', 'Welcome to r/JapanTravel', 'Read the FAQ', 'Moderator list hidden',
+                        'Is the Nara day trip worth it'):
+            self.assertNotIn(sidebar, text)
+        self.assertNotIn('## Rules', self.lines[self.lines.index('osaka_eats'):])
+
+    def test_sort_options_are_dropped_but_comments_with_the_same_words_kept(self):
+        for label in ('Best', 'Top', 'New', 'Old', 'Controversial', 'Q&A', 'Open comment sort options'):
+            self.assertNotIn(label, self.lines)
+        self.assertIn('new', self.lines)
+        self.assertIn('save', self.lines)
+
+    def test_save_button_is_dropped(self):
+        self.assertNotIn('Save', self.lines)
+
+    def test_only_vote_counts_score_comments(self):
+        scores = {text.splitlines()[0][:20]: score for text, score in self.blocks if score is not None}
+        self.assertEqual(scores, {
+            'Great write-up. For ': 412,
+            'new': 7,
+            'Honestly the best ti': 2300,
+            'The JR Pass price we': -3,
+            'April 6': 96,
+        })
+
+    def test_years_on_their_own_line_are_text(self):
+        self.assertEqual(self.lines.count('2023'), 2)
+        self.assertIn('2022', self.lines)
+        self.assertIn('2024', self.lines)
+
+    def test_post_vote_count_is_dropped(self):
+        self.assertNotIn('1.2k', self.lines)
+        self.assertNotIn(1200.0, _clean_lines(self.page))
+
+    def test_budget_keeps_post_and_best_comments(self):
+        whole = extract(self.page, 0)
+        self.assertIn('The temple rules are stricter', whole)
+        self.assertIn('2022\n\nMarch 30', whole)
+
+        compact = extract(self.page, count_tokens(whole) - 40)
+        self.assertLessEqual(count_tokens(compact), count_tokens(whole) - 40)
+        self.assertIn('The temple rules are stricter', compact)
+        self.assertIn('Honestly the best tip', compact)
+        self.assertIn('Kuromon market', compact)
+        self.assertNotIn('The JR Pass price went up', compact)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,33 @@
 from typing import Dict, Any, Optional
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+import anyio
+import uvicorn
 import argparse
 from utils.helpers import create_ics_file, currency_conversion
+from utils.storage import calendar_store
+from utils.fileserver import calendar_file_server
+from utils.metrics import (instrument, publish_worker_metrics, record_error, render_metrics,
+                           registry as metrics_registry)
+from utils.calendars import (add_events, handle_filename, list_events, remove_events,
+                             update_event)
+from utils.gateway import rapidapi_json, get_metrics as get_gateway_metrics
+from utils.breaker import mark_stale, get_metrics as get_breaker_metrics
+from utils.flights import collect_flight_offers, fetch_flight_offers, offer_price, price_calendar
+from utils.hotels import (build_search_params as build_hotel_params, collect_hotel_results,
+                          fetch_hotel_page, hotel_price, nights_between, search_top_k)
+from utils.routes import optimize_route
+from utils.costs import aggregate_trip_cost, flight_label, register_offer
+from utils.visa import visa_matrix
+from utils.brightdata import BRIGHTDATA_EXPECTED_SECONDS, BRIGHTDATA_TIMEOUT
+from utils.reddit import activities_report, get_metrics as get_reddit_metrics
+from utils.insights import ACTIVITIES, SENTIMENT, insight_store
+from utils.knowledge import knowledge_index
+from utils.jobs import DONE, FAILED, job_manager
+from utils.workers import MCP_WORKERS, serve_workers
+from utils.ranking import (DEFAULT_FLIGHT_WEIGHTS, DEFAULT_HOTEL_WEIGHTS, flight_table,
+                           hotel_table, rank_offers)
 from typing import List, Union, Dict, Optional, Any
 import requests
 import json
@@ -14,37 +40,155 @@ load_dotenv()
 
 
 parser = argparse.ArgumentParser(description='TravelGenie MCP Server')
-parser.add_argument('transport', nargs='?', default='stdio', choices=['stdio', 'sse'],
-                    help='Transport protocol (stdio or sse)')
+parser.add_argument('transport', nargs='?', default='stdio',
+                    choices=['stdio', 'sse', 'streamable-http'],
+                    help='Transport protocol (stdio, sse or streamable-http)')
+parser.add_argument('--workers', type=int, default=MCP_WORKERS,
+                    help='Worker processes for the streamable-http transport')
 args = parser.parse_args()
 
-mcp = FastMCP("TravelGenie MCP Server", port=3002)
+# Stateless: every streamable-HTTP request stands alone, so any worker can serve it
+mcp = FastMCP("TravelGenie MCP Server", port=3002, stateless_http=True)
+
+
+def _calendar_url(filename: str) -> str:
+    return f"{os.getenv('FILE_SERVER_URL')}/{filename}"
+
+
+def _event_summaries(events: List[Dict[str, Any]]) -> str:
+    return json.dumps([{'uid': event['uid'], 'title': event['title'], 'start': event['start']}
+                       for event in events])
 
 
 @mcp.tool()
+@instrument
 def create_calendar(events: list[dict[str, str | tuple]]) -> str:
     """
     Takes an array of dictionaries, each containing 'title' and 'time_range' keys,
     and creates an ICS file with these events.
 
+    To change the calendar afterwards, use add_calendar_events,
+    update_calendar_event and remove_calendar_events with the returned
+    handle instead of creating it again; the url stays the same.
+
     Args:
         events (list): List of dictionaries, each with 'title' and 'time_range' keys.
                       The 'time_range' should be a tuple of (start_time, end_time),
                       where times are datetime objects.
 
     Returns:
-        str: The url of the created ICS file (UUID + .ics)
+        str: The url of the created ICS file (content hash + .ics), its handle
+             and the UID of each event. Creating the same calendar again
+             returns the same url.
     """
-    file_server_url = os.getenv("FILE_SERVER_URL")
     try:
         ics_file_name = create_ics_file(events)
-        return f"Calendar created at {file_server_url}/{ics_file_name}"
+        handle = handle_filename(ics_file_name)[:-len(".ics")]
+        return (f"Calendar created at {_calendar_url(ics_file_name)}\n"
+                f"Handle: {handle}\n"
+                f"Events: {_event_summaries(list_events(handle))}")
 
     except Exception as e:
+        record_error(e)
         return f"Couldn't create the calendar\n {e}"
 
 
 @mcp.tool()
+@instrument
+def add_calendar_events(handle: str, events: list[dict[str, str | tuple]]) -> str:
+    """
+    Add events to an existing calendar in place, keeping its url.
+
+    Args:
+        handle (str): The calendar handle returned by create_calendar
+        events (list): List of dictionaries, each with 'title' and 'time_range' keys,
+                       as for create_calendar
+
+    Returns:
+        str: The calendar url and the UIDs of the added events
+    """
+    try:
+        added = add_events(handle, events)
+        return (f"Added {len(added)} event(s) to {_calendar_url(handle_filename(handle))}\n"
+                f"Events: {_event_summaries(added)}")
+    except Exception as e:
+        record_error(e)
+        return f"Couldn't update the calendar\n {e}"
+
+
+@mcp.tool()
+@instrument
+def update_calendar_event(
+    handle: str,
+    uid: str,
+    title: Optional[str] = None,
+    time_range: Optional[list[str]] = None
+) -> str:
+    """
+    Change the title and/or time of one event in an existing calendar,
+    e.g. to move the museum visit to Thursday. The event keeps its UID and
+    the calendar keeps its url.
+
+    Args:
+        handle (str): The calendar handle returned by create_calendar
+        uid (str): UID of the event to change
+        title (str, optional): New title
+        time_range (list, optional): New [start_time, end_time] in ISO format
+
+    Returns:
+        str: Confirmation with the calendar url
+    """
+    try:
+        event = update_event(handle, uid, title, time_range)
+        return (f"Updated '{event['title']}' ({event['start']} - {event['end']}) "
+                f"in {_calendar_url(handle_filename(handle))}")
+    except Exception as e:
+        record_error(e)
+        return f"Couldn't update the calendar\n {e}"
+
+
+@mcp.tool()
+@instrument
+def remove_calendar_events(handle: str, uids: List[str]) -> str:
+    """
+    Remove events from an existing calendar in place, keeping its url.
+
+    Args:
+        handle (str): The calendar handle returned by create_calendar
+        uids (List[str]): UIDs of the events to remove
+
+    Returns:
+        str: Confirmation with the number of events removed
+    """
+    try:
+        removed = remove_events(handle, uids)
+        return f"Removed {removed} event(s) from {_calendar_url(handle_filename(handle))}"
+    except Exception as e:
+        record_error(e)
+        return f"Couldn't update the calendar\n {e}"
+
+
+@mcp.tool()
+@instrument
+def list_calendar_events(handle: str) -> str:
+    """
+    List the events of an existing calendar with their UIDs.
+
+    Args:
+        handle (str): The calendar handle returned by create_calendar
+
+    Returns:
+        str: JSON list of events with 'uid', 'title', 'start' and 'end'
+    """
+    try:
+        return json.dumps(list_events(handle))
+    except Exception as e:
+        record_error(e)
+        return f"Couldn't read the calendar\n {e}"
+
+
+@mcp.tool()
+@instrument
 def convert_currency(base_currency: str, target_currency: str, amount: float) -> str:
     """
     Convert an amount from a base currency to a target currency using the Exchange Rate API.
@@ -67,11 +211,43 @@ def convert_currency(base_currency: str, target_currency: str, amount: float) ->
             base_currency, target_currency, amount)
         return f"Converted Amount: {conversion_result[0]}\nLast Update: {conversion_result[1]}"
     except Exception as e:
+        record_error(e)
         print(e)
         return "Couldn't convert the currency"
 
 
 @mcp.tool()
+@instrument
+def calculate_trip_cost(items: List[Dict[str, Any]], target_currency: str) -> str:
+    """
+    Total the cost of a trip in the user's currency in a single call.
+
+    Use this instead of add_numbers_in_list, add_two_numbers and
+    convert_currency when adding up flights, hotels and other costs. Every
+    item is converted in one batch, whatever currencies they are in.
+
+    Args:
+        items (List[dict]): Cost items. Each item is one of:
+                            {"offer_ref": "flight-..."} from a flight or hotel search,
+                            {"label": "Museum tickets", "amount": 40, "currency": "EUR"},
+                            or a flight/hotel result object as returned by the search tools.
+                            Any item may add "quantity" (e.g., number of tickets).
+        target_currency (str): Currency code to total in (e.g., "USD")
+
+    Returns:
+        str: JSON string with every item's native and converted amount, the
+             'total' in target_currency and the date of the rates used
+    """
+    try:
+        return json.dumps(aggregate_trip_cost(items, target_currency), indent=2)
+    except Exception as e:
+        record_error(e)
+        print(f"Trip cost aggregation failed: {str(e)}")
+        return f"Couldn't calculate the trip cost: {e}"
+
+
+@mcp.tool()
+@instrument
 def add_numbers_in_list(numbers: List[Union[int, float]]) -> Union[int, float]:
     """
     Adds all the numbers in a list and returns the sum.
@@ -88,6 +264,7 @@ def add_numbers_in_list(numbers: List[Union[int, float]]) -> Union[int, float]:
 
 
 @mcp.tool()
+@instrument
 def add_two_numbers(a: Union[int, float], b: Union[int, float]) -> str:
     """
     Adds two numbers and returns the result.
@@ -104,6 +281,7 @@ def add_two_numbers(a: Union[int, float], b: Union[int, float]) -> str:
 
 
 @mcp.tool()
+@instrument
 def get_flight_location_code(name: str) -> str:
     """
     Retrieves the location code for a flight destination using the Booking.com API.
@@ -125,24 +303,14 @@ def get_flight_location_code(name: str) -> str:
     """
     url = 'https://booking-com.p.rapidapi.com/v1/flights/locations'
 
-    api_key = os.getenv('RAPIDAPI_KEY')
-    if not api_key:
-        raise KeyError("RAPIDAPI_KEY not found in environment variables")
-    headers = {
-        'x-rapidapi-host': 'booking-com.p.rapidapi.com',
-        'x-rapidapi-key': api_key
-    }
-
     params = {
         'locale': 'en-gb',
         'name': name
     }
 
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()  # Raises an exception for bad status codes
-
-        data = response.json()
+        # Fetch through the gateway, falling back to cached data if the API is down
+        data = rapidapi_json('GET', url, params=params).data
 
         # Get the first location's code
         first_location = data[0]
@@ -150,17 +318,20 @@ def get_flight_location_code(name: str) -> str:
 
         return f"The location code is {code}"
     except Exception as e:
+        record_error(e)
         return f"There was an error while performing the request {e}"
 
 
 @mcp.tool()
+@instrument
 def search_flights(
     from_code: str,
     depart_date: str,
     to_code: str,
     children_ages: List[int] = None,
     adults: int = 1,
-    cabin_class: str = "ECONOMY"
+    cabin_class: str = "ECONOMY",
+    currency: Optional[str] = None
 ) -> str:
     """
     Search for flights using the Booking.com RapidAPI and return simplified flight data.
@@ -172,59 +343,23 @@ def search_flights(
         children_ages (List[int], optional): List of children's ages. Defaults to empty list.
         adults (int, optional): Number of adult passengers. Defaults to 1.
         cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+        currency (str, optional): Currency code for prices. Defaults to the server's BOOKING_CURRENCY.
 
     Returns:
-        str: JSON string containing simplified flight data with 'legs' and 'total' keys
+        str: JSON string containing simplified flight data with 'legs', 'total'
+             and 'offer_ref' keys. Pass the offer_ref to calculate_trip_cost
 
     Raises:
         requests.RequestException: If the API request fails
         KeyError: If required environment variable RAPIDAPI_KEY is not found
         ValueError: If the API response doesn't contain expected data structure
     """
-    # Get API key from environment variables
-    api_key = os.getenv('RAPIDAPI_KEY')
-    if not api_key:
-        raise KeyError("RAPIDAPI_KEY not found in environment variables")
-
-    # Set default for children_ages if None
-    if children_ages is None:
-        children_ages = []
-
-    # Prepare request parameters
-    url = "https://booking-com.p.rapidapi.com/v1/flights/search"
-
-    # Convert children ages list to comma-separated string
-    children_ages_str = ','.join(
-        map(str, children_ages)) if children_ages else ""
-
-    params = {
-        'from_code': from_code,
-        'depart_date': depart_date,
-        'to_code': to_code,
-        'adults': adults,
-        'cabin_class': cabin_class,
-        'page_number': 0,
-        'currency': 'AED',
-        'locale': 'en-gb',
-        'flight_type': 'ONEWAY',
-        'order_by': 'BEST'
-    }
-
-    # Only add children_ages if there are any
-    if children_ages_str:
-        params['children_ages'] = children_ages_str
-
-    headers = {
-        'x-rapidapi-host': 'booking-com.p.rapidapi.com',
-        'x-rapidapi-key': api_key
-    }
-
     try:
-        # Make the API request
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        data = response.json()
+        # Search through the flight cache and the shared RapidAPI gateway
+        result = fetch_flight_offers(
+            from_code, to_code, depart_date, adults, children_ages, cabin_class,
+            currency=currency)
+        data = result.data
 
         # Extract flight offers (limit to 5)
         flight_offers = data.get('flightOffers', [])[:5]
@@ -247,7 +382,10 @@ def search_flights(
                 # Create result object for this flight offer
                 flight_result = {
                     "legs": legs,
-                    "total": total
+                    "total": total,
+                    "offer_ref": register_offer(
+                        "flight", flight_label(legs), offer_price(offer),
+                        total.get('currencyCode'))
                 }
 
                 results.append(flight_result)
@@ -257,13 +395,107 @@ def search_flights(
                 continue
 
         # Return JSON string of all results
-        return json.dumps(results, indent=2)
+        return json.dumps(mark_stale(results, result), indent=2)
 
     except Exception as e:
+        record_error(e)
         print(f"Failed: {str(e)}")
+        return f"Flight search is unavailable right now, do not retry immediately: {e}"
 
 
 @mcp.tool()
+@instrument
+async def search_flight_price_calendar(
+    from_codes: List[str],
+    to_codes: List[str],
+    start_date: str,
+    days: int = 14,
+    children_ages: List[int] = None,
+    adults: int = 1,
+    cabin_class: str = "ECONOMY"
+) -> str:
+    """
+    Find the cheapest day to fly over a date window in a single call.
+
+    Searches every day in the window for every origin/destination pair and
+    reduces each day to its cheapest offer. Use this instead of calling
+    search_flights once per day, then call search_flights for the chosen day
+    to get the full flight details.
+
+    Args:
+        from_codes (List[str]): Departure airport/city codes (e.g., ["DXB.AIRPORT"])
+        to_codes (List[str]): Destination airport/city codes (e.g., ["LON.CITY", "PAR.CITY"])
+        start_date (str): First departure date in YYYY-MM-DD format
+        days (int, optional): Number of days to search, up to 31. Defaults to 14.
+        children_ages (List[int], optional): List of children's ages. Defaults to empty list.
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+
+    Returns:
+        str: JSON string with 'dates', a 'routes' matrix of "FROM->TO" to the
+             cheapest price per date (null when there is no offer), the overall
+             'cheapest' route/date/price and the 'currency'
+    """
+    try:
+        # Up to 31 days of rate-limited searches, kept off the event loop
+        calendar = await anyio.to_thread.run_sync(
+            price_calendar, from_codes, to_codes, start_date, days,
+            adults, children_ages, cabin_class)
+        return json.dumps(calendar)
+    except Exception as e:
+        record_error(e)
+        print(f"Price calendar failed: {str(e)}")
+        return f"Couldn't build the price calendar: {e}"
+
+
+@mcp.tool()
+@instrument
+async def optimize_multi_city_route(
+    home_code: str,
+    city_codes: List[str],
+    start_date: str,
+    nights_per_city: int,
+    return_home: bool = True,
+    children_ages: List[int] = None,
+    adults: int = 1,
+    cabin_class: str = "ECONOMY"
+) -> str:
+    """
+    Find the cheapest order to visit several cities in one call.
+
+    Prices every flight the trip could need (home to each city, city to city
+    on each possible leg date, and back home) and solves the visiting order
+    exactly for up to 6 cities, or heuristically for more. Use this instead
+    of calling search_flights for every pair of cities.
+
+    Args:
+        home_code (str): Airport/city code the trip starts from (e.g., "DXB.AIRPORT")
+        city_codes (List[str]): Airport/city codes to visit in any order (e.g., ["PAR.CITY", "ROM.CITY", "BCN.CITY"])
+        start_date (str): Date of the first flight in YYYY-MM-DD format
+        nights_per_city (int): Nights spent in each city
+        return_home (bool, optional): Whether the trip ends with a flight home. Defaults to True.
+        children_ages (List[int], optional): List of children's ages. Defaults to empty list.
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+
+    Returns:
+        str: JSON string with the visiting 'order', each leg's date and cheapest
+             price, the 'total', the 'solver' used and its runtime in 'solver_ms'
+    """
+    try:
+        # Filling the price matrix takes O(n²) searches, kept off the event loop
+        route = await anyio.to_thread.run_sync(
+            optimize_route, home_code, city_codes, start_date, nights_per_city,
+            return_home, adults, children_ages, cabin_class)
+        return json.dumps(route, indent=2)
+    except Exception as e:
+        record_error(e)
+        print(f"Route optimization failed: {str(e)}")
+        return f"Couldn't optimize the route: {e}"
+
+
+@mcp.tool()
+@instrument
 def search_hotels(
     dest_id: int,
     checkout_date: str,
@@ -271,7 +503,13 @@ def search_hotels(
     children_number: int = 1,
     adults_number: int = 1,
     children_ages: List[int] = None,
-    dest_type: str = "city"
+    dest_type: str = "city",
+    rank_by: Optional[str] = None,
+    top_k: int = 3,
+    max_pages: int = 5,
+    max_price_per_night: Optional[float] = None,
+    min_review_score: Optional[float] = None,
+    currency: Optional[str] = None
 ) -> str:
     """
     Search for hotels (with destination_id) using the Booking.com API and return filtered results.
@@ -280,6 +518,11 @@ def search_hotels(
     filters the response to get only the first 3 results, and returns specific fields
     for each hotel as a JSON string.
 
+    When rank_by is set, it instead pages through price-ordered results (up to
+    max_pages) and returns the top_k cheapest hotels that match the filters,
+    stopping early once later pages cannot beat the current ranking. Use this
+    when the user wants the cheapest suitable hotel.
+
     Args:
         dest_id (int): Destination ID for the search location
         checkout_date (str): Checkout date in format 'YYYY-MM-DD' (e.g., '2025-10-15')
@@ -289,11 +532,20 @@ def search_hotels(
         adults_number (int, optional): Number of adults. Defaults to 1
         children_ages (List[int], optional): List of children ages. Defaults to [0]
         dest_type (str, optional): Destination type. Defaults to 'city'
+        rank_by (str, optional): 'total_price' or 'price_per_night' to rank
+                                 across pages. Defaults to None (popularity, first page)
+        top_k (int, optional): Number of ranked hotels to return. Defaults to 3
+        max_pages (int, optional): Maximum result pages to scan when ranking. Defaults to 5
+        max_price_per_night (float, optional): Skip hotels above this nightly price when ranking
+        min_review_score (float, optional): Skip hotels rated below this score when ranking
+        currency (str, optional): Currency code for prices. Defaults to the server's BOOKING_CURRENCY
 
     Returns:
         str: JSON string containing filtered hotel data for up to 3 results.
              Each result includes: name, checkin, checkinDate, checkout,
-             checkoutDate, and priceDetails
+             checkoutDate, priceDetails and offer_ref. When ranking, a compact
+             ranked list with total_price, price_per_night, currency,
+             review_score and offer_ref. Pass offer_ref to calculate_trip_cost
 
     Raises:
         requests.RequestException: If the API request fails
@@ -301,51 +553,24 @@ def search_hotels(
         ValueError: If the response format is unexpected
     """
 
-    # Get API key from environment
-    api_key = os.getenv('RAPIDAPI_KEY')
-    if not api_key:
-        raise KeyError("RAPIDAPI_KEY not found in environment variables")
-
-    # Set default children_ages if not provided
-    if children_ages is None:
-        children_ages = [0]
-
-    # Convert children_ages list to comma-separated string
-    children_ages_str = ','.join(map(str, children_ages))
-
-    # Prepare request parameters
-    url = "https://booking-com.p.rapidapi.com/v2/hotels/search"
-
-    headers = {
-        'x-rapidapi-host': 'booking-com.p.rapidapi.com',
-        'x-rapidapi-key': api_key
-    }
-
-    params = {
-        'children_number': children_number,
-        'adults_number': adults_number,
-        'categories_filter_ids': 'class::2,class::4,free_cancellation::1',
-        'children_ages': children_ages_str,
-        'checkout_date': checkout_date,
-        'dest_type': dest_type,
-        'page_number': 0,
-        'units': 'metric',
-        'order_by': 'popularity',
-        'room_number': 1,
-        'checkin_date': checkin_date,
-        'filter_by_currency': 'AED',
-        'dest_id': dest_id,
-        'locale': 'en-gb',
-        'include_adjacency': 'true'
-    }
-
     try:
-        # Make the API request
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-
-        # Parse JSON response
-        data = response.json()
+        if rank_by:
+            ranked = search_top_k(dest_id, checkin_date, checkout_date,
+                                  children_number, adults_number, children_ages,
+                                  dest_type, rank_by, top_k, max_pages,
+                                  max_price_per_night, min_review_score,
+                                  currency=currency)
+            for hotel in ranked['hotels']:
+                hotel['offer_ref'] = register_offer(
+                    "hotel", hotel['name'], hotel['total_price'], hotel['currency'])
+            return json.dumps(ranked, indent=2)
+
+        # Search through the page cache and the shared RapidAPI gateway
+        params = build_hotel_params(dest_id, checkin_date, checkout_date,
+                                    children_number, adults_number, children_ages,
+                                    dest_type, currency=currency)
+        result = fetch_hotel_page(params)
+        data = result.data
 
         # Extract results and limit to first 3
         results = data.get('results', [])
@@ -362,16 +587,144 @@ def search_hotels(
                 'checkoutDate': hotel.get('checkoutDate'),
                 'priceDetails': hotel.get('priceDetails')
             }
+            price = hotel_price(hotel)
+            if price is not None:
+                filtered_hotel['offer_ref'] = register_offer(
+                    "hotel", hotel.get('name'), price['value'], price['currency'])
             filtered_results.append(filtered_hotel)
 
         # Return as JSON string
-        return json.dumps(filtered_results, indent=2)
+        return json.dumps(mark_stale(filtered_results, result), indent=2)
 
     except Exception as e:
+        record_error(e)
         print(f"API request failed: {str(e)}")
+        return f"Hotel search is unavailable right now, do not retry immediately: {e}"
 
 
 @mcp.tool()
+@instrument
+def rank_flight_offers(
+    from_code: str,
+    depart_date: str,
+    to_code: str,
+    children_ages: List[int] = None,
+    adults: int = 1,
+    cabin_class: str = "ECONOMY",
+    weights: Optional[Dict[str, float]] = None,
+    top_n: int = 5,
+    pareto_only: bool = False,
+    preferred_departure_hour: Optional[float] = None,
+    pages: int = 1
+) -> str:
+    """
+    Search flights and return the best N offers by a weighted score.
+
+    Every offer is scored on normalized price, duration, number of stops and,
+    if preferred_departure_hour is given, distance from that departure hour.
+    Use this instead of comparing search_flights results yourself.
+
+    Args:
+        from_code (str): Departure airport/city code (e.g., "ONT.AIRPORT")
+        depart_date (str): Departure date in YYYY-MM-DD format
+        to_code (str): Destination airport/city code (e.g., "NYC.CITY")
+        children_ages (List[int], optional): List of children's ages. Defaults to empty list.
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+        weights (dict, optional): Weight per criterion out of 'price', 'duration',
+                                  'stops' and 'departure'.
+                                  Defaults to {"price": 0.6, "duration": 0.25, "stops": 0.15}
+        top_n (int, optional): Number of offers to return. Defaults to 5.
+        pareto_only (bool, optional): Only return offers no other offer beats on
+                                      every criterion. Defaults to False.
+        preferred_departure_hour (float, optional): Preferred departure hour (0-23)
+        pages (int, optional): Result pages to rank across. Defaults to 1.
+
+    Returns:
+        str: JSON string with the ranked 'offers' (price, currency, departure,
+             arrival, duration_minutes, stops, carriers, score), 'total_offers'
+             and 'pareto_size'
+    """
+    try:
+        weights = weights or dict(DEFAULT_FLIGHT_WEIGHTS)
+        if preferred_departure_hour is not None and 'departure' not in weights:
+            weights['departure'] = 0.2
+
+        offers, stale = collect_flight_offers(from_code, to_code, depart_date, adults,
+                                              children_ages, cabin_class, pages)
+        ranking = rank_offers(flight_table(offers), weights, top_n,
+                              pareto_only, preferred_departure_hour)
+        for offer in ranking['offers']:
+            offer['offer_ref'] = register_offer(
+                "flight", f"Flight {from_code} -> {to_code} {offer['departure']}",
+                offer['price'], offer['currency'])
+        ranking['stale'] = stale
+        return json.dumps(ranking, indent=2)
+    except Exception as e:
+        record_error(e)
+        print(f"Flight ranking failed: {str(e)}")
+        return f"Couldn't rank the flight offers: {e}"
+
+
+@mcp.tool()
+@instrument
+def rank_hotel_offers(
+    dest_id: int,
+    checkin_date: str,
+    checkout_date: str,
+    children_number: int = 1,
+    adults_number: int = 1,
+    children_ages: List[int] = None,
+    dest_type: str = "city",
+    weights: Optional[Dict[str, float]] = None,
+    top_n: int = 5,
+    pareto_only: bool = False,
+    pages: int = 1
+) -> str:
+    """
+    Search hotels and return the best N by a weighted price/rating score.
+
+    Args:
+        dest_id (int): Destination ID for the search location
+        checkin_date (str): Check-in date in format 'YYYY-MM-DD'
+        checkout_date (str): Checkout date in format 'YYYY-MM-DD'
+        children_number (int, optional): Number of children. Defaults to 1
+        adults_number (int, optional): Number of adults. Defaults to 1
+        children_ages (List[int], optional): List of children ages. Defaults to [0]
+        dest_type (str, optional): Destination type. Defaults to 'city'
+        weights (dict, optional): Weight per criterion out of 'price' and 'rating'.
+                                  Defaults to {"price": 0.7, "rating": 0.3}
+        top_n (int, optional): Number of hotels to return. Defaults to 5
+        pareto_only (bool, optional): Only return hotels no other hotel beats on
+                                      both price and rating. Defaults to False
+        pages (int, optional): Result pages to rank across. Defaults to 1
+
+    Returns:
+        str: JSON string with the ranked 'offers' (name, total_price,
+             price_per_night, currency, review_score, score), 'total_offers'
+             and 'pareto_size'
+    """
+    try:
+        params = build_hotel_params(dest_id, checkin_date, checkout_date,
+                                    children_number, adults_number, children_ages,
+                                    dest_type)
+        hotels, stale = collect_hotel_results(params, pages)
+        table = hotel_table(hotels, nights_between(checkin_date, checkout_date))
+        ranking = rank_offers(table, weights or DEFAULT_HOTEL_WEIGHTS,
+                              top_n, pareto_only)
+        for offer in ranking['offers']:
+            offer['offer_ref'] = register_offer(
+                "hotel", offer['name'], offer['total_price'], offer['currency'])
+        ranking['stale'] = stale
+        return json.dumps(ranking, indent=2)
+    except Exception as e:
+        record_error(e)
+        print(f"Hotel ranking failed: {str(e)}")
+        return f"Couldn't rank the hotel offers: {e}"
+
+
+@mcp.tool()
+@instrument
 def get_city_destination_id(name: str) -> str:
     """
     Search for a city location using the Booking.com API and return its destination ID.
@@ -394,24 +747,13 @@ def get_city_destination_id(name: str) -> str:
     """
     url = "https://booking-com.p.rapidapi.com/v1/hotels/locations"
 
-    api_key = os.getenv('RAPIDAPI_KEY')
-    if not api_key:
-        raise KeyError("RAPIDAPI_KEY not found in environment variables")
-    headers = {
-        'x-rapidapi-host': 'booking-com.p.rapidapi.com',
-        'x-rapidapi-key': api_key
-    }
-
     params = {
         'locale': 'en-gb',
         'name': name
     }
 
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-
-        locations = response.json()
+        locations = rapidapi_json('GET', url, params=params).data
 
         # Filter for locations with dest_type 'city'
         cities = [location for location in locations if location.get(
@@ -427,150 +769,341 @@ def get_city_destination_id(name: str) -> str:
         return f"The destination id is {destination_id}"
 
     except Exception as e:
+        record_error(e)
         return f"There was an error {e}"
 
 
+def _brightdata_job(kind: str, description: str, fn):
+    return job_manager.submit(kind, description, lambda job: fn(job.report),
+                              BRIGHTDATA_EXPECTED_SECONDS)
+
+
+def _cached_insight(kind: str, location: str) -> Optional[str]:
+    insight = insight_store.get(kind, location)
+    if insight is None:
+        return None
+    if insight['stale']:
+        return f"{insight['report']}\n\n(Report from {insight['updated']}, a refresh has been scheduled.)"
+    return insight['report']
+
+
+async def _run_or_hand_off(job, async_mode: bool, ctx: Context) -> str:
+    """Return a job handle right away in async mode, otherwise wait for the result."""
+    if async_mode:
+        return json.dumps(job.to_dict())
+
+    await job_manager.wait(job, BRIGHTDATA_TIMEOUT, ctx)
+    if job.status == DONE:
+        return job.result
+    if job.status == FAILED:
+        return f"Failed to fetch location data: {job.error}"
+    return json.dumps(job.to_dict())
+
+
 @mcp.tool()
-def brightdata_scrape_reddit_location_sentiment(location: str) -> Dict[str, any]:
+@instrument
+async def brightdata_scrape_reddit_location_sentiment(
+    location: str,
+    async_mode: bool = False,
+    ctx: Context = None
+) -> str:
     """
     Scrapes Reddit for public sentiment about a given location.
 
+    The Reddit crawl is shared with brightdata_scrape_reddit_activities, so
+    asking for both for the same location scrapes Reddit only once. Reports
+    for popular destinations are kept warm in the background and returned
+    immediately.
+
+    Scraping takes minutes. With async_mode the tool returns a job handle
+    immediately; use get_job_status or await_job with its job_id to get the
+    summary. Progress is reported through MCP progress notifications while
+    the call waits.
+
     Args:
         location (str): The location to search for (eg. Dublin)
+        async_mode (bool, optional): Return a job handle instead of waiting. Defaults to False.
 
     Returns:
-        summary (str): Summary of sentiment
+        summary (str): Summary of sentiment, or the job handle as JSON in async mode
 
     Raises:
         ValueError: If location is empty or invalid
         ConnectionError: If Brightdata Agent API is unreachable
         RateLimitError: If API rate limits are exceeded
     """
+    if not location.strip():
+        return "Location is required"
 
-    url = os.getenv("BRIGHTDATA_AGENT_URL")
-    headers = {
-        "Content-Type": "application/json"
-    }
-    data = {
-        "message": f"""
-You are a web scraping agent tasked with gathering and analyzing public sentiment about {location} as a tourism destination, using Reddit as the primary data source.
-
-1. Search Reddit for the most recent and relevant posts, comments, and discussions mentioning {location} in the context of travel, tourism, vacations, or visitor experiences.
-
-2. Extract the main text content from each reddit page
-
-3. Analyze the text to identify sentiments about:
-- Accommodation and facilities
-- Local culture and people
-- Safety and accessibility
-- Food and dining experiences
-
-4. Summarize the overall sentiment into a report covering:
-- Most frequently praised aspects
-- Common complaints or warnings
-- General travel advice and tips shared by Reddit users
-- Overall sentiment score or conclusion regarding {location} as a tourism spot
-
-Return the summary as the final output.
-"""
-    }
-
-    response = requests.post(url, headers=headers, json=data)
+    cached = _cached_insight(SENTIMENT, location)
+    if cached is not None:
+        return cached
 
-    if response.ok:
-        response_data = response.json()
-        return response_data.data.response
-    else:
-        return "Failed to fetch location data"
+    job = _brightdata_job("sentiment", f"Reddit sentiment for {location}",
+                          lambda report: insight_store.build(SENTIMENT, location, report))
+    return await _run_or_hand_off(job, async_mode, ctx)
 
 
 @mcp.tool()
-def brightdata_scrape_reddit_activities(
+@instrument
+async def brightdata_scrape_reddit_activities(
     location: str,
     subreddit: Optional[str] = None,
     max_posts: int = 100,
-    time_filter: str = "month"
-) -> List[Dict[str, Any]]:
+    time_filter: str = "month",
+    async_mode: bool = False,
+    ctx: Context = None
+) -> str:
     """
     Scrapes Reddit for activities and things to do in a specified location.
 
+    The Reddit crawl is shared with brightdata_scrape_reddit_location_sentiment,
+    so asking for both for the same location scrapes Reddit only once. Reports
+    for popular destinations are kept warm in the background and returned
+    immediately.
+
+    Scraping takes minutes. With async_mode the tool returns a job handle
+    immediately; use get_job_status or await_job with its job_id to get the
+    summary. Progress is reported through MCP progress notifications while
+    the call waits.
+
     Args:
         location(str): The location to search for (eg. Dublin)
         subreddit: Optional specific subreddit to search in (defaults to location-based subreddits)
         max_posts: Maximum number of posts to retrieve (default: 100)
         time_filter: Time period to filter posts ("day", "week", "month", "year", "all")
+        async_mode (bool, optional): Return a job handle instead of waiting. Defaults to False.
 
     Returns:
-        summary (str): Summary of things to do in dubai
+        summary (str): Summary of things to do, or the job handle as JSON in async mode
 
     Raises:
         ValueError: If location is invalid or empty
         ConnectionError: If unable to connect to Reddit API
         RateLimitError: If Reddit API rate limit is exceeded
     """
-    data = {
-        "message": f"""
-Your task is to gather information about things to do for tourists in {location}.
+    if not location.strip():
+        return "Location is required"
+
+    if subreddit and subreddit.startswith("r/"):
+        subreddit = subreddit[2:]
+
+    # Only the default crawl is shared through the insight store
+    if not subreddit and max_posts == 100 and time_filter == "month":
+        cached = _cached_insight(ACTIVITIES, location)
+        if cached is not None:
+            return cached
+        job = _brightdata_job("activities", f"Reddit activities for {location}",
+                              lambda report: insight_store.build(ACTIVITIES, location, report))
+    else:
+        job = _brightdata_job("activities", f"Reddit activities for {location}",
+                              lambda report: activities_report(location, subreddit, max_posts,
+                                                               time_filter, report=report))
+    return await _run_or_hand_off(job, async_mode, ctx)
 
-    Start by searching Reddit for recent and relevant posts, comments, or threads that mention activities, attractions, or recommendations for tourists in {location}.
 
-    Extract the URLs of the most relevant Reddit posts (e.g., from subreddits like r/travel, r/solotravel, r/AskReddit, r/CityName, or any other local subreddits).
+@mcp.tool()
+@instrument
+def ask_destination_question(location: str, question: str, limit: int = 5) -> str:
+    """
+    Answer a follow-up question about a destination from previously scraped Reddit content.
 
-    For each URL, retrieve the full page content, including the main text of posts and top comments that describe tourist activities or attractions.
+    Searches the local index of posts and comments gathered by the Reddit
+    tools instead of starting a new multi-minute scrape. Use it for
+    questions like "is the metro safe at night?" once the location has been
+    scraped.
 
-    Additionally, if available and relevant, collect external links mentioned in those Reddit posts that lead to other tourism-related content.
+    Args:
+        location (str): The location the question is about (eg. Dublin)
+        question (str): The question to answer
+        limit (int, optional): Maximum number of passages to return. Defaults to 5.
 
-    Summarize the key findings into a concise list of recommended things to do in {location}, emphasizing popular activities and unique local experiences mentioned by Reddit users.
+    Returns:
+        str: JSON string with the most relevant passages, each with its source
+             URL and crawl date, to answer the question from
+    """
+    try:
+        passages = knowledge_index.search(location, question, max(1, min(limit, 20)))
+    except Exception as e:
+        record_error(e)
+        return f"Error searching scraped content: {e}"
 
-    Return the summary along with the source URLs used for the information.
-"""
-    }
+    if not passages:
+        return (f"No scraped content about {location} matches this question. "
+                f"Use brightdata_scrape_reddit_location_sentiment or "
+                f"brightdata_scrape_reddit_activities to gather it first.")
+
+    return json.dumps({'location': location, 'question': question, 'passages': passages})
+
+
+@mcp.tool()
+@instrument
+def get_job_status(job_id: str) -> str:
+    """
+    Check on a background job started in async mode.
+
+    Args:
+        job_id (str): The job_id returned by the tool that started the job
+
+    Returns:
+        str: JSON with the job status ('queued', 'running', 'done' or 'failed'),
+             progress between 0 and 1, and the result once it is done
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return f"Unknown or expired job {job_id}"
+    return json.dumps(job.to_dict())
+
+
+@mcp.tool()
+@instrument
+async def await_job(job_id: str, timeout_seconds: int = 60, ctx: Context = None) -> str:
+    """
+    Wait for a background job to finish, reporting its progress meanwhile.
+
+    Args:
+        job_id (str): The job_id returned by the tool that started the job
+        timeout_seconds (int, optional): Maximum seconds to wait. Defaults to 60.
+
+    Returns:
+        str: JSON with the job status and, once it is done, its result.
+             If the job is still running when the timeout expires, call again.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return f"Unknown or expired job {job_id}"
+
+    await job_manager.wait(job, max(0, min(timeout_seconds, BRIGHTDATA_TIMEOUT)), ctx)
+    return json.dumps(job.to_dict())
 
 
 @mcp.tool()
+@instrument
 def brightdata_get_visa_requirements(passport_country: str, destination_country: str) -> Optional[str]:
     """
     Scrape visa requirements from passportindex.org for travel between two countries.
 
+    Answers come from a locally cached passport x destination matrix that is
+    refreshed in the background, so most lookups never touch the network.
+
     Args:
         passport_country (str): The country code of the passport holder (e.g., 'US', 'NG')
-        destination_country (str): The country code of the destination (e.g., 'BH', 'UK')
+        destination_country (str): The country code of the destination (e.g., 'BH', 'GB')
 
     Returns:
-        Optional[str]: JSON string response from the API, or None if request fails
+        Optional[str]: JSON string with the requirement, allowed stay in days,
+                       when it was last updated and the full API details
 
 
     """
-    # API endpoint and headers
-    url = "https://visa-requirement.p.rapidapi.com/"
-    api_key = os.getenv('RAPIDAPI_KEY')
-    if not api_key:
-        raise KeyError("RAPIDAPI_KEY not found in environment variables")
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'x-rapidapi-host': 'visa-requirement.p.rapidapi.com',
-        'x-rapidapi-key': api_key
-    }
+    try:
+        # Look up the cached matrix, only unseen pairs hit the API
+        return json.dumps(visa_matrix.lookup(passport_country, destination_country))
+
+    except ValueError as e:
+        return str(e)
+    except Exception as e:
+        record_error(e)
+        print(f"Error making API request: {e}")
+        return "Error getting visa details"
+
 
-    # Request payload
-    data = {
-        'passport': passport_country.upper(),
-        'destination': destination_country.upper()
+@mcp.tool()
+@instrument
+def get_upstream_status() -> str:
+    """
+    Report request, throttling, quota and circuit breaker state for the upstream APIs.
+
+    Use this before planning many searches to check how much of the shared
+    RapidAPI quota is left.
+
+    Returns:
+        str: JSON string with per-host gateway metrics and circuit breaker states
+    """
+    status = {
+        'hosts': get_gateway_metrics(),
+        **get_breaker_metrics(),
+        'visa_matrix': visa_matrix.stats(),
+        'reddit': get_reddit_metrics(),
+        'insights': insight_store.stats(),
+        'knowledge_index': knowledge_index.stats(),
+        'calendar_storage': calendar_store.stats(),
+        'calendar_file_server': calendar_file_server.metrics()
     }
+    return json.dumps(status, indent=2)
+
+
+def _status_gauges() -> Dict[str, Dict[tuple, float]]:
+    storage = calendar_store.stats()
+    gauges = {
+        'travelgenie_calendar_storage_bytes': {(): storage['bytes']},
+        'travelgenie_calendar_files': {(): storage['files']},
+        'travelgenie_rapidapi_quota_remaining': {
+            (('host', host),): stats['quota_remaining']
+            for host, stats in get_gateway_metrics().items()
+            if stats['quota_remaining'] is not None},
+        'travelgenie_circuit_open': {
+            (('upstream', name),): 1 if circuit['state'] == 'open' else 0
+            for name, circuit in get_breaker_metrics()['circuits'].items()},
+    }
+    return gauges
 
-    try:
-        # Make POST request
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()  # Raises an HTTPError for bad responses
 
-        # Return JSON response as string
-        return response.text
+metrics_registry.add_gauges(_status_gauges)
+
+
+async def metrics_endpoint(request):
+    # Reads the other workers' metrics from the shared store
+    return PlainTextResponse(await anyio.to_thread.run_sync(render_metrics),
+                             media_type="text/plain; version=0.0.4")
+
+
+def start_background_services():
+    visa_matrix.start_background_refresh()
+    insight_store.start_background_refresh()
+    calendar_store.start_background_gc()
+    calendar_file_server.start_in_background()
+
+
+def run_sse():
+    """Run the SSE transport with a Prometheus /metrics endpoint next to it."""
+    start_background_services()
+    app = mcp.sse_app()
+    app.router.routes.append(Route("/metrics", metrics_endpoint))
+    uvicorn.run(app, host=mcp.settings.host, port=mcp.settings.port,
+                log_level=mcp.settings.log_level.lower())
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error making API request: {e}")
-        return "Error getting visa details"
+
+def streamable_http_app():
+    app = mcp.streamable_http_app()
+    app.router.routes.append(Route("/metrics", metrics_endpoint))
+    return app
+
+
+def run_streamable_http(workers: int):
+    """
+    Run the stateless streamable-HTTP transport from several worker processes.
+
+    Refreshes, calendar GC and the calendar file server only run in the
+    first worker. The other workers start from the visa matrix and insights
+    it persisted, and fill gaps on demand. /metrics reports every worker,
+    with a 'worker' label, whichever worker answers the scrape.
+    """
+    def on_start(index: int):
+        publish_worker_metrics(str(index))
+        if index == 0:
+            start_background_services()
+
+    serve_workers(streamable_http_app, mcp.settings.host, mcp.settings.port, workers,
+                  on_start, mcp.settings.log_level.lower())
 
 
 if __name__ == "__main__":
     print(f"Starting TravelGenie MCP server with transport: {args.transport}")
-    mcp.run(transport=args.transport)
+    if args.transport == 'sse':
+        run_sse()
+    elif args.transport == 'streamable-http':
+        run_streamable_http(args.workers)
+    else:
+        start_background_services()
+        mcp.run(transport=args.transport)
@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import requests
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Consecutive failures before a circuit opens
+FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+
+# Seconds an open circuit waits before letting a probe request through
+RECOVERY_TIMEOUT = float(os.getenv("UPSTREAM_RECOVERY_SECONDS", "30"))
+
+# Concurrent probe requests allowed while half-open
+HALF_OPEN_PROBES = int(os.getenv("UPSTREAM_HALF_OPEN_PROBES", "1"))
+
+# (connect, read) timeout applied to every upstream HTTP call, in seconds
+UPSTREAM_TIMEOUT = (
+    float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("UPSTREAM_READ_TIMEOUT", "20")),
+)
+
+# Maximum number of last-known-good responses kept per process
+LAST_GOOD_MAX_ENTRIES = int(os.getenv("UPSTREAM_LAST_GOOD_MAX_ENTRIES", "2000"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream circuit is open and no cached data is available."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(
+            f"{upstream} is currently unavailable, retry in {int(retry_after) + 1} seconds")
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    The circuit opens after `failure_threshold` consecutive failures and
+    rejects calls for `recovery_timeout` seconds. It then goes half-open and
+    lets up to `half_open_probes` calls through: one success closes the
+    circuit again, one failure reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        recovery_timeout: float = RECOVERY_TIMEOUT,
+        half_open_probes: int = HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check whether a call may go through.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all probes taken
+        """
+        with self._lock:
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.recovery_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        self.name, self.recovery_timeout - elapsed)
+                self.state = HALF_OPEN
+                self.probes = 0
+
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self.probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probes = 0
+
+    def release_probe(self):
+        """Give back a half-open probe slot for a call that neither failed nor succeeded."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected,
+            }
+
+
+class UpstreamResult(NamedTuple):
+    data: Any
+    stale: bool
+    fetched_at: float
+
+
+class _LastKnownGood:
+    """Bounded LRU of the last successful result for each upstream request."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def put(self, key, value, fetched_at: float):
+        with self._lock:
+            self._entries[key] = (value, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.served += 1
+            return entry
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_last_good = _LastKnownGood(LAST_GOOD_MAX_ENTRIES)
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """
+    Decide whether an error says something about the health of the upstream.
+
+    Client errors (4xx other than 429) mean the upstream answered fine and
+    the request itself was bad, so they do not count against the circuit.
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, requests.RequestException)
+
+
+def call_upstream(upstream: str, key: str, fn: Callable[[], Any]) -> UpstreamResult:
+    """
+    Run an upstream call behind its circuit breaker with a stale-cache fallback.
+
+    Successful results are remembered as last-known-good. While the circuit
+    is open, or when the call fails, the last-known-good result for the same
+    key is returned with `stale=True`; without one the error is raised.
+
+    Args:
+        upstream (str): Name of the upstream service, one breaker per name
+        key (str): Cache key identifying the request
+        fn (Callable): Function performing the call and returning its parsed result
+
+    Returns:
+        UpstreamResult: The data, whether it is stale, and when it was fetched
+
+    Raises:
+        CircuitOpenError: If the circuit is open and nothing is cached for the key
+        Exception: Whatever `fn` raised, if nothing is cached for the key
+    """
+    breaker = get_breaker(upstream)
+    cache_key = (upstream, key)
+
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        cached = _last_good.get(cache_key)
+        if cached is not None:
+            return UpstreamResult(cached[0], True, cached[1])
+        raise
+
+    try:
+        value = fn()
+    except Exception as e:
+        if is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release_probe()
+
+        cached = _last_good.get(cache_key)
+        if cached is not None:
+            print(f"{upstream} failed ({e}), serving last known good data")
+            return UpstreamResult(cached[0], True, cached[1])
+        raise
+
+    breaker.record_success()
+    fetched_at = time.time()
+    _last_good.put(cache_key, value, fetched_at)
+    return UpstreamResult(value, False, fetched_at)
+
+
+def mark_stale(payload: Any, result: UpstreamResult) -> Any:
+    """
+    Wrap a tool payload with an explicit staleness marker when it came from cache.
+
+    Args:
+        payload: The data the tool would normally return
+        result (UpstreamResult): The upstream result the payload was built from
+
+    Returns:
+        The payload unchanged if fresh, otherwise a dict with 'stale', 'as_of',
+        'note' and 'data' keys
+    """
+    if not result.stale:
+        return payload
+    as_of = datetime.fromtimestamp(result.fetched_at, timezone.utc)
+    return {
+        'stale': True,
+        'as_of': as_of.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'note': "The upstream API is unavailable, this is the last known good data",
+        'data': payload
+    }
+
+
+def get_metrics() -> Dict[str, Any]:
+    """
+    Snapshot of every circuit breaker and the stale-cache usage.
+
+    Returns:
+        dict: Breaker state per upstream and the number of stale results served
+    """
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        'circuits': {name: breaker.snapshot() for name, breaker in breakers.items()},
+        'stale_results_served': _last_good.served,
+    }
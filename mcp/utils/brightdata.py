@@ -0,0 +1,169 @@
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from utils.metrics import record_upstream
+load_dotenv()
+
+
+# A scrape usually takes a couple of minutes, the agent server gives up at 300s
+BRIGHTDATA_TIMEOUT = float(os.getenv("BRIGHTDATA_TIMEOUT", "330"))
+BRIGHTDATA_EXPECTED_SECONDS = float(os.getenv("BRIGHTDATA_EXPECTED_SECONDS", "120"))
+
+# Seconds between status polls of a running agent job
+BRIGHTDATA_POLL_INTERVAL = float(os.getenv("BRIGHTDATA_POLL_INTERVAL", "2"))
+
+# Timeout of the short requests that create and poll agent jobs
+BRIGHTDATA_REQUEST_TIMEOUT = 30
+
+
+def crawl_prompt(location: str, subreddit: Optional[str] = None,
+                 max_posts: int = 100, time_filter: str = "month") -> str:
+    focus = f"r/{subreddit}" if subreddit else "r/travel, r/solotravel, r/AskReddit and local subreddits"
+    return f"""
+You are a web scraping agent collecting Reddit discussions about {location} as a tourism destination.
+
+1. Search Reddit for recent and relevant threads from the past {time_filter} about visiting {location}: visitor experiences, safety, food, accommodation, local culture, and activities, attractions or things to do. Prefer {focus}.
+
+2. Fetch no more than {max_posts} of the most relevant threads. For each one, extract the main text of the post and its top comments, leaving out navigation, ads, sidebars and other page boilerplate.
+
+3. Do not summarize or analyze anything.
+
+Return only a JSON array, one object per thread, in the form
+[{{"url": "...", "title": "...", "text": "..."}}]
+"""
+
+
+def sentiment_prompt(location: str, corpus: str) -> str:
+    return f"""
+Do not use any tools. Analyze the Reddit discussions about {location} as a tourism destination below.
+
+1. Identify sentiments about:
+- Accommodation and facilities
+- Local culture and people
+- Safety and accessibility
+- Food and dining experiences
+
+2. Summarize the overall sentiment into a report covering:
+- Most frequently praised aspects
+- Common complaints or warnings
+- General travel advice and tips shared by Reddit users
+- Overall sentiment score or conclusion regarding {location} as a tourism spot
+
+Return the summary as the final output.
+
+Reddit discussions:
+{corpus}
+"""
+
+
+def activities_prompt(location: str, corpus: str) -> str:
+    return f"""
+Do not use any tools. Using only the Reddit discussions about {location} below, summarize the key findings into a concise list of recommended things to do for tourists in {location}, emphasizing popular activities and unique local experiences mentioned by Reddit users.
+
+Return the summary along with the source URLs used for the information.
+
+Reddit discussions:
+{corpus}
+"""
+
+
+def _agent_base_url() -> str:
+    # BRIGHTDATA_AGENT_URL may point at the server or at its /chat endpoint
+    url = (os.getenv("BRIGHTDATA_AGENT_URL") or '').rstrip('/')
+    return url[:-len('/chat')] if url.endswith('/chat') else url
+
+
+def _agent_request(host: str, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+    try:
+        response = requests.request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        record_upstream(host, type(e).__name__)
+        raise ConnectionError(f"Bright Data agent is unreachable: {e}")
+    record_upstream(host, response.status_code, len(response.content))
+    return response
+
+
+def _step_message(step: Dict[str, Any]) -> str:
+    if step['type'] == 'tool_call':
+        urls = step.get('urls') or []
+        target = f" on {urls[0]}" + (f" and {len(urls) - 1} more" if len(urls) > 1 else "") if urls else ""
+        return f"Agent running {step['tool']}{target}"
+    if step['type'] == 'tool_result':
+        return f"Agent got {step.get('chars', 0)} characters from {step['tool']}"
+    if step['type'] == 'page_extracted':
+        return f"Agent read {step.get('url') or 'a page'} ({step['tokens_before']} -> {step['tokens_after']} tokens)"
+    return "Agent is writing its answer"
+
+
+def ask_agent(message: str, on_progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Send a message to the Bright Data agent server and return its reply.
+
+    The message is queued as a job on the agent server, which is then
+    polled, so no connection stays open for the minutes a scrape takes.
+    Agent servers without the job API get a blocking /chat request.
+
+    Args:
+        message (str): Instructions for the scraping agent
+        on_progress (Callable, optional): Called with a short description of
+                                          each new step the agent takes
+
+    Returns:
+        str: The agent's final response
+
+    Raises:
+        ConnectionError: If the Bright Data agent is unreachable or fails
+    """
+    base_url = _agent_base_url()
+    host = urlparse(base_url).netloc or 'brightdata-agent'
+    headers = {
+        "Content-Type": "application/json"
+    }
+
+    response = _agent_request(host, 'POST', f"{base_url}/jobs", BRIGHTDATA_REQUEST_TIMEOUT,
+                              headers=headers, json={"message": message})
+    if response.status_code == 404:
+        response = _agent_request(host, 'POST', f"{base_url}/chat", BRIGHTDATA_TIMEOUT,
+                                  headers=headers, json={"message": message})
+        if not response.ok:
+            raise ConnectionError(
+                f"Bright Data agent failed with status {response.status_code}")
+        return response.json()['data']['response']
+
+    if not response.ok:
+        raise ConnectionError(
+            f"Bright Data agent failed with status {response.status_code}")
+
+    job_id = response.json()['data']['job_id']
+    deadline = time.monotonic() + BRIGHTDATA_TIMEOUT
+    last_step = None
+    while time.monotonic() < deadline:
+        time.sleep(BRIGHTDATA_POLL_INTERVAL)
+        try:
+            response = _agent_request(host, 'GET', f"{base_url}/jobs/{job_id}",
+                                      BRIGHTDATA_REQUEST_TIMEOUT)
+        except ConnectionError as e:
+            # The job keeps running on the agent server, try again on the next poll
+            print(f"Couldn't poll Bright Data job {job_id}: {e}")
+            continue
+        if not response.ok:
+            raise ConnectionError(
+                f"Bright Data agent failed with status {response.status_code}")
+
+        job = response.json()['data']
+        step = job.get('last_step')
+        if on_progress and step and step != last_step:
+            on_progress(_step_message(step))
+        last_step = step
+
+        if job['status'] == 'done':
+            return job['result']['response']
+        if job['status'] == 'failed':
+            raise ConnectionError(f"Bright Data agent failed: {job.get('error')}")
+
+    raise ConnectionError(f"Bright Data agent did not answer within {BRIGHTDATA_TIMEOUT:.0f} seconds")
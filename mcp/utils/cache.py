@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.metrics import record_cache
+from utils.shared_cache import shared_get, shared_set
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with per-entry expiry and LRU eviction.
+
+    When worker processes share a store (see utils.shared_cache), entries
+    are written through to it and memory misses are looked up there, so a
+    value cached by one worker is seen by all of them.
+
+    Args:
+        name (str): Name used when reporting cache statistics
+        ttl (float): Default time to live of an entry, in seconds
+        max_entries (int): Maximum number of entries before the least recently used is evicted
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                hit = False
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                hit = True
+
+        if not hit:
+            shared = shared_get(self.name, key)
+            if shared is not None:
+                entry = (shared[0], time.monotonic() + shared[1])
+                with self._lock:
+                    self.misses -= 1
+                    self.hits += 1
+                    self._insert(key, entry)
+                hit = True
+
+        record_cache(self.name, hit)
+        return entry[0] if hit else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value under key for ttl seconds (defaults to the cache TTL)."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._insert(key, (value, time.monotonic() + ttl))
+        shared_set(self.name, key, value, ttl)
+
+    def _insert(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,141 @@
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from utils.helpers import canonical_events, event_uid
+from utils.ics import iter_ics
+from utils.storage import CALENDAR_SUFFIX, calendar_store
+
+
+HANDLE_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def handle_filename(handle: str) -> str:
+    """
+    Turn a calendar handle (or its filename or URL) into its filename.
+
+    Raises:
+        ValueError: If the handle isn't a valid calendar handle
+    """
+    handle = handle.strip().rsplit('/', 1)[-1]
+    if handle.endswith(CALENDAR_SUFFIX):
+        handle = handle[:-len(CALENDAR_SUFFIX)]
+    if not HANDLE_PATTERN.match(handle):
+        raise ValueError(f"Invalid calendar handle {handle}")
+    return handle + CALENDAR_SUFFIX
+
+
+def _sorted(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(events, key=lambda event: (event['start'], event['end'], event['title']))
+
+
+def _edit(handle: str, edit) -> Dict[str, Any]:
+    filename = handle_filename(handle)
+    try:
+        return calendar_store.update(filename, edit, lambda state: iter_ics(state['events']))
+    except KeyError:
+        raise ValueError(f"Unknown or expired calendar {handle}, create it again")
+
+
+def list_events(handle: str) -> List[Dict[str, Any]]:
+    """Return the events of a calendar with their UIDs."""
+    state = calendar_store.load_state(handle_filename(handle))
+    if state is None:
+        raise ValueError(f"Unknown or expired calendar {handle}, create it again")
+    return state['events']
+
+
+def add_events(handle: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add events to a stored calendar.
+
+    Args:
+        handle (str): The calendar handle
+        events (list): Dictionaries with 'title' and 'time_range', as for create_ics_file
+
+    Returns:
+        list: The added events with their UIDs. Events already in the calendar are skipped
+    """
+    added = []
+
+    def edit(state):
+        # Edited events keep the UID of their original title and time, so
+        # duplicates are found by what the events are now
+        known = {(event['title'], event['start'], event['end']) for event in state['events']}
+        uids = {event['uid'] for event in state['events']}
+        for title, start, end in canonical_events(events):
+            if (title, start, end) in known:
+                continue
+            uid = event_uid(title, start, end)
+            if uid in uids:
+                uid = f"{uuid.uuid4().hex}@travelgenie"
+            event = {'uid': uid, 'title': title, 'start': start, 'end': end}
+            state['events'].append(event)
+            added.append(event)
+            known.add((title, start, end))
+            uids.add(uid)
+        state['events'] = _sorted(state['events'])
+        return state
+
+    _edit(handle, edit)
+    return added
+
+
+def update_event(
+    handle: str,
+    uid: str,
+    title: Optional[str] = None,
+    time_range: Optional[List[Any]] = None
+) -> Dict[str, Any]:
+    """
+    Change the title and/or time of one event, keeping its UID.
+
+    Calendar clients that subscribed to the file see the change as an update
+    of the same event thanks to the stable UID and the bumped SEQUENCE.
+
+    Returns:
+        dict: The updated event
+
+    Raises:
+        ValueError: If the calendar or the event doesn't exist
+    """
+    updated = {}
+
+    def edit(state):
+        for event in state['events']:
+            if event['uid'] != uid:
+                continue
+            new_title = title if title is not None else event['title']
+            if time_range is not None:
+                _, start, end = canonical_events(
+                    [{'title': new_title, 'time_range': time_range}])[0]
+            else:
+                start, end = event['start'], event['end']
+            event.update({'title': new_title, 'start': start, 'end': end,
+                          'sequence': event.get('sequence', 0) + 1})
+            updated.update(event)
+            state['events'] = _sorted(state['events'])
+            return state
+        raise ValueError(f"No event with UID {uid} in calendar {handle}")
+
+    _edit(handle, edit)
+    return updated
+
+
+def remove_events(handle: str, uids: List[str]) -> int:
+    """
+    Remove events from a stored calendar.
+
+    Returns:
+        int: Number of events removed
+    """
+    removed = []
+
+    def edit(state):
+        kept = [event for event in state['events'] if event['uid'] not in uids]
+        removed.append(len(state['events']) - len(kept))
+        state['events'] = kept
+        return state
+
+    _edit(handle, edit)
+    return removed[0]
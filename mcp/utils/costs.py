@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from utils.cache import TTLCache
+from utils.flights import offer_price
+from utils.helpers import get_rate_table
+from utils.hotels import hotel_price
+load_dotenv()
+
+
+# How long an offer reference handed out by a search stays resolvable, in seconds
+OFFER_REF_TTL = int(os.getenv("OFFER_REF_TTL", "86400"))
+
+_offers = TTLCache("offer_refs", OFFER_REF_TTL, max_entries=20000)
+
+
+def register_offer(kind: str, label: str, amount: Optional[float], currency: Optional[str]) -> Optional[str]:
+    """
+    Remember the price of an offer and return a short reference to it.
+
+    The reference is derived from the offer's content, so the same offer
+    returned by two searches gets the same reference.
+
+    Args:
+        kind (str): Offer type, e.g. 'flight' or 'hotel'
+        label (str): Human readable description of the offer
+        amount (float, optional): Total price in the offer's currency
+        currency (str, optional): Currency code of the amount
+
+    Returns:
+        Optional[str]: The reference (e.g. 'flight-1a2b3c4d5e'), or None if the offer has no price
+    """
+    if amount is None or not currency:
+        return None
+
+    entry = {'kind': kind, 'label': label,
+             'amount': round(float(amount), 2), 'currency': currency.upper()}
+    digest = hashlib.sha1(json.dumps(
+        entry, sort_keys=True).encode()).hexdigest()[:10]
+    ref = f"{kind}-{digest}"
+    _offers.set(ref, entry)
+    return ref
+
+
+def flight_label(legs: List[Dict[str, Any]]) -> str:
+    if not legs:
+        return "Flight"
+    first, last = legs[0], legs[-1]
+    origin = first.get('departureAirport', {}).get('code', '?')
+    destination = last.get('arrivalAirport', {}).get('code', '?')
+    return f"Flight {origin} -> {destination} {first.get('departureTime', '')}".strip()
+
+
+def _extract_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Work out the label, amount and currency of one trip cost item.
+
+    Accepts an offer reference, a manual {'amount', 'currency'} entry, a
+    search_flights result ('legs' and 'total'), a raw flight offer
+    ('priceBreakdown') or a hotel result.
+    """
+    if item.get('offer_ref'):
+        entry = _offers.get(item['offer_ref'])
+        if entry is None:
+            raise ValueError(
+                f"Unknown or expired offer reference {item['offer_ref']}, search again")
+        return dict(entry)
+
+    if item.get('amount') is not None and item.get('currency'):
+        return {'label': item.get('label', 'Item'),
+                'amount': float(item['amount']), 'currency': item['currency'].upper()}
+
+    total = item.get('total') or item.get('priceBreakdown', {}).get('total')
+    if isinstance(total, dict) and total.get('units') is not None:
+        return {'label': item.get('label') or flight_label(item.get('legs', [])),
+                'amount': offer_price({'priceBreakdown': {'total': total}}),
+                'currency': total.get('currencyCode', '').upper()}
+
+    price = hotel_price(item)
+    if price is not None and price['currency']:
+        return {'label': item.get('label') or item.get('name') or 'Hotel',
+                'amount': price['value'], 'currency': price['currency'].upper()}
+
+    raise ValueError(
+        f"Couldn't find a price in item {item.get('label') or item.get('name') or item}")
+
+
+def aggregate_trip_cost(items: List[Dict[str, Any]], target_currency: str) -> Dict[str, Any]:
+    """
+    Itemize and total trip costs in a single target currency.
+
+    All conversions use one rate table fetched with the target currency as
+    base, so any number of source currencies costs at most one Exchange
+    Rate API request (none when the table is cached).
+
+    Args:
+        items (list): Cost items, see _extract_item for the accepted shapes.
+                      Each item may carry a 'quantity' multiplier
+        target_currency (str): Currency code to total in (e.g., "USD")
+
+    Returns:
+        dict: 'items' with native and converted amounts, 'total',
+              'currency', 'subtotals_by_currency' and 'rates_as_of'
+
+    Raises:
+        ValueError: If an item has no price or a currency is unknown
+    """
+    target_currency = target_currency.upper()
+
+    extracted = []
+    for item in items:
+        entry = _extract_item(item)
+        entry['amount'] = entry['amount'] * float(item.get('quantity', 1))
+        extracted.append(entry)
+
+    rates, rates_as_of = ({}, None)
+    if any(entry['currency'] != target_currency for entry in extracted):
+        rates, rates_as_of = get_rate_table(target_currency)
+
+    breakdown = []
+    subtotals: Dict[str, float] = {}
+    total = 0.0
+    for entry in extracted:
+        currency = entry['currency']
+        if currency == target_currency:
+            converted = entry['amount']
+        elif currency in rates and rates[currency]:
+            # Rates are quoted per unit of the target currency
+            converted = entry['amount'] / rates[currency]
+        else:
+            raise ValueError(f"No exchange rate for currency {currency}")
+
+        subtotals[currency] = subtotals.get(currency, 0.0) + entry['amount']
+        total += converted
+        breakdown.append({
+            'label': entry['label'],
+            'amount': round(entry['amount'], 2),
+            'currency': currency,
+            'converted': round(converted, 2)
+        })
+
+    return {
+        'items': breakdown,
+        'total': round(total, 2),
+        'currency': target_currency,
+        'subtotals_by_currency': {currency: round(amount, 2) for currency, amount in subtotals.items()},
+        'rates_as_of': rates_as_of
+    }
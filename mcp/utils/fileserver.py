@@ -0,0 +1,282 @@
+import asyncio
+import gzip
+import os
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.storage import CALENDAR_DIR, CALENDAR_SUFFIX
+load_dotenv()
+
+
+CALENDAR_SERVER_HOST = os.getenv("CALENDAR_SERVER_HOST", "0.0.0.0")
+CALENDAR_SERVER_PORT = int(os.getenv("CALENDAR_SERVER_PORT", "3030"))
+
+# Calendars can be edited in place, so clients may reuse a copy for this
+# long and must revalidate it with its ETag afterwards
+CALENDAR_CACHE_MAX_AGE = int(os.getenv("CALENDAR_CACHE_MAX_AGE", "60"))
+
+# Files smaller than this aren't worth compressing
+GZIP_MIN_BYTES = int(os.getenv("CALENDAR_GZIP_MIN_BYTES", "512"))
+
+# Number of compressed bodies kept in memory, keyed by ETag
+GZIP_CACHE_ENTRIES = int(os.getenv("CALENDAR_GZIP_CACHE_ENTRIES", "256"))
+
+# Seconds an idle keep-alive connection or a slow request is allowed
+REQUEST_TIMEOUT = float(os.getenv("CALENDAR_REQUEST_TIMEOUT", "15"))
+
+MAX_HEADER_BYTES = 16 * 1024
+
+CONTENT_TYPES = {
+    CALENDAR_SUFFIX: "text/calendar; charset=utf-8",
+}
+
+REASONS = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 416: "Range Not Satisfiable",
+}
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$", re.IGNORECASE)
+
+
+class _Stats:
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.gzip_responses = 0
+        self.range_responses = 0
+        self.bytes_sent = 0
+
+
+class CalendarFileServer:
+    """
+    Async HTTP/1.1 server for the calendar directory.
+
+    Supports keep-alive, ETag/If-None-Match revalidation, Cache-Control,
+    gzip for clients that accept it, single byte ranges with If-Range and zero-copy
+    transfers of uncompressed bodies through the event loop's sendfile.
+    """
+
+    def __init__(self, directory: str = CALENDAR_DIR, host: str = CALENDAR_SERVER_HOST,
+                 port: int = CALENDAR_SERVER_PORT):
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.stats = _Stats()
+        self._gzip_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._thread = None
+
+    def _resolve(self, target: str) -> Optional[str]:
+        """Map a request path to a calendar file, refusing anything outside the directory."""
+        path = target.split('?', 1)[0]
+        name = path.rsplit('/', 1)[-1]
+        if not _NAME_PATTERN.match(name) or not name.endswith(CALENDAR_SUFFIX):
+            return None
+        full_path = os.path.join(self.directory, name)
+        return full_path if os.path.isfile(full_path) else None
+
+    def _gzip_body(self, f, etag: str) -> bytes:
+        body = self._gzip_cache.get(etag)
+        if body is None:
+            body = gzip.compress(f.read(), compresslevel=6)
+            self._gzip_cache[etag] = body
+            while len(self._gzip_cache) > GZIP_CACHE_ENTRIES:
+                self._gzip_cache.popitem(last=False)
+        else:
+            self._gzip_cache.move_to_end(etag)
+        return body
+
+    @staticmethod
+    def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+        """
+        Parse a single 'bytes=' range into inclusive offsets.
+
+        Returns None for multiple or malformed ranges, which are ignored
+        and answered with the whole file.
+
+        Raises:
+            ValueError: If the range is valid but unsatisfiable
+        """
+        match = _RANGE_PATTERN.match(value.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first:
+            if not last:
+                return None
+            # Suffix range: the last N bytes
+            if int(last) == 0 or size == 0:
+                raise ValueError(f"Range {value} of an object of {size} bytes")
+            return max(size - int(last), 0), size - 1
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise ValueError(f"Range {value} of an object of {size} bytes")
+        end = min(int(last), size - 1) if last else size - 1
+        return start, end
+
+    async def _write_head(self, writer: asyncio.StreamWriter, status: int,
+                          headers: Dict[str, str], keep_alive: bool):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}",
+                 f"Date: {formatdate(usegmt=True)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        await writer.drain()
+
+    async def _error(self, writer, status: int, keep_alive: bool, headers=None):
+        body = REASONS[status].encode()
+        await self._write_head(writer, status, {
+            'Content-Type': 'text/plain', 'Content-Length': str(len(body)), **(headers or {})},
+            keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    async def _respond(self, writer, method: str, target: str,
+                       headers: Dict[str, str], keep_alive: bool):
+        self.stats.requests += 1
+        if method not in ('GET', 'HEAD'):
+            await self._error(writer, 405, keep_alive, {'Allow': 'GET, HEAD'})
+            return
+
+        path = self._resolve(target)
+        if path is None:
+            await self._error(writer, 404, keep_alive)
+            return
+
+        # Calendars are replaced atomically when edited, so everything below
+        # works on this one open file even if it is replaced meanwhile
+        with open(path, 'rb') as f:
+            await self._send_file(writer, f, method, headers, keep_alive)
+
+    async def _send_file(self, writer, f, method: str, headers: Dict[str, str], keep_alive: bool):
+        stat = os.fstat(f.fileno())
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        common = {
+            'Cache-Control': f"public, max-age={CALENDAR_CACHE_MAX_AGE}, must-revalidate",
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Accept-Ranges': 'bytes',
+            'Vary': 'Accept-Encoding',
+            'Content-Type': CONTENT_TYPES[CALENDAR_SUFFIX],
+        }
+
+        range_header = headers.get('range')
+        if_range = headers.get('if-range')
+        if if_range is not None and if_range.strip() != etag:
+            # The client's partial copy is of another version of the file
+            range_header = None
+        use_gzip = ('gzip' in headers.get('accept-encoding', '') and range_header is None
+                    and stat.st_size >= GZIP_MIN_BYTES)
+        response_etag = f'{etag[:-1]}-gz"' if use_gzip else etag
+
+        if_none_match = headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or any(
+                tag.strip().removeprefix('W/') in (etag, response_etag)
+                for tag in if_none_match.split(','))):
+            self.stats.not_modified += 1
+            await self._write_head(writer, 304, {'ETag': response_etag, **{
+                key: common[key] for key in ('Cache-Control', 'Last-Modified', 'Vary')}},
+                keep_alive)
+            return
+
+        if use_gzip:
+            body = self._gzip_body(f, etag)
+            self.stats.gzip_responses += 1
+            await self._write_head(writer, 200, {
+                **common, 'ETag': response_etag, 'Content-Encoding': 'gzip',
+                'Content-Length': str(len(body))}, keep_alive)
+            if method == 'GET':
+                writer.write(body)
+                await writer.drain()
+                self.stats.bytes_sent += len(body)
+            return
+
+        start, end = 0, stat.st_size - 1
+        status = 200
+        try:
+            byte_range = self._parse_range(range_header, stat.st_size) if range_header else None
+        except ValueError:
+            await self._error(writer, 416, keep_alive, {'Content-Range': f"bytes */{stat.st_size}"})
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+            common['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+            self.stats.range_responses += 1
+
+        length = max(end - start + 1, 0)
+        await self._write_head(writer, status, {
+            **common, 'ETag': etag, 'Content-Length': str(length)}, keep_alive)
+        if method == 'GET' and length:
+            # Uses os.sendfile on plain sockets, falls back to reads otherwise
+            await asyncio.get_running_loop().sendfile(writer.transport, f, start, length)
+            self.stats.bytes_sent += length
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._error(writer, 400, False)
+                    return
+                if len(head) > MAX_HEADER_BYTES:
+                    await self._error(writer, 400, False)
+                    return
+
+                lines = head.decode('latin-1').split("\r\n")
+                parts = lines[0].split()
+                if len(parts) != 3:
+                    await self._error(writer, 400, False)
+                    return
+                method, target, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = (connection != 'close' if version == 'HTTP/1.1'
+                              else connection == 'keep-alive')
+                await self._respond(writer, method, target, headers, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+    async def serve(self):
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                limit=MAX_HEADER_BYTES)
+        except OSError as e:
+            # Another server process already serves the directory
+            print(f"Calendar file server not started on port {self.port}: {e}")
+            return
+        print(f"Serving calendars from {self.directory} on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def start_in_background(self):
+        """Run the server on its own event loop in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self.serve(),), name="calendar-file-server", daemon=True)
+        self._thread.start()
+
+    def metrics(self) -> Dict[str, int]:
+        return dict(vars(self.stats))
+
+
+calendar_file_server = CalendarFileServer()
@@ -0,0 +1,261 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.breaker import UpstreamResult
+from utils.cache import TTLCache
+from utils.gateway import PRIORITY_NORMAL, rapidapi_json
+from utils.metrics import in_context
+load_dotenv()
+
+
+FLIGHT_SEARCH_URL = "https://booking-com.p.rapidapi.com/v1/flights/search"
+
+# Currency Booking.com prices are quoted in unless a search asks for another
+BOOKING_CURRENCY = os.getenv("BOOKING_CURRENCY", "AED")
+
+# How long a flight search result is reused, in seconds
+FLIGHT_CACHE_TTL = int(os.getenv("FLIGHT_CACHE_TTL", "900"))
+
+# Maximum number of searches a price calendar runs at the same time
+CALENDAR_CONCURRENCY = int(os.getenv("FLIGHT_CALENDAR_CONCURRENCY", "4"))
+
+# Upper bounds that keep a single calendar from draining the RapidAPI quota
+MAX_CALENDAR_DAYS = 31
+MAX_CALENDAR_SEARCHES = int(os.getenv("FLIGHT_CALENDAR_MAX_SEARCHES", "60"))
+
+_search_cache = TTLCache("flight_search", FLIGHT_CACHE_TTL, max_entries=5000)
+
+
+def build_search_params(
+    from_code: str,
+    to_code: str,
+    depart_date: str,
+    adults: int = 1,
+    children_ages: Optional[List[int]] = None,
+    cabin_class: str = "ECONOMY",
+    page_number: int = 0,
+    currency: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build the Booking.com flight search query string."""
+    params = {
+        'from_code': from_code,
+        'depart_date': depart_date,
+        'to_code': to_code,
+        'adults': adults,
+        'cabin_class': cabin_class,
+        'page_number': page_number,
+        'currency': (currency or BOOKING_CURRENCY).upper(),
+        'locale': 'en-gb',
+        'flight_type': 'ONEWAY',
+        'order_by': 'BEST'
+    }
+
+    # Only add children_ages if there are any
+    if children_ages:
+        params['children_ages'] = ','.join(map(str, children_ages))
+
+    return params
+
+
+def fetch_flight_offers(
+    from_code: str,
+    to_code: str,
+    depart_date: str,
+    adults: int = 1,
+    children_ages: Optional[List[int]] = None,
+    cabin_class: str = "ECONOMY",
+    page_number: int = 0,
+    priority: int = PRIORITY_NORMAL,
+    currency: Optional[str] = None
+) -> UpstreamResult:
+    """
+    Fetch one page of Booking.com flight search results, using the search cache.
+
+    Args:
+        from_code (str): Departure airport/city code (e.g., "ONT.AIRPORT")
+        to_code (str): Destination airport/city code (e.g., "NYC.CITY")
+        depart_date (str): Departure date in YYYY-MM-DD format
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        children_ages (List[int], optional): List of children's ages
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+        page_number (int, optional): Result page to fetch. Defaults to 0.
+        priority (int, optional): Gateway priority for the request
+        currency (str, optional): Price currency. Defaults to BOOKING_CURRENCY
+
+    Returns:
+        UpstreamResult: The raw search response and its staleness
+
+    Raises:
+        CircuitOpenError: If the Booking.com circuit is open and nothing is cached
+        requests.RequestException: If the API request fails
+    """
+    params = build_search_params(from_code, to_code, depart_date, adults,
+                                 children_ages, cabin_class, page_number, currency)
+    key = json.dumps(params, sort_keys=True)
+
+    cached = _search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = rapidapi_json('GET', FLIGHT_SEARCH_URL,
+                           params=params, priority=priority)
+
+    # Stale fallbacks are not cached so the next call tries the API again
+    if not result.stale:
+        _search_cache.set(key, result)
+    return result
+
+
+def collect_flight_offers(
+    from_code: str,
+    to_code: str,
+    depart_date: str,
+    adults: int = 1,
+    children_ages: Optional[List[int]] = None,
+    cabin_class: str = "ECONOMY",
+    pages: int = 1,
+    max_workers: int = CALENDAR_CONCURRENCY
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Fetch several result pages of one flight search concurrently.
+
+    Returns:
+        Tuple[List[dict], bool]: All flight offers across the pages and
+                                 whether any page was served stale
+    """
+    def fetch(page_number: int) -> UpstreamResult:
+        return fetch_flight_offers(from_code, to_code, depart_date, adults,
+                                   children_ages, cabin_class, page_number)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, pages))) as executor:
+        results = list(executor.map(in_context(fetch), range(max(1, pages))))
+
+    offers = [offer for result in results
+              for offer in result.data.get('flightOffers', [])]
+    return offers, any(result.stale for result in results)
+
+
+def offer_price(offer: Dict[str, Any]) -> Optional[float]:
+    """
+    Total price of a flight offer as a float, or None if it has no price.
+
+    Booking.com splits amounts into whole `units` and fractional `nanos`.
+    """
+    total = offer.get('priceBreakdown', {}).get('total')
+    if not total or total.get('units') is None:
+        return None
+    return total['units'] + total.get('nanos', 0) / 1e9
+
+
+def cheapest_offer(offers: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Return the offer with the lowest total price, or None if none are priced."""
+    priced = [(offer_price(offer), offer) for offer in offers]
+    priced = [(price, offer) for price, offer in priced if price is not None]
+    if not priced:
+        return None
+    return min(priced, key=lambda item: item[0])[1]
+
+
+def price_calendar(
+    from_codes: List[str],
+    to_codes: List[str],
+    start_date: str,
+    days: int,
+    adults: int = 1,
+    children_ages: Optional[List[int]] = None,
+    cabin_class: str = "ECONOMY",
+    max_workers: int = CALENDAR_CONCURRENCY
+) -> Dict[str, Any]:
+    """
+    Search every route and day in a window and keep the cheapest offer of each.
+
+    Searches run concurrently on a bounded thread pool and go through the
+    flight search cache and the RapidAPI gateway.
+
+    Args:
+        from_codes (List[str]): Departure airport/city codes
+        to_codes (List[str]): Destination airport/city codes
+        start_date (str): First departure date in YYYY-MM-DD format
+        days (int): Number of consecutive days to search
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        children_ages (List[int], optional): List of children's ages
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+        max_workers (int, optional): Maximum concurrent searches
+
+    Returns:
+        dict: 'dates', a 'routes' mapping of "FROM->TO" to one price (or None)
+              per date, the overall 'cheapest' entry, 'currency' and 'stale'
+
+    Raises:
+        ValueError: If the window or the number of searches is out of bounds
+    """
+    if not 1 <= days <= MAX_CALENDAR_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_CALENDAR_DAYS}")
+
+    first_day = date.fromisoformat(start_date)
+    dates = [(first_day + timedelta(days=offset)).isoformat()
+             for offset in range(days)]
+    routes = [(origin, destination)
+              for origin in from_codes
+              for destination in to_codes
+              if origin != destination]
+
+    if len(routes) * len(dates) > MAX_CALENDAR_SEARCHES:
+        raise ValueError(
+            f"{len(routes) * len(dates)} searches requested, the limit is {MAX_CALENDAR_SEARCHES}")
+
+    matrix = {f"{origin}->{destination}": [None] * len(dates)
+              for origin, destination in routes}
+    cheapest = None
+    currency = None
+    stale = False
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(in_context(fetch_flight_offers), origin, destination, day,
+                            adults, children_ages, cabin_class): (origin, destination, index)
+            for origin, destination in routes
+            for index, day in enumerate(dates)
+        }
+
+        for future in as_completed(futures):
+            origin, destination, index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Calendar search {origin}->{destination} failed: {e}")
+                failed += 1
+                continue
+
+            stale = stale or result.stale
+            offer = cheapest_offer(result.data.get('flightOffers', []))
+            if offer is None:
+                continue
+
+            price = offer_price(offer)
+            route = f"{origin}->{destination}"
+            matrix[route][index] = round(price, 2)
+            currency = currency or offer['priceBreakdown']['total'].get(
+                'currencyCode')
+
+            if cheapest is None or price < cheapest['price']:
+                cheapest = {
+                    'route': route,
+                    'date': dates[index],
+                    'price': round(price, 2)
+                }
+
+    return {
+        'currency': currency,
+        'dates': dates,
+        'routes': matrix,
+        'cheapest': cheapest,
+        'failed_searches': failed,
+        'stale': stale
+    }
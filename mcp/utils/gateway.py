@@ -0,0 +1,397 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from utils.breaker import UPSTREAM_TIMEOUT, UpstreamResult, call_upstream
+from utils.metrics import record_upstream
+load_dotenv()
+
+
+# Request priorities, lower values are served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+# Default token bucket settings (requests per second, burst size) per host
+DEFAULT_RATE = float(os.getenv("RAPIDAPI_RATE_LIMIT", "5"))
+DEFAULT_BURST = int(os.getenv("RAPIDAPI_BURST", "10"))
+HOST_LIMITS = {
+    'booking-com.p.rapidapi.com': (DEFAULT_RATE, DEFAULT_BURST),
+    'visa-requirement.p.rapidapi.com': (float(os.getenv("VISA_API_RATE_LIMIT", "1")), 5),
+}
+
+# How long a request may wait for a token before giving up (seconds)
+QUEUE_TIMEOUT = float(os.getenv("RAPIDAPI_QUEUE_TIMEOUT", "30"))
+
+# Once the remaining quota reported by RapidAPI drops to this value, only
+# PRIORITY_HIGH requests are let through
+QUOTA_RESERVE = int(os.getenv("RAPIDAPI_QUOTA_RESERVE", "20"))
+
+
+class QuotaExhaustedError(Exception):
+    """Raised when a request is refused to protect the remaining RapidAPI quota."""
+
+
+class ThrottledError(Exception):
+    """Raised when a request could not get a rate limit token in time."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out tokens in priority order.
+
+    Waiting callers are kept in a heap ordered by (priority, arrival) and only
+    the head of the heap may take a token, so a burst of low priority work can
+    never starve an interactive request that arrives later.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        self.updated = now
+        if now >= self.blocked_until:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a token is available for this caller.
+
+        Args:
+            priority (int): Request priority, lower is served first
+            timeout (float, optional): Maximum seconds to wait. Waits forever if None
+
+        Returns:
+            bool: True if a token was taken, False if the timeout expired
+        """
+        ticket = (priority, next(self._seq))
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                if self._waiters[0] == ticket and self.tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self.tokens -= 1
+                    if waited:
+                        self.throttled += 1
+                        self.wait_seconds += now - start
+                    # Wake the next waiter so it can check for a token
+                    self._cond.notify_all()
+                    return True
+
+                if deadline is not None and now >= deadline:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    return False
+
+                # Sleep until roughly the next token is due
+                wait_for = max((1 - self.tokens) / self.rate, 0.01)
+                if now < self.blocked_until:
+                    wait_for = max(wait_for, self.blocked_until - now)
+                if deadline is not None:
+                    wait_for = min(wait_for, deadline - now)
+                waited = True
+                self._cond.wait(wait_for)
+
+    def block_for(self, seconds: float):
+        """Drain the bucket and stop refilling it for the given number of seconds."""
+        with self._cond:
+            self.tokens = 0
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + seconds)
+
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls so only one of them does the work.
+
+    Every caller that arrives while a call with the same key is in flight
+    waits for that call and receives its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.quota_refusals = 0
+        self.rate_limited_responses = 0
+        self.quota_limit = None
+        self.quota_remaining = None
+        self.quota_reset = None
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_stats: Dict[str, _HostStats] = {}
+_flights: Dict[str, SingleFlight] = {}
+_registry_lock = threading.Lock()
+
+# Number of worker processes splitting each host's rate limit
+_worker_share = 1
+
+
+def set_worker_share(workers: int):
+    """
+    Give this process 1/workers of every host's rate and burst.
+
+    Each worker process has its own token buckets, so without this N
+    workers together would send N times the configured rate.
+    """
+    global _worker_share
+    with _registry_lock:
+        _worker_share = max(1, workers)
+        _buckets.clear()
+        _stats.clear()
+        _flights.clear()
+
+
+def _host_state(host: str):
+    with _registry_lock:
+        if host not in _buckets:
+            rate, burst = HOST_LIMITS.get(host, (DEFAULT_RATE, DEFAULT_BURST))
+            _buckets[host] = TokenBucket(rate / _worker_share, max(1, burst // _worker_share))
+            _stats[host] = _HostStats()
+            _flights[host] = SingleFlight()
+        return _buckets[host], _stats[host], _flights[host]
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _record_quota(stats: _HostStats, bucket: TokenBucket, response: requests.Response):
+    # RapidAPI reports the plan quota on every response
+    limit = _int_header(response.headers, 'x-ratelimit-requests-limit')
+    remaining = _int_header(response.headers, 'x-ratelimit-requests-remaining')
+    reset = _int_header(response.headers, 'x-ratelimit-requests-reset')
+    if limit is not None:
+        stats.quota_limit = limit
+    if remaining is not None:
+        stats.quota_remaining = remaining
+    if reset is not None:
+        stats.quota_reset = reset
+
+    if response.status_code == 429:
+        stats.rate_limited_responses += 1
+        retry_after = _int_header(response.headers, 'retry-after') or 1
+        bucket.block_for(retry_after)
+
+
+def rapidapi_request(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    data: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_NORMAL
+) -> requests.Response:
+    """
+    Send a request to a RapidAPI host through the shared gateway.
+
+    Identical in-flight requests are coalesced into a single upstream call,
+    each host is rate limited with a priority-ordered token bucket, and the
+    remaining plan quota reported by RapidAPI is tracked so low priority work
+    stops before the quota runs out.
+
+    Args:
+        method (str): HTTP method ("GET" or "POST")
+        url (str): Full RapidAPI endpoint URL
+        params (dict, optional): Query string parameters
+        data (dict, optional): Form encoded request body
+        priority (int, optional): One of PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+
+    Returns:
+        requests.Response: The upstream response, shared between coalesced callers
+
+    Raises:
+        KeyError: If RAPIDAPI_KEY is not found in environment variables
+        QuotaExhaustedError: If the remaining quota is reserved for higher priority requests
+        ThrottledError: If no rate limit token became available in time
+        requests.RequestException: If the upstream request fails
+    """
+    api_key = os.getenv('RAPIDAPI_KEY')
+    if not api_key:
+        raise KeyError("RAPIDAPI_KEY not found in environment variables")
+
+    host = urlparse(url).netloc
+    bucket, stats, flight = _host_state(host)
+
+    headers = {
+        'x-rapidapi-host': host,
+        'x-rapidapi-key': api_key
+    }
+    if data is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+    def send():
+        if (priority > PRIORITY_HIGH and stats.quota_remaining is not None
+                and stats.quota_remaining <= QUOTA_RESERVE):
+            stats.quota_refusals += 1
+            raise QuotaExhaustedError(
+                f"RapidAPI quota for {host} is down to {stats.quota_remaining} requests")
+
+        if not bucket.acquire(priority, timeout=QUEUE_TIMEOUT):
+            raise ThrottledError(
+                f"Timed out waiting for a rate limit slot on {host}")
+
+        stats.requests += 1
+        try:
+            response = requests.request(
+                method, url, headers=headers, params=params, data=data,
+                timeout=UPSTREAM_TIMEOUT)
+        except requests.RequestException as e:
+            record_upstream(host, type(e).__name__)
+            raise
+        _record_quota(stats, bucket, response)
+        # Read the body once so coalesced callers can share it
+        record_upstream(host, response.status_code, len(response.content))
+        return response
+
+    return flight.do(_request_key(method, url, params, data), send)
+
+
+def _request_key(method: str, url: str, params, data) -> str:
+    return json.dumps([method.upper(), url, params, data],
+                      sort_keys=True, default=str)
+
+
+def rapidapi_json(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    data: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_NORMAL
+) -> UpstreamResult:
+    """
+    Fetch and parse a RapidAPI JSON response behind the host's circuit breaker.
+
+    While the host's circuit is open, or if the request fails, the last known
+    good response for the same request is returned with `stale=True`.
+
+    Args:
+        method (str): HTTP method ("GET" or "POST")
+        url (str): Full RapidAPI endpoint URL
+        params (dict, optional): Query string parameters
+        data (dict, optional): Form encoded request body
+        priority (int, optional): One of PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+
+    Returns:
+        UpstreamResult: Parsed JSON body, staleness flag and fetch time
+
+    Raises:
+        CircuitOpenError: If the circuit is open and nothing is cached
+        requests.RequestException: If the request fails and nothing is cached
+    """
+    def fetch():
+        response = rapidapi_request(method, url, params, data, priority)
+        response.raise_for_status()
+        return response.json()
+
+    host = urlparse(url).netloc
+    return call_upstream(host, _request_key(method, url, params, data), fetch)
+
+
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Snapshot of the gateway metrics for every RapidAPI host seen so far.
+
+    Returns:
+        dict: Per-host request, coalescing, throttling and quota figures
+    """
+    with _registry_lock:
+        hosts = list(_buckets)
+
+    metrics = {}
+    for host in hosts:
+        bucket, stats, flight = _host_state(host)
+        metrics[host] = {
+            'requests': stats.requests,
+            'coalesced': flight.coalesced,
+            'in_flight': flight.in_flight(),
+            'queued': bucket.queued(),
+            'throttled': bucket.throttled,
+            'throttle_wait_seconds': round(bucket.wait_seconds, 3),
+            'queue_timeouts': bucket.rejected,
+            'rate_limited_responses': stats.rate_limited_responses,
+            'quota_refusals': stats.quota_refusals,
+            'quota_limit': stats.quota_limit,
+            'quota_remaining': stats.quota_remaining,
+            'quota_reset_seconds': stats.quota_reset,
+        }
+    return metrics
@@ -1,37 +1,34 @@
-import uuid
+import hashlib
+import json
 from datetime import datetime
 import requests
 import os
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 from dotenv import load_dotenv
+
+from utils.breaker import UPSTREAM_TIMEOUT, call_upstream
+from utils.cache import TTLCache
+from utils.ics import format_time, iter_ics
+from utils.metrics import record_upstream
+from utils.storage import calendar_store
 load_dotenv()
 
 
-def create_ics_file(events):
+# The Exchange Rate API refreshes its rates once a day, so a rate table can
+# be reused for a while without any loss of accuracy
+RATE_TABLE_TTL = int(os.getenv("EXCHANGE_RATE_CACHE_TTL", "3600"))
+
+_rate_tables = TTLCache("exchange_rates", RATE_TABLE_TTL, max_entries=200)
+
+
+def canonical_events(events):
     """
-    Takes an array of dictionaries, each containing 'title' and 'time_range' keys,
-    and creates an ICS file with these events.
-    Args:
-        events (list): List of dictionaries, each with 'title' and 'time_range' keys.
-                      The 'time_range' should be a tuple of (start_time, end_time),
-                      where times are datetime objects or ISO format strings.
-    Returns:
-        str: The filename of the created ICS file (UUID + .ics)
+    Normalize events to sorted (title, start, end) tuples in iCalendar time format.
+
+    Two event lists describing the same calendar, in any order and with
+    times written in any ISO format, have the same canonical form.
     """
-    # Generate a unique filename with UUID
-    filename = f"{str(uuid.uuid4())}.ics"
-    filepath = os.path.join("calendars", filename)
-
-    # ICS file header
-    ics_content = [
-        "BEGIN:VCALENDAR",
-        "VERSION:2.0",
-        "PRODID:-//Python Calendar Event Generator//EN",
-        "CALSCALE:GREGORIAN",
-        "METHOD:PUBLISH"
-    ]
-
-    # Add each event to the ICS content
+    canonical = []
     for event in events:
         title = event.get('title', 'Untitled Event')
 
@@ -39,62 +36,54 @@ def create_ics_file(events):
         time_range = event.get(
             'time_range', [datetime.now().isoformat(), datetime.now().isoformat()])
 
-        # Convert strings to datetime objects if necessary
-        if isinstance(time_range[0], str):
-            start_time = datetime.fromisoformat(
-                time_range[0].replace('Z', '+00:00'))
-        else:
-            start_time = time_range[0]
-
-        if isinstance(time_range[1], str):
-            end_time = datetime.fromisoformat(
-                time_range[1].replace('Z', '+00:00'))
-        else:
-            end_time = time_range[1]
-
         # Format times according to iCalendar spec (UTC format)
-        start_time_str = start_time.strftime("%Y%m%dT%H%M%SZ")
-        end_time_str = end_time.strftime("%Y%m%dT%H%M%SZ")
+        start_time_str = format_time(time_range[0])
+        end_time_str = format_time(time_range[1])
+        canonical.append((title, start_time_str, end_time_str))
+    # Repeated identical events would share a UID, so only one is kept
+    return sorted(set(canonical), key=lambda event: (event[1], event[2], event[0]))
 
-        # Create unique identifier for this event
-        event_uuid = str(uuid.uuid4())
 
-        # Add event details to ICS content
-        ics_content.extend([
-            "BEGIN:VEVENT",
-            f"SUMMARY:{title}",
-            f"DTSTART:{start_time_str}",
-            f"DTEND:{end_time_str}",
-            f"UID:{event_uuid}",
-            f"DTSTAMP:{datetime.now().strftime('%Y%m%dT%H%M%SZ')}",
-            "END:VEVENT"
-        ])
+def event_uid(title: str, start: str, end: str) -> str:
+    """Stable UID of an event, so a regenerated calendar doesn't duplicate it in clients."""
+    digest = hashlib.sha1(f"{title}\n{start}\n{end}".encode()).hexdigest()
+    return f"{digest}@travelgenie"
 
-    # Add calendar footer
-    ics_content.append("END:VCALENDAR")
 
-    # Join all lines and write to file
-    with open(filepath, 'w') as f:
-        f.write("\r\n".join(ics_content))
+def create_ics_file(events):
+    """
+    Takes an array of dictionaries, each containing 'title' and 'time_range' keys,
+    and creates an ICS file with these events.
 
-    return filename
+    The file is named after a hash of the canonical events, so creating the
+    same calendar again returns the existing file instead of a duplicate.
+    Args:
+        events (list): List of dictionaries, each with 'title' and 'time_range' keys.
+                      The 'time_range' should be a tuple of (start_time, end_time),
+                      where times are datetime objects or ISO format strings.
+    Returns:
+        str: The filename of the ICS file (content hash + .ics)
+    """
+    canonical = canonical_events(events)
+    stored = [{'uid': event_uid(title, start, end), 'title': title, 'start': start, 'end': end}
+              for title, start, end in canonical]
+    return calendar_store.store(json.dumps(canonical), lambda: iter_ics(stored),
+                                {'events': stored})
 
 
-def currency_conversion(base_currency: str, target_currency: str, amount: float, api_key: Optional[str] = None) -> Tuple[float, str]:
+def get_rate_table(base_currency: str, api_key: Optional[str] = None) -> Tuple[Dict[str, float], str]:
     """
-    Convert an amount from a base currency to a target currency using the Exchange Rate API.
+    Get the conversion rates from a base currency, using the rate table cache.
 
     Args:
         base_currency (str): The currency code to convert from (e.g., "USD")
-        target_currency (str): The currency code to convert to (e.g., "EUR")
-        amount (float): The amount to convert
         api_key (str, optional): Your Exchange Rate API key. If not provided, will look for EXCHANGE_RATE_API_KEY in environment variables
 
     Returns:
-        Tuple[float, str]: A tuple containing the converted amount and the date of the last update
+        Tuple[Dict[str, float], str]: The rate for every currency code and the date of the last update
 
     Raises:
-        ValueError: If the currency codes are invalid or the API request fails
+        ValueError: If the currency code is invalid or the API request fails
         KeyError: If the API key is not provided and not found in environment variables
     """
     # Get API key from parameters or environment variables
@@ -105,45 +94,87 @@ def currency_conversion(base_currency: str, target_currency: str, amount: float,
         raise KeyError(
             "API key not provided. Either pass the api_key parameter or set the EXCHANGE_RATE_API_KEY environment variable.")
 
-    # Validate inputs
     base_currency = base_currency.upper()
-    target_currency = target_currency.upper()
 
-    if not isinstance(amount, (int, float)):
-        raise ValueError("Amount must be a number")
+    cached = _rate_tables.get(base_currency)
+    if cached is not None:
+        return cached
 
     # Construct the API URL
     url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/{base_currency}"
 
-    try:
+    def fetch_rates():
         # Send GET request to the API
-        response = requests.get(url)
+        try:
+            response = requests.get(url, timeout=UPSTREAM_TIMEOUT)
+        except requests.RequestException as e:
+            record_upstream("v6.exchangerate-api.com", type(e).__name__)
+            raise
+        record_upstream("v6.exchangerate-api.com", response.status_code, len(response.content))
+        if response.status_code >= 500:
+            response.raise_for_status()
         data = response.json()
 
         # Check if the request was successful
         if data.get("result") == "success":
-            # Extract the conversion rates and update time
-            conversion_rates = data["conversion_rates"]
-            last_update_utc = data["time_last_update_utc"]
-
-            # Check if the target currency exists in the response
-            if target_currency not in conversion_rates:
-                raise ValueError(
-                    f"Invalid target currency code: {target_currency}")
+            return data["conversion_rates"], data["time_last_update_utc"]
 
-            # Calculate the converted amount
-            conversion_rate = conversion_rates[target_currency]
-            converted_amount = amount * conversion_rate
-
-            return converted_amount, last_update_utc
+        # Handle API errors
+        error_type = data.get("error-type", "unknown")
+        if error_type == "unknown-code":
+            raise ValueError(
+                f"Invalid base currency code: {base_currency}")
         else:
-            # Handle API errors
-            error_type = data.get("error-type", "unknown")
-            if error_type == "unknown-code":
-                raise ValueError(
-                    f"Invalid base currency code: {base_currency}")
-            else:
-                raise ValueError(f"API Error: {error_type}")
+            raise ValueError(f"API Error: {error_type}")
 
+    try:
+        # The rate table goes through the circuit breaker, so an outage serves
+        # the last known good table instead of hanging
+        result = call_upstream("exchangerate-api", base_currency, fetch_rates)
     except requests.RequestException as e:
         raise ValueError(f"Failed to connect to Exchange Rate API: {str(e)}")
+
+    conversion_rates, last_update_utc = result.data
+    if result.stale:
+        last_update_utc = f"{last_update_utc} (cached, Exchange Rate API unavailable)"
+    else:
+        _rate_tables.set(base_currency, (conversion_rates, last_update_utc))
+
+    return conversion_rates, last_update_utc
+
+
+def currency_conversion(base_currency: str, target_currency: str, amount: float, api_key: Optional[str] = None) -> Tuple[float, str]:
+    """
+    Convert an amount from a base currency to a target currency using the Exchange Rate API.
+
+    Args:
+        base_currency (str): The currency code to convert from (e.g., "USD")
+        target_currency (str): The currency code to convert to (e.g., "EUR")
+        amount (float): The amount to convert
+        api_key (str, optional): Your Exchange Rate API key. If not provided, will look for EXCHANGE_RATE_API_KEY in environment variables
+
+    Returns:
+        Tuple[float, str]: A tuple containing the converted amount and the date of the last update
+
+    Raises:
+        ValueError: If the currency codes are invalid or the API request fails
+        KeyError: If the API key is not provided and not found in environment variables
+    """
+    # Validate inputs
+    target_currency = target_currency.upper()
+
+    if not isinstance(amount, (int, float)):
+        raise ValueError("Amount must be a number")
+
+    conversion_rates, last_update_utc = get_rate_table(base_currency, api_key)
+
+    # Check if the target currency exists in the response
+    if target_currency not in conversion_rates:
+        raise ValueError(
+            f"Invalid target currency code: {target_currency}")
+
+    # Calculate the converted amount
+    conversion_rate = conversion_rates[target_currency]
+    converted_amount = amount * conversion_rate
+
+    return converted_amount, last_update_utc
@@ -0,0 +1,305 @@
+import heapq
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.breaker import UpstreamResult
+from utils.cache import TTLCache
+from utils.flights import BOOKING_CURRENCY
+from utils.gateway import PRIORITY_NORMAL, rapidapi_json
+from utils.metrics import in_context
+load_dotenv()
+
+
+HOTEL_SEARCH_URL = "https://booking-com.p.rapidapi.com/v2/hotels/search"
+
+# How long a hotel search page is reused, in seconds
+HOTEL_CACHE_TTL = int(os.getenv("HOTEL_CACHE_TTL", "900"))
+
+# Maximum number of result pages fetched at the same time
+HOTEL_PAGE_CONCURRENCY = int(os.getenv("HOTEL_PAGE_CONCURRENCY", "3"))
+
+# Hard limit on pages a single ranked search may fetch
+MAX_HOTEL_PAGES = int(os.getenv("HOTEL_MAX_PAGES", "10"))
+
+RANK_BY_TOTAL_PRICE = "total_price"
+RANK_BY_PRICE_PER_NIGHT = "price_per_night"
+
+_page_cache = TTLCache("hotel_search", HOTEL_CACHE_TTL, max_entries=5000)
+
+
+def build_search_params(
+    dest_id: int,
+    checkin_date: str,
+    checkout_date: str,
+    children_number: int = 1,
+    adults_number: int = 1,
+    children_ages: Optional[List[int]] = None,
+    dest_type: str = "city",
+    page_number: int = 0,
+    order_by: str = "popularity",
+    currency: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build the Booking.com hotel search query string."""
+    # Set default children_ages if not provided
+    if children_ages is None:
+        children_ages = [0]
+
+    return {
+        'children_number': children_number,
+        'adults_number': adults_number,
+        'categories_filter_ids': 'class::2,class::4,free_cancellation::1',
+        'children_ages': ','.join(map(str, children_ages)),
+        'checkout_date': checkout_date,
+        'dest_type': dest_type,
+        'page_number': page_number,
+        'units': 'metric',
+        'order_by': order_by,
+        'room_number': 1,
+        'checkin_date': checkin_date,
+        'filter_by_currency': (currency or BOOKING_CURRENCY).upper(),
+        'dest_id': dest_id,
+        'locale': 'en-gb',
+        'include_adjacency': 'true'
+    }
+
+
+def fetch_hotel_page(params: Dict[str, Any], priority: int = PRIORITY_NORMAL) -> UpstreamResult:
+    """
+    Fetch one page of Booking.com hotel search results, using the page cache.
+
+    Args:
+        params (dict): Query string built by build_search_params
+        priority (int, optional): Gateway priority for the request
+
+    Returns:
+        UpstreamResult: The raw search response and its staleness
+
+    Raises:
+        CircuitOpenError: If the Booking.com circuit is open and nothing is cached
+        requests.RequestException: If the API request fails
+    """
+    key = json.dumps(params, sort_keys=True)
+
+    cached = _page_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = rapidapi_json('GET', HOTEL_SEARCH_URL,
+                           params=params, priority=priority)
+
+    # Stale fallbacks are not cached so the next call tries the API again
+    if not result.stale:
+        _page_cache.set(key, result)
+    return result
+
+
+def collect_hotel_results(
+    params: Dict[str, Any],
+    pages: int = 1,
+    concurrency: int = HOTEL_PAGE_CONCURRENCY
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Fetch several result pages of one hotel search concurrently.
+
+    Args:
+        params (dict): Query string built by build_search_params, its
+                       page_number is replaced for each page
+        pages (int, optional): Number of pages to fetch, capped at HOTEL_MAX_PAGES
+        concurrency (int, optional): Pages fetched at the same time
+
+    Returns:
+        Tuple[List[dict], bool]: All hotel results across the pages and
+                                 whether any page was served stale
+    """
+    pages = max(1, min(pages, MAX_HOTEL_PAGES))
+
+    def fetch(page_number: int) -> UpstreamResult:
+        return fetch_hotel_page({**params, 'page_number': page_number})
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, pages))) as executor:
+        results = list(executor.map(in_context(fetch), range(pages)))
+
+    hotels = [hotel for result in results for hotel in result.data.get('results', [])]
+    return hotels, any(result.stale for result in results)
+
+
+def hotel_price(hotel: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Total stay price of a hotel result as {'value', 'currency'}, or None.
+
+    Booking.com has reported the gross price under a few different keys
+    over time, so each known location is tried in turn.
+    """
+    candidates = [
+        hotel.get('priceBreakdown', {}).get('grossPrice'),
+        (hotel.get('priceDetails') or {}).get('gross'),
+        (hotel.get('priceDetails') or {}).get('gross_amount'),
+        hotel.get('composite_price_breakdown', {}).get('gross_amount'),
+    ]
+    for price in candidates:
+        if isinstance(price, dict) and price.get('value') is not None:
+            return {
+                'value': float(price['value']),
+                'currency': price.get('currency')
+            }
+    return None
+
+
+def nights_between(checkin_date: str, checkout_date: str) -> int:
+    nights = (date.fromisoformat(checkout_date) -
+              date.fromisoformat(checkin_date)).days
+    return max(nights, 1)
+
+
+def search_top_k(
+    dest_id: int,
+    checkin_date: str,
+    checkout_date: str,
+    children_number: int = 1,
+    adults_number: int = 1,
+    children_ages: Optional[List[int]] = None,
+    dest_type: str = "city",
+    rank_by: str = RANK_BY_TOTAL_PRICE,
+    top_k: int = 3,
+    max_pages: int = 5,
+    max_price_per_night: Optional[float] = None,
+    min_review_score: Optional[float] = None,
+    concurrency: int = HOTEL_PAGE_CONCURRENCY,
+    currency: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Page through price-ordered hotel results and keep the k cheapest matches.
+
+    Pages are fetched concurrently in waves of `concurrency` pages. Every
+    matching hotel is pushed through a bounded max-heap of size k, so memory
+    stays O(k) however many pages are read. Since results are ordered by
+    price, once the cheapest hotel on the last page of a wave is no better
+    than the current k-th best, later pages cannot improve the ranking and
+    the search stops early.
+
+    Args:
+        dest_id (int): Destination ID for the search location
+        checkin_date (str): Check-in date in format 'YYYY-MM-DD'
+        checkout_date (str): Checkout date in format 'YYYY-MM-DD'
+        children_number (int, optional): Number of children. Defaults to 1
+        adults_number (int, optional): Number of adults. Defaults to 1
+        children_ages (List[int], optional): List of children ages. Defaults to [0]
+        dest_type (str, optional): Destination type. Defaults to 'city'
+        rank_by (str, optional): 'total_price' or 'price_per_night'
+        top_k (int, optional): Number of hotels to return. Defaults to 3
+        max_pages (int, optional): Maximum result pages to fetch. Defaults to 5
+        max_price_per_night (float, optional): Skip hotels above this nightly price
+        min_review_score (float, optional): Skip hotels rated below this score
+        concurrency (int, optional): Pages fetched at the same time
+        currency (str, optional): Price currency. Defaults to BOOKING_CURRENCY
+
+    Returns:
+        dict: The ranked 'hotels', 'pages_fetched', 'stopped_early' and 'stale'
+
+    Raises:
+        ValueError: If rank_by is not supported
+    """
+    if rank_by not in (RANK_BY_TOTAL_PRICE, RANK_BY_PRICE_PER_NIGHT):
+        raise ValueError(
+            f"rank_by must be '{RANK_BY_TOTAL_PRICE}' or '{RANK_BY_PRICE_PER_NIGHT}'")
+
+    top_k = max(1, top_k)
+    max_pages = max(1, min(max_pages, MAX_HOTEL_PAGES))
+    nights = nights_between(checkin_date, checkout_date)
+
+    # Max-heap of the best k seen so far, stored as (-score, seq, entry)
+    heap = []
+    seq = itertools.count()
+    pages_fetched = 0
+    stopped_early = False
+    stale = False
+
+    def score(price: float) -> float:
+        return price if rank_by == RANK_BY_TOTAL_PRICE else price / nights
+
+    def fetch(page_number: int) -> UpstreamResult:
+        params = build_search_params(dest_id, checkin_date, checkout_date,
+                                     children_number, adults_number, children_ages,
+                                     dest_type, page_number, order_by='price',
+                                     currency=currency)
+        return fetch_hotel_page(params)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        next_page = 0
+        while next_page < max_pages:
+            wave = list(range(next_page, min(next_page + concurrency, max_pages)))
+            next_page = wave[-1] + 1
+            pages = list(executor.map(in_context(fetch), wave))
+            pages_fetched += len(pages)
+
+            exhausted = False
+            last_page_floor = None
+            for result in pages:
+                stale = stale or result.stale
+                hotels = result.data.get('results', [])
+                if not hotels:
+                    exhausted = True
+                    continue
+
+                page_floor = None
+                for hotel in hotels:
+                    price = hotel_price(hotel)
+                    if price is None:
+                        continue
+
+                    hotel_score = score(price['value'])
+                    page_floor = hotel_score if page_floor is None else min(
+                        page_floor, hotel_score)
+
+                    per_night = price['value'] / nights
+                    if max_price_per_night is not None and per_night > max_price_per_night:
+                        continue
+                    review_score = hotel.get('reviewScore')
+                    if min_review_score is not None and (review_score or 0) < min_review_score:
+                        continue
+
+                    entry = {
+                        'name': hotel.get('name'),
+                        'total_price': round(price['value'], 2),
+                        'price_per_night': round(per_night, 2),
+                        'currency': price['currency'],
+                        'review_score': review_score,
+                        'checkinDate': hotel.get('checkinDate'),
+                        'checkoutDate': hotel.get('checkoutDate'),
+                    }
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, (-hotel_score, next(seq), entry))
+                    elif hotel_score < -heap[0][0]:
+                        heapq.heapreplace(
+                            heap, (-hotel_score, next(seq), entry))
+
+                last_page_floor = page_floor
+
+            if exhausted:
+                break
+
+            # Results are price ordered, so a page whose cheapest hotel cannot
+            # beat the current k-th best means no later page can either
+            if (len(heap) == top_k and last_page_floor is not None
+                    and last_page_floor >= -heap[0][0] and next_page < max_pages):
+                stopped_early = True
+                break
+
+    ranked = [entry for _, _, entry in sorted(heap, key=lambda item: -item[0])]
+    for rank, entry in enumerate(ranked, start=1):
+        entry['rank'] = rank
+
+    return {
+        'rank_by': rank_by,
+        'nights': nights,
+        'hotels': ranked,
+        'pages_fetched': pages_fetched,
+        'stopped_early': stopped_early,
+        'stale': stale
+    }
@@ -0,0 +1,109 @@
+import calendar
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# RFC 5545 limits content lines to 75 octets, excluding the line break
+MAX_LINE_OCTETS = 75
+
+# Timestamps in the shape the agent nearly always sends, e.g.
+# 2025-05-21T10:00:00Z, 2025-05-21T10:00 or 2025-05-21 10:00:00.000+00:00
+_FAST_TIMESTAMP = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?(?:Z|[+-]00:?00)?$")
+
+_NEEDS_ESCAPE = re.compile(r"[\\;,\r\n]")
+
+
+def format_time(value: Any) -> str:
+    """
+    Convert a datetime or ISO 8601 string to iCalendar UTC format (YYYYMMDDTHHMMSSZ).
+
+    UTC and naive timestamps are reformatted by slicing the string, without
+    building a datetime. Anything else goes through datetime.fromisoformat
+    and is converted to UTC.
+
+    Raises:
+        ValueError: If the value is not a valid timestamp
+    """
+    if isinstance(value, str):
+        match = _FAST_TIMESTAMP.match(value.strip())
+        if match:
+            year, month, day, hour, minute, second = match.groups()
+            if not ("01" <= month <= "12" and hour <= "23" and minute <= "59"
+                    and (second or "00") <= "60"
+                    and 1 <= int(day) <= calendar.monthrange(int(year), int(month))[1]):
+                raise ValueError(f"Invalid timestamp {value}")
+            return f"{year}{month}{day}T{hour}{minute}{second or '00'}Z"
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def escape_text(value: str) -> str:
+    """Escape a TEXT property value (RFC 5545 section 3.3.11)."""
+    if not _NEEDS_ESCAPE.search(value):
+        return value
+    # Chained replaces are several times faster than str.translate here
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', ''))
+
+
+def fold_line(line: str) -> str:
+    """
+    Fold a content line into chunks of at most 75 octets joined by CRLF and a space.
+
+    Lines are split on UTF-8 character boundaries, so multi-byte characters
+    are never cut in half.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line
+
+    parts = []
+    start = 0
+    # Continuation lines start with a space, which counts towards their 75 octets
+    limit = MAX_LINE_OCTETS
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Step back off UTF-8 continuation bytes
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start = end
+        limit = MAX_LINE_OCTETS - 1
+    return "\r\n ".join(parts)
+
+
+def iter_ics(events: Iterable[Dict[str, Any]], dtstamp: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the lines of a calendar, folded, escaped and terminated by CRLF.
+
+    Events are consumed one at a time, so a calendar can be written to a
+    file or an HTTP response without ever holding its full text in memory.
+
+    Args:
+        events (Iterable): Dictionaries with 'uid', 'title', 'start' and 'end'
+                           in iCalendar UTC format, and optionally 'sequence'
+        dtstamp (str, optional): Creation time stamped on every event. Defaults to now.
+    """
+    dtstamp = dtstamp or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    yield ("BEGIN:VCALENDAR\r\n"
+           "VERSION:2.0\r\n"
+           "PRODID:-//Python Calendar Event Generator//EN\r\n"
+           "CALSCALE:GREGORIAN\r\n"
+           "METHOD:PUBLISH\r\n")
+
+    for event in events:
+        yield (f"BEGIN:VEVENT\r\n"
+               f"{fold_line('SUMMARY:' + escape_text(event['title']))}\r\n"
+               f"DTSTART:{event['start']}\r\n"
+               f"DTEND:{event['end']}\r\n"
+               f"{fold_line('UID:' + event['uid'])}\r\n"
+               f"SEQUENCE:{event.get('sequence', 0)}\r\n"
+               f"DTSTAMP:{dtstamp}\r\n"
+               f"END:VEVENT\r\n")
+
+    yield "END:VCALENDAR\r\n"
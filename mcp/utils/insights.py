@@ -0,0 +1,341 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from utils.reddit import activities_report, sentiment_report
+from utils.shared_cache import shared_get, shared_items, shared_set, shared_store
+load_dotenv()
+
+
+# Where insights and request counts are persisted between restarts
+INSIGHTS_PATH = os.getenv("INSIGHTS_PATH", "data/insights.json")
+
+# Age after which an insight is rebuilt on request, in seconds. Past
+# INSIGHT_TTL but within INSIGHT_MAX_AGE the old report is still served
+# while a refresh is queued
+INSIGHT_TTL = int(os.getenv("INSIGHT_TTL", str(24 * 3600)))
+INSIGHT_MAX_AGE = int(os.getenv("INSIGHT_MAX_AGE", str(7 * 24 * 3600)))
+
+# Background scheduler: seconds between passes and how many of the most
+# requested destinations it keeps warm
+INSIGHT_REFRESH_INTERVAL = int(os.getenv("INSIGHT_REFRESH_INTERVAL", "900"))
+INSIGHT_TOP_N = int(os.getenv("INSIGHT_TOP_N", "10"))
+
+# Insights younger than this fraction of INSIGHT_TTL are not pre-refreshed
+INSIGHT_REFRESH_AT = float(os.getenv("INSIGHT_REFRESH_AT", "0.75"))
+
+# Destinations kept warm even before anyone asks, as a comma separated list.
+# Every refresh is a paid Bright Data crawl, so none by default
+INSIGHT_SEED_LOCATIONS = os.getenv("INSIGHT_SEED_LOCATIONS", "")
+
+# Request counts are multiplied by this every pass so popularity follows recent demand
+INSIGHT_COUNT_DECAY = float(os.getenv("INSIGHT_COUNT_DECAY", "0.95"))
+
+# Decayed request count a location needs to be kept warm, and below which
+# its count is forgotten
+INSIGHT_MIN_COUNT = float(os.getenv("INSIGHT_MIN_COUNT", "3"))
+INSIGHT_FORGET_COUNT = float(os.getenv("INSIGHT_FORGET_COUNT", "0.5"))
+
+SENTIMENT = "sentiment"
+ACTIVITIES = "activities"
+
+BUILDERS: Dict[str, Callable[..., str]] = {
+    SENTIMENT: sentiment_report,
+    ACTIVITIES: activities_report,
+}
+
+
+def _key(location: str) -> str:
+    return " ".join(location.lower().split())
+
+
+class InsightStore:
+    """
+    Per-location sentiment and activities reports with TTLs and demand tracking.
+
+    Each request bumps the location's request count; a background scheduler
+    pre-refreshes the reports of the most requested locations before they
+    expire, so popular destinations are almost always answered from here.
+    Only locations with a decayed count of at least INSIGHT_MIN_COUNT are
+    kept warm, and counts that decay below INSIGHT_FORGET_COUNT are dropped.
+
+    With several worker processes, reports are also written to the shared
+    store and each worker publishes its request totals and stale locations
+    there. Workers pick up reports they are missing or hold a stale copy
+    of, and the worker running the background refresh folds every worker's
+    requests into its counts and is the only one saving the file.
+    """
+
+    def __init__(self, path: str = INSIGHTS_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, float] = {}
+        self.names: Dict[str, str] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self._pending = set()
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._refresh_thread = None
+        # Undecayed request totals of this process, published for the refreshing
+        # worker, and the totals it last folded in per worker and location
+        self._requests: Dict[str, int] = {}
+        self._seen: Dict[tuple, int] = {}
+        self.load()
+
+    def record_request(self, location: str):
+        key = _key(location)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0.0) + 1
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self.names.setdefault(key, location.strip())
+            self._dirty = True
+
+    def _publish_demand(self):
+        if shared_store() is None:
+            return
+        with self._lock:
+            demand = {
+                'requests': dict(self._requests),
+                'pending': sorted(self._pending),
+                'names': {key: self.names.get(key, key) for key in self._requests},
+            }
+        shared_set("insight_requests", str(os.getpid()), demand, INSIGHT_MAX_AGE)
+
+    def _adopt(self, kind: str, key: str, entry: Dict[str, Any]) -> bool:
+        """Keep a report built by another worker if it is newer than ours."""
+        with self._lock:
+            current = self.entries.get(key, {}).get(kind)
+            if current is not None and current['updated'] >= entry['updated']:
+                return False
+            self.entries.setdefault(key, {})[kind] = {'report': entry['report'], 'updated': entry['updated']}
+            self.names.setdefault(key, entry['name'])
+            self._dirty = True
+        return True
+
+    def sync(self):
+        """Adopt newer reports from the shared store and fold in other workers' requests."""
+        for shared_key, entry in shared_items("insights"):
+            kind, _, key = shared_key.partition(':')
+            self._adopt(kind, key, entry)
+
+        own = str(os.getpid())
+        workers = dict(shared_items("insight_requests"))
+        with self._lock:
+            for worker, demand in workers.items():
+                if worker == own:
+                    continue
+                for key, total in demand['requests'].items():
+                    new = total - self._seen.get((worker, key), 0)
+                    if new > 0:
+                        self.counts[key] = self.counts.get(key, 0.0) + new
+                        self.names.setdefault(key, demand['names'].get(key, key))
+                        self._dirty = True
+                    self._seen[(worker, key)] = total
+                self._pending.update(demand['pending'])
+            # Forget workers that exited
+            self._seen = {seen: total for seen, total in self._seen.items() if seen[0] in workers}
+
+    def get(self, kind: str, location: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored insight if it can be served, counting the request.
+
+        Insights past INSIGHT_TTL are still returned, marked stale, and their
+        location is queued for the next background pass.
+
+        Returns:
+            Optional[dict]: 'report', 'updated' and 'stale', or None if a fresh build is needed
+        """
+        self.record_request(location)
+        key = _key(location)
+        with self._lock:
+            entry = self.entries.get(key, {}).get(kind)
+        if entry is None or time.time() - entry['updated'] > INSIGHT_TTL:
+            # Another worker may have built or refreshed it
+            shared = shared_get("insights", f"{kind}:{key}")
+            if shared is not None and self._adopt(kind, key, shared[0]):
+                entry = self.entries[key][kind]
+
+        with self._lock:
+            age = time.time() - entry['updated'] if entry else None
+            if entry is None or age > INSIGHT_MAX_AGE:
+                self.misses += 1
+                self._publish_demand()
+                return None
+            stale = age > INSIGHT_TTL
+            if stale:
+                self.stale_hits += 1
+                self._pending.add(key)
+            else:
+                self.hits += 1
+                self._pending.discard(key)
+        self._publish_demand()
+        updated = datetime.fromtimestamp(entry['updated'], timezone.utc)
+        return {'report': entry['report'], 'updated': updated.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'stale': stale}
+
+    def put(self, kind: str, location: str, report: str):
+        key = _key(location)
+        entry = {'report': report, 'updated': time.time()}
+        with self._lock:
+            self.entries.setdefault(key, {})[kind] = entry
+            self.names.setdefault(key, location.strip())
+            self._dirty = True
+        shared_set("insights", f"{kind}:{key}", {**entry, 'name': location.strip()}, INSIGHT_MAX_AGE)
+        self.save()
+
+    def build(self, kind: str, location: str,
+              report: Optional[Callable[[float, str], None]] = None) -> str:
+        """Build an insight from a Reddit crawl and store it."""
+        result = BUILDERS[kind](location, report=report)
+        self.put(kind, location, result)
+        return result
+
+    def _due(self, limit: int) -> List[str]:
+        """Queued locations first, then the most requested ones nearing expiry."""
+        now = time.time()
+        with self._lock:
+            seeds = [name.strip() for name in INSIGHT_SEED_LOCATIONS.split(',') if name.strip()]
+            for name in seeds:
+                self.names.setdefault(_key(name), name)
+            popular = sorted((key for key, count in self.counts.items() if count >= INSIGHT_MIN_COUNT),
+                             key=self.counts.get, reverse=True)[:limit]
+            due = []
+            for key in list(self._pending) + [_key(name) for name in seeds] + popular:
+                if key in due:
+                    continue
+                kinds = self.entries.get(key, {})
+                ages = [now - kinds[kind]['updated'] if kind in kinds else float('inf')
+                        for kind in BUILDERS]
+                if max(ages) > INSIGHT_TTL * INSIGHT_REFRESH_AT:
+                    due.append(key)
+            return due[:limit]
+
+    def refresh_once(self, limit: int = INSIGHT_TOP_N) -> int:
+        """
+        Rebuild the insights of up to `limit` due locations.
+
+        Both reports of a location come from one shared Reddit crawl.
+
+        Returns:
+            int: Number of locations refreshed
+        """
+        self.sync()
+        refreshed = 0
+        for key in self._due(limit):
+            location = self.names.get(key, key)
+            try:
+                for kind in BUILDERS:
+                    self.build(kind, location)
+                refreshed += 1
+            except Exception as e:
+                print(f"Insight refresh for {location} failed: {e}")
+            with self._lock:
+                self._pending.discard(key)
+
+        with self._lock:
+            self._decay()
+            self._dirty = True
+        self.refreshed += refreshed
+        self.save()
+        return refreshed
+
+    def _decay(self):
+        # Called with the lock held. Forget locations nobody asks about any
+        # more, and reports too old to be served
+        now = time.time()
+        for key in list(self.counts):
+            self.counts[key] *= INSIGHT_COUNT_DECAY
+            if self.counts[key] < INSIGHT_FORGET_COUNT:
+                del self.counts[key]
+        for key in list(self.entries):
+            kinds = self.entries[key]
+            for kind in [kind for kind, entry in kinds.items() if now - entry['updated'] > INSIGHT_MAX_AGE]:
+                del kinds[kind]
+            if not kinds:
+                del self.entries[key]
+        for key in [key for key in self.names
+                    if key not in self.counts and key not in self.entries and key not in self._pending]:
+            del self.names[key]
+
+    def start_background_refresh(self):
+        """Start the daemon thread that keeps popular destinations warm."""
+        if self._refresh_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh_once()
+                except Exception as e:
+                    print(f"Insight refresh failed: {e}")
+                time.sleep(INSIGHT_REFRESH_INTERVAL)
+
+        self._refresh_thread = threading.Thread(
+            target=run, name="insight-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def save(self):
+        """Persist insights and request counts if they changed since the last save."""
+        if shared_store() is not None and self._refresh_thread is None:
+            # Workers share reports and requests through the shared store,
+            # only the one refreshing them writes the file
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {
+                'entries': self.entries,
+                'counts': self.counts,
+                'names': self.names,
+            }
+            data = json.dumps(snapshot)
+            self._dirty = False
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Jobs can save concurrently, so each thread writes its own temp file
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+    def load(self):
+        """Load previously saved insights, if there are any."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable insight store {self.path}: {e}")
+            return
+
+        with self._lock:
+            self.entries = snapshot.get('entries', {})
+            self.counts = snapshot.get('counts', {})
+            self.names = snapshot.get('names', {})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            top = sorted(self.counts, key=self.counts.get, reverse=True)[:INSIGHT_TOP_N]
+            return {
+                'locations': len(self.entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'background_refreshed': self.refreshed,
+                'pending_refresh': len(self._pending),
+                'top_locations': [self.names.get(key, key) for key in top],
+            }
+
+
+insight_store = InsightStore()
@@ -0,0 +1,244 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from utils.metrics import record_error
+from utils.shared_cache import shared_get, shared_set
+load_dotenv()
+
+
+# Maximum number of background jobs running at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# How long finished jobs are kept for fetching, in seconds
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+# Seconds between progress notifications while a job is awaited
+PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "2"))
+
+# Seconds between polls of the shared store for a job run by another worker
+REMOTE_POLL_INTERVAL = float(os.getenv("JOB_REMOTE_POLL_INTERVAL", "0.5"))
+
+# Shared store namespace of job snapshots
+SHARED_NAMESPACE = "jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """A background task with progress reporting."""
+
+    def __init__(self, kind: str, description: str, expected_seconds: float):
+        self.id = f"{kind}-{uuid.uuid4().hex[:12]}"
+        self.kind = kind
+        self.description = description
+        self.expected_seconds = expected_seconds
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        # Called with the job whenever it changes, to publish it to other workers
+        self.on_update = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def report(self, progress: float, message: Optional[str] = None):
+        """Record progress between 0 and 1, called from inside the job."""
+        self.progress = max(self.progress, min(progress, 1.0))
+        if message:
+            self.message = message
+        if self.on_update is not None:
+            self.on_update(self)
+
+    def estimated_progress(self) -> float:
+        """
+        Reported progress, or an estimate from the elapsed time when the job
+        reports nothing itself. The estimate never reaches 1 before the end.
+        """
+        if self.finished:
+            return 1.0
+        if self.started_at is None:
+            return 0.0
+        elapsed = time.time() - self.started_at
+        estimate = 0.95 * min(elapsed / self.expected_seconds, 1.0)
+        return max(self.progress, estimate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The job's state without its future, for sharing with other workers."""
+        return {key: value for key, value in vars(self).items()
+                if key not in ('future', 'on_update')}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "Job":
+        """Rebuild a job run by another worker. It has no future to wait on."""
+        job = cls.__new__(cls)
+        vars(job).update(snapshot, future=None, on_update=None)
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'status': self.status,
+            'progress': round(self.estimated_progress(), 2),
+            'message': self.message,
+            'elapsed_seconds': round((self.finished_at or time.time()) - (self.started_at or self.created_at), 1),
+        }
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.status == FAILED:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps them around for JOB_TTL.
+
+    When worker processes share a store, every state change of a job is
+    published there, so its status can be fetched and awaited from any
+    worker, not only the one running it.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: int = JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def _publish(self, job: Job):
+        shared_set(SHARED_NAMESPACE, job.id, job.snapshot(), self.ttl)
+
+    def submit(
+        self,
+        kind: str,
+        description: str,
+        fn: Callable[[Job], Any],
+        expected_seconds: float = 120
+    ) -> Job:
+        """
+        Start `fn(job)` in the background and return its job right away.
+
+        Args:
+            kind (str): Job type, used as the job id prefix
+            description (str): What the job does, shown in its status
+            fn (Callable): Work to run, receives the job to report progress on
+            expected_seconds (float, optional): Typical runtime, used to estimate progress
+
+        Returns:
+            Job: The queued job
+        """
+        self._purge()
+        job = Job(kind, description, expected_seconds)
+        job.on_update = self._publish
+
+        def run():
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.message = "Running"
+            self._publish(job)
+            try:
+                job.result = fn(job)
+                job.status = DONE
+                job.message = "Finished"
+            except Exception as e:
+                record_error(e)
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = FAILED
+                job.message = "Failed"
+            finally:
+                job.finished_at = time.time()
+                self._publish(job)
+
+        with self._lock:
+            self._jobs[job.id] = job
+        self._publish(job)
+        # Keep the caller's context so the job's metrics are attributed to its tool
+        job.future = self._executor.submit(contextvars.copy_context().run, run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            shared = shared_get(SHARED_NAMESPACE, job_id)
+            if shared is not None:
+                job = Job.from_snapshot(shared[0])
+        return job
+
+    async def wait(self, job: Job, timeout: float, ctx=None) -> Job:
+        """
+        Wait for a job without blocking the event loop.
+
+        While waiting, a progress notification is sent through the MCP
+        context every PROGRESS_INTERVAL seconds, if the caller asked for
+        progress.
+
+        Args:
+            job (Job): The job to wait for
+            timeout (float): Maximum seconds to wait
+            ctx (Context, optional): MCP request context used for progress notifications
+
+        Returns:
+            Job: The job, finished or still running when the timeout expired
+        """
+        deadline = time.monotonic() + timeout
+        wrapped = asyncio.wrap_future(job.future) if job.future is not None else None
+        while not job.finished:
+            if ctx is not None:
+                try:
+                    await ctx.report_progress(job.estimated_progress(), 1.0)
+                except Exception as e:
+                    print(f"Couldn't send progress for {job.id}: {e}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if wrapped is None:
+                # Run by another worker, follow it through the shared store
+                polls_until = time.monotonic() + min(PROGRESS_INTERVAL, remaining)
+                while not job.finished and time.monotonic() < polls_until:
+                    await asyncio.sleep(REMOTE_POLL_INTERVAL)
+                    job = self.get(job.id) or job
+                continue
+            try:
+                await asyncio.wait_for(asyncio.shield(wrapped), min(PROGRESS_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+        if job.finished and ctx is not None:
+            try:
+                await ctx.report_progress(1.0, 1.0)
+            except Exception:
+                pass
+        return job
+
+
+job_manager = JobManager()
@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# SQLite database holding the scraped destination content
+KNOWLEDGE_DB_PATH = os.getenv("KNOWLEDGE_DB_PATH", "data/knowledge.db")
+
+# Scraped text is indexed in passages of about this many characters
+PASSAGE_CHARS = int(os.getenv("KNOWLEDGE_PASSAGE_CHARS", "800"))
+
+# Words too common to help ranking a question
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'at', 'be', 'can', 'do', 'does', 'for', 'from',
+    'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'should',
+    'the', 'there', 'to', 'what', 'when', 'where', 'which', 'who', 'why',
+    'with', 'you', 'any', 'good', 'best', 'about',
+}
+
+
+def _location_key(location: str) -> str:
+    return " ".join(re.findall(r"\w+", location.lower()))
+
+
+def split_passages(text: str, size: int = PASSAGE_CHARS) -> List[str]:
+    """Split text into passages of about `size` characters on sentence boundaries."""
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    passages = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + len(sentence) + 1 > size:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+        # A single overlong sentence is cut hard
+        while len(current) > size * 2:
+            passages.append(current[:size])
+            current = current[size:]
+    if current:
+        passages.append(current)
+    return passages
+
+
+def match_query(question: str) -> Optional[str]:
+    """Turn a free text question into an FTS5 OR query of its meaningful words."""
+    terms = [term for term in re.findall(r"\w+", question.lower())
+             if term not in STOPWORDS and len(term) > 1]
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+class KnowledgeIndex:
+    """
+    Full-text index of scraped destination content in SQLite FTS5.
+
+    Every crawled thread is split into passages stored with its location,
+    source URL, title and crawl time. Re-indexing a URL replaces its
+    passages, so repeated crawls keep a single copy of each thread.
+    """
+
+    def __init__(self, path: str = KNOWLEDGE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.queries = 0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                "location, title, text, url UNINDEXED, crawled_at UNINDEXED, "
+                "tokenize = 'porter unicode61')")
+
+    def add_threads(self, location: str, threads: List[Dict[str, str]],
+                    crawled_at: Optional[float] = None) -> int:
+        """
+        Index the cleaned threads of a crawl.
+
+        Args:
+            location (str): Location the threads were crawled for
+            threads (list): Threads with 'url', 'title' and 'text'
+            crawled_at (float, optional): Crawl time as a Unix timestamp
+
+        Returns:
+            int: Number of passages indexed
+        """
+        location = _location_key(location)
+        crawled_at = crawled_at or time.time()
+        rows = []
+        urls = set()
+        for thread in threads:
+            url = thread.get('url', '')
+            urls.add(url)
+            for passage in split_passages(thread.get('text', '')):
+                rows.append((location, thread.get('title', ''), passage, url, crawled_at))
+
+        with self._lock, self._conn:
+            for url in urls:
+                self._conn.execute(
+                    "DELETE FROM passages WHERE location = ? AND url = ?", (location, url))
+            self._conn.executemany(
+                "INSERT INTO passages (location, title, text, url, crawled_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def search(self, location: str, question: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Find the passages about a location that best match a question.
+
+        Returns:
+            list: Passages with 'text', 'title', 'url', 'crawled_at' and 'score', best first
+        """
+        query = match_query(question)
+        location = _location_key(location)
+        if query is None or not location:
+            return []
+
+        location_phrase = '"' + location + '"'
+        with self._lock:
+            self.queries += 1
+            rows = self._conn.execute(
+                "SELECT text, title, url, crawled_at, bm25(passages, 0.0, 2.0, 1.0) AS score "
+                "FROM passages WHERE passages MATCH ? ORDER BY score LIMIT ?",
+                (f"location : {location_phrase} AND ({query})", limit)).fetchall()
+
+        return [{
+            'text': text,
+            'title': title,
+            'url': url,
+            'crawled_at': datetime.fromtimestamp(crawled_at, timezone.utc).strftime("%Y-%m-%d"),
+            'score': round(-score, 3),
+        } for text, title, url, crawled_at, score in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            passages, locations = self._conn.execute(
+                "SELECT count(*), count(DISTINCT location) FROM passages").fetchone()
+        return {'passages': passages, 'locations': locations, 'queries': self.queries}
+
+
+knowledge_index = KnowledgeIndex()
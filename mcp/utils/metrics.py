@@ -0,0 +1,317 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.shared_cache import shared_items, shared_set
+load_dotenv()
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Seconds between publications of each worker's metrics to the shared
+# store, which /metrics reads to report every worker
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+# Label used for work that doesn't run inside a tool call, e.g. background refreshes
+NO_TOOL = "background"
+
+current_tool: ContextVar[str] = ContextVar("current_tool", default=NO_TOOL)
+
+# Outcome of the running tool call. A dict rather than a flag, so errors
+# recorded in copied contexts (worker threads, fan-outs) reach the call
+current_call: ContextVar[Optional[Dict[str, bool]]] = ContextVar("current_call", default=None)
+
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Wrap fn to run in a copy of the caller's context, for executor fan-outs.
+
+    ThreadPoolExecutor doesn't carry context variables into its threads, so
+    without this the upstream, cache and error metrics recorded by the
+    workers would be labelled NO_TOOL instead of the calling tool.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+
+class Registry:
+    """Thread-safe store of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = defaultdict(
+            lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], Histogram]] = defaultdict(dict)
+        self.help: Dict[str, str] = {}
+        self.gauge_sources: List[Callable[[], Dict[str, Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1, help: str = ""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.counters[name][key] += value
+            if help:
+                self.help.setdefault(name, help)
+
+    def observe(self, name: str, labels: Dict[str, str], value: float, help: str = ""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(value)
+            if help:
+                self.help.setdefault(name, help)
+
+    def add_gauges(self, source: Callable[[], Dict[str, Dict[Tuple[Tuple[str, str], ...], float]]]):
+        """Register a callable returning {metric: {labels: value}} read at scrape time."""
+        self.gauge_sources.append(source)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of every counter, histogram and gauge, to render or publish to the shared store."""
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {}
+            for name, series in self.histograms.items():
+                histograms[name] = {}
+                for key, histogram in series.items():
+                    copy = histograms[name][key] = Histogram(histogram.buckets)
+                    copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+            help = dict(self.help)
+
+        gauges = {}
+        for source in self.gauge_sources:
+            try:
+                gauges.update(source())
+            except Exception as e:
+                print(f"Metric source failed: {e}")
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges, 'help': help}
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        return render_snapshots({None: self.snapshot()})
+
+
+def _labels(key, *extra: Tuple[str, str]) -> str:
+    pairs = list(key) + [pair for pair in extra if pair]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_snapshots(snapshots: Dict[Optional[str], Dict[str, Any]]) -> str:
+    """
+    Render registry snapshots in the Prometheus text exposition format.
+
+    Snapshots are keyed by worker. Their series get a 'worker' label,
+    unless the key is None, and each metric is declared once.
+    """
+    def series(kind):
+        merged = defaultdict(list)
+        for worker, snapshot in sorted(snapshots.items(), key=lambda item: str(item[0])):
+            worker_label = ('worker', worker) if worker is not None else None
+            for name, values in snapshot[kind].items():
+                for key, value in sorted(values.items()):
+                    merged[name].append((key, worker_label, value))
+        return sorted(merged.items())
+
+    help = {}
+    for snapshot in snapshots.values():
+        help.update(snapshot['help'])
+
+    lines = []
+    for name, values in series('counters'):
+        if name in help:
+            lines.append(f"# HELP {name} {help[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for key, worker, value in values:
+            lines.append(f"{name}{_labels(key, worker)} {value:g}")
+
+    for name, values in series('histograms'):
+        if name in help:
+            lines.append(f"# HELP {name} {help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, worker, histogram in values:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(key, worker, ('le', f'{bound:g}'))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(key, worker, ('le', '+Inf'))} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(key, worker)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(key, worker)} {histogram.count}")
+
+    for name, values in series('gauges'):
+        lines.append(f"# TYPE {name} gauge")
+        for key, worker, value in values:
+            lines.append(f"{name}{_labels(key, worker)} {value:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Name of this worker process when several share the port, set by publish_worker_metrics
+_worker: Optional[str] = None
+
+
+def _publish():
+    shared_set("metrics", _worker, registry.snapshot(), METRICS_PUBLISH_INTERVAL * 3)
+
+
+def publish_worker_metrics(worker: str):
+    """
+    Publish this worker's metrics to the shared store every
+    METRICS_PUBLISH_INTERVAL seconds, so render_metrics reports all workers.
+    """
+    global _worker
+    if _worker is not None:
+        return
+    _worker = worker
+
+    def run():
+        while True:
+            _publish()
+            time.sleep(METRICS_PUBLISH_INTERVAL)
+
+    threading.Thread(target=run, name="metrics-publish", daemon=True).start()
+
+
+def render_metrics() -> str:
+    """
+    The metrics for a /metrics scrape.
+
+    With several workers every worker's series are reported, labelled with
+    the worker, whichever worker answers the scrape. Each worker's counters
+    only go up, so rate() works across scrapes.
+    """
+    if _worker is None:
+        return registry.render()
+    _publish()
+    snapshots = dict(shared_items("metrics"))
+    snapshots[_worker] = registry.snapshot()
+    return render_snapshots(snapshots)
+
+
+def record_upstream(host: str, status: str, nbytes: int = 0):
+    """
+    Record one upstream HTTP call, attributed to the tool being run.
+
+    Args:
+        host (str): Upstream host name
+        status (str): HTTP status code, or the exception name if no response came back
+        nbytes (int, optional): Size of the response body
+    """
+    labels = {'tool': current_tool.get(), 'host': host}
+    registry.inc("travelgenie_upstream_requests_total", {**labels, 'status': str(status)},
+                 help="Upstream HTTP requests by tool, host and status code")
+    if nbytes:
+        registry.inc("travelgenie_upstream_bytes_total", labels, nbytes,
+                     help="Upstream response bytes by tool and host")
+
+
+def record_cache(cache: str, hit: bool):
+    registry.inc("travelgenie_cache_lookups_total",
+                 {'tool': current_tool.get(), 'cache': cache, 'result': 'hit' if hit else 'miss'},
+                 help="Cache lookups by tool, cache and result")
+
+
+def record_error(error: BaseException):
+    """Record an error handled inside a tool, by exception type, and fail the tool call."""
+    call = current_call.get()
+    if call is not None:
+        call['error'] = True
+    registry.inc("travelgenie_tool_errors_total",
+                 {'tool': current_tool.get(), 'type': type(error).__name__},
+                 help="Tool errors by exception type")
+
+
+def _finish(name: str, started: float, call: Dict[str, bool]):
+    status = "error" if call['error'] else "ok"
+    registry.inc("travelgenie_tool_calls_total", {'tool': name, 'status': status},
+                 help="Tool calls by outcome")
+    registry.observe("travelgenie_tool_latency_seconds", {'tool': name},
+                     time.perf_counter() - started, help="Tool latency")
+
+
+def instrument(fn: Callable) -> Callable:
+    """
+    Record call counts, latency and errors of an MCP tool.
+
+    Upstream requests, cache lookups and handled errors made while the tool
+    runs are attributed to it through the current_tool context variable. A
+    call counts as an error if it raises or records an error with
+    record_error, as tools that answer with an error message do.
+    The wrapper keeps the tool's signature, so FastMCP sees the same
+    parameters and docstring.
+    """
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            token = current_tool.set(name)
+            call = {'error': False}
+            call_token = current_call.set(call)
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                record_error(e)
+                raise
+            finally:
+                _finish(name, started, call)
+                current_call.reset(call_token)
+                current_tool.reset(token)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = current_tool.set(name)
+        call = {'error': False}
+        call_token = current_call.set(call)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            record_error(e)
+            raise
+        finally:
+            _finish(name, started, call)
+            current_call.reset(call_token)
+            current_tool.reset(token)
+    return wrapper
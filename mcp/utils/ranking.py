@@ -0,0 +1,304 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from utils.flights import offer_price
+from utils.hotels import hotel_price
+
+
+# Criteria and whether a higher value is better
+CRITERIA = {
+    'price': False,
+    'duration': False,
+    'stops': False,
+    'departure': False,
+    'rating': True,
+}
+
+DEFAULT_FLIGHT_WEIGHTS = {'price': 0.6, 'duration': 0.25, 'stops': 0.15}
+DEFAULT_HOTEL_WEIGHTS = {'price': 0.7, 'rating': 0.3}
+
+# Rows checked at once when computing the Pareto frontier
+PARETO_CHUNK = 128
+
+
+class OfferTable:
+    """
+    Offers normalized into one float64 array per criterion.
+
+    `items` holds the compact description of each offer that is returned to
+    the caller; row i of every column belongs to items[i]. Missing values
+    are NaN.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], items: List[Dict[str, Any]]):
+        self.columns = columns
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def flight_table(offers: List[Dict[str, Any]]) -> OfferTable:
+    """
+    Normalize Booking.com `flightOffers` into columnar arrays.
+
+    Columns are price, duration (minutes), stops and departure (hour of day).
+
+    Args:
+        offers (list): Raw flight offers from the search response
+
+    Returns:
+        OfferTable: The columns and a compact summary of every priced offer
+    """
+    n = len(offers)
+    price = np.full(n, np.nan)
+    duration = np.full(n, np.nan)
+    stops = np.full(n, np.nan)
+    departure = np.full(n, np.nan)
+    items = []
+
+    row = 0
+    for offer in offers:
+        segments = offer.get('segments') or []
+        amount = offer_price(offer)
+        if not segments or amount is None:
+            continue
+
+        segment = segments[0]
+        legs = segment.get('legs', [])
+        depart_at = _parse_time(segment.get('departureTime'))
+        arrive_at = _parse_time(segment.get('arrivalTime'))
+
+        price[row] = amount
+        stops[row] = max(len(legs) - 1, 0)
+        if segment.get('totalTime') is not None:
+            duration[row] = segment['totalTime'] / 60
+        elif depart_at and arrive_at:
+            duration[row] = (arrive_at - depart_at).total_seconds() / 60
+        if depart_at:
+            departure[row] = depart_at.hour + depart_at.minute / 60
+
+        carriers = []
+        for leg in legs:
+            for carrier in leg.get('carriersData', []):
+                if carrier.get('name') and carrier['name'] not in carriers:
+                    carriers.append(carrier['name'])
+
+        items.append({
+            'price': round(amount, 2),
+            'currency': offer['priceBreakdown']['total'].get('currencyCode'),
+            'departure': segment.get('departureTime'),
+            'arrival': segment.get('arrivalTime'),
+            'duration_minutes': None if np.isnan(duration[row]) else int(duration[row]),
+            'stops': int(stops[row]),
+            'carriers': carriers,
+        })
+        row += 1
+
+    columns = {
+        'price': price[:row],
+        'duration': duration[:row],
+        'stops': stops[:row],
+        'departure': departure[:row],
+    }
+    return OfferTable(columns, items)
+
+
+def hotel_table(hotels: List[Dict[str, Any]], nights: int = 1) -> OfferTable:
+    """
+    Normalize Booking.com hotel `results` into columnar arrays.
+
+    Columns are price (total stay) and rating (review score).
+
+    Args:
+        hotels (list): Raw hotel results from the search response
+        nights (int, optional): Length of the stay, used for the nightly price
+
+    Returns:
+        OfferTable: The columns and a compact summary of every priced hotel
+    """
+    n = len(hotels)
+    price = np.full(n, np.nan)
+    rating = np.full(n, np.nan)
+    items = []
+
+    row = 0
+    for hotel in hotels:
+        amount = hotel_price(hotel)
+        if amount is None:
+            continue
+
+        price[row] = amount['value']
+        if hotel.get('reviewScore') is not None:
+            rating[row] = hotel['reviewScore']
+
+        items.append({
+            'name': hotel.get('name'),
+            'total_price': round(amount['value'], 2),
+            'price_per_night': round(amount['value'] / max(nights, 1), 2),
+            'currency': amount['currency'],
+            'review_score': hotel.get('reviewScore'),
+            'checkinDate': hotel.get('checkinDate'),
+            'checkoutDate': hotel.get('checkoutDate'),
+        })
+        row += 1
+
+    return OfferTable({'price': price[:row], 'rating': rating[:row]}, items)
+
+
+def _cost_column(values: np.ndarray, higher_is_better: bool) -> np.ndarray:
+    """Min-max scale a column to [0, 1] where 0 is best and missing values are worst."""
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.zeros_like(values)
+
+    low = values[finite].min()
+    high = values[finite].max()
+    span = high - low
+    if span == 0:
+        scaled = np.zeros_like(values)
+    elif higher_is_better:
+        scaled = (high - values) / span
+    else:
+        scaled = (values - low) / span
+    return np.where(finite, scaled, 1.0)
+
+
+def cost_matrix(
+    table: OfferTable,
+    criteria: List[str],
+    preferred_departure_hour: Optional[float] = None
+) -> np.ndarray:
+    """
+    Stack the requested criteria into an (offers, criteria) cost matrix in [0, 1].
+
+    The departure criterion is the circular distance in hours from the
+    preferred departure hour, so it is only meaningful when one is given.
+    """
+    columns = []
+    for name in criteria:
+        values = table.columns[name]
+        if name == 'departure':
+            if preferred_departure_hour is None:
+                values = np.zeros_like(values)
+            else:
+                distance = np.abs(values - preferred_departure_hour) % 24
+                values = np.minimum(distance, 24 - distance)
+        columns.append(_cost_column(values, CRITERIA[name]))
+    return np.column_stack(columns) if columns else np.zeros((len(table), 0))
+
+
+def _dominated(points: np.ndarray, by: np.ndarray) -> np.ndarray:
+    """For each row of points, whether some row of `by` dominates it."""
+    if by.shape[0] == 0:
+        return np.zeros(points.shape[0], dtype=bool)
+    # (points, by, criteria) comparison
+    no_worse = (by[None, :, :] <= points[:, None, :]).all(axis=2)
+    better = (by[None, :, :] < points[:, None, :]).any(axis=2)
+    return (no_worse & better).any(axis=1)
+
+
+def pareto_mask(costs: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the rows on the Pareto frontier of a cost matrix.
+
+    A row is dominated when another row is no worse on every criterion and
+    strictly better on at least one. Any dominating row has a strictly
+    smaller cost sum, so rows are visited in order of their sum and each
+    chunk only needs to be checked against itself and the frontier found so
+    far, which is usually far smaller than the full set of offers.
+    """
+    n = costs.shape[0]
+    mask = np.zeros(n, dtype=bool)
+    order = np.argsort(costs.sum(axis=1), kind='stable')
+    frontier = costs[:0]
+
+    for start in range(0, n, PARETO_CHUNK):
+        rows = order[start:start + PARETO_CHUNK]
+        # Cheap check against the frontier first, then only the rows that
+        # survive it are compared with each other
+        rows = rows[~_dominated(costs[rows], frontier)]
+        chunk = costs[rows]
+        survivors = rows[~_dominated(chunk, chunk)]
+        mask[survivors] = True
+        frontier = np.vstack([frontier, costs[survivors]])
+    return mask
+
+
+def rank_offers(
+    table: OfferTable,
+    weights: Dict[str, float],
+    top_n: int = 5,
+    pareto_only: bool = False,
+    preferred_departure_hour: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Score offers with a weighted sum of normalized costs and return the best N.
+
+    Args:
+        table (OfferTable): Offers to rank
+        weights (dict): Weight per criterion, e.g. {'price': 0.7, 'duration': 0.3}
+        top_n (int, optional): Number of offers to return. Defaults to 5
+        pareto_only (bool, optional): Only consider offers on the Pareto frontier
+        preferred_departure_hour (float, optional): Hour of day the traveller prefers to leave
+
+    Returns:
+        dict: The ranked 'offers' (each with 'rank', 'score' and 'pareto'),
+              'total_offers', 'pareto_size' and 'ranking_ms'
+
+    Raises:
+        ValueError: If a weight names a criterion the table does not have
+    """
+    start = time.perf_counter()
+
+    unknown = [name for name in weights if name not in table.columns]
+    if unknown:
+        raise ValueError(
+            f"Unknown criteria {unknown}, expected some of {list(table.columns)}")
+
+    criteria = [name for name, weight in weights.items() if weight > 0]
+    if not criteria:
+        raise ValueError("At least one criterion needs a positive weight")
+
+    if len(table) == 0:
+        return {'offers': [], 'total_offers': 0, 'pareto_size': 0, 'ranking_ms': 0.0}
+
+    costs = cost_matrix(table, criteria, preferred_departure_hour)
+    weight_vector = np.array([weights[name] for name in criteria], dtype=float)
+    scores = costs @ (weight_vector / weight_vector.sum())
+
+    on_frontier = pareto_mask(costs)
+    candidates = np.flatnonzero(on_frontier) if pareto_only else np.arange(len(table))
+
+    # argpartition keeps selection O(n), only the top N are fully sorted
+    top_n = max(1, min(top_n, len(candidates)))
+    best = candidates[np.argpartition(scores[candidates], top_n - 1)[:top_n]]
+    best = best[np.argsort(scores[best], kind='stable')]
+
+    offers = []
+    for rank, index in enumerate(best, start=1):
+        offers.append({
+            'rank': rank,
+            'score': round(float(scores[index]), 4),
+            'pareto': bool(on_frontier[index]),
+            **table.items[index]
+        })
+
+    return {
+        'offers': offers,
+        'total_offers': len(table),
+        'pareto_size': int(on_frontier.sum()),
+        'ranking_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
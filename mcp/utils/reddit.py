@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from utils.brightdata import activities_prompt, ask_agent, crawl_prompt, sentiment_prompt
+from utils.cache import TTLCache
+from utils.gateway import SingleFlight
+from utils.knowledge import knowledge_index
+load_dotenv()
+
+
+# How long a crawled Reddit corpus is reused for new reports, in seconds
+CRAWL_TTL = int(os.getenv("REDDIT_CRAWL_TTL", "21600"))
+
+# Upper bound on the corpus text handed to the model for one report
+CORPUS_MAX_CHARS = int(os.getenv("REDDIT_CORPUS_MAX_CHARS", "60000"))
+
+_corpora = TTLCache("reddit_corpus", CRAWL_TTL, max_entries=200)
+_crawls = SingleFlight()
+
+
+def _crawl_key(location: str, subreddit: Optional[str], max_posts: int, time_filter: str) -> str:
+    return json.dumps([location.strip().lower(), (subreddit or '').lower(), max_posts, time_filter])
+
+
+def _clean_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def parse_threads(reply: str) -> List[Dict[str, str]]:
+    """
+    Pull the thread list out of the agent's crawl reply.
+
+    The reply should be a JSON array, possibly wrapped in a code fence or
+    surrounded by prose. If no array can be parsed, the whole reply is kept
+    as a single document so the crawl is never wasted.
+    """
+    match = re.search(r"\[.*\]", reply, re.DOTALL)
+    if match:
+        try:
+            threads = json.loads(match.group(0))
+        except ValueError:
+            threads = None
+        if isinstance(threads, list):
+            cleaned = []
+            for thread in threads:
+                if not isinstance(thread, dict):
+                    continue
+                text = _clean_text(thread.get('text', ''))
+                if text:
+                    cleaned.append({'url': thread.get('url', ''),
+                                    'title': _clean_text(thread.get('title', '')),
+                                    'text': text})
+            if cleaned:
+                return cleaned
+    return [{'url': '', 'title': '', 'text': _clean_text(reply)}]
+
+
+def crawl_location(
+    location: str,
+    subreddit: Optional[str] = None,
+    max_posts: int = 100,
+    time_filter: str = "month",
+    on_progress: Optional[Callable[[str], None]] = None
+) -> Dict[str, Any]:
+    """
+    Crawl Reddit threads about a location once and keep the cleaned text.
+
+    Corpora are cached for CRAWL_TTL and concurrent crawls of the same
+    location are coalesced, so a sentiment report and an activities list
+    requested together share one Bright Data crawl. The threads are also
+    added to the local knowledge index for follow-up questions.
+
+    Args:
+        on_progress (Callable, optional): Told about each step of the crawl,
+                                          if this call is the one doing it
+
+    Returns:
+        dict: 'location', 'threads' (url, title, text) and 'fetched_at'
+    """
+    key = _crawl_key(location, subreddit, max_posts, time_filter)
+    corpus = _corpora.get(key)
+    if corpus is not None:
+        return corpus
+
+    def crawl():
+        cached = _corpora.get(key)
+        if cached is not None:
+            return cached
+        reply = ask_agent(crawl_prompt(location, subreddit, max_posts, time_filter), on_progress)
+        crawled = {'location': location, 'threads': parse_threads(reply),
+                   'fetched_at': time.time()}
+        _corpora.set(key, crawled)
+        try:
+            knowledge_index.add_threads(location, crawled['threads'], crawled['fetched_at'])
+        except Exception as e:
+            print(f"Couldn't index Reddit threads for {location}: {e}")
+        return crawled
+
+    return _crawls.do(key, crawl)
+
+
+def corpus_text(corpus: Dict[str, Any], max_chars: int = CORPUS_MAX_CHARS) -> str:
+    """Render the threads as prompt text, cut to max_chars."""
+    parts = []
+    size = 0
+    for thread in corpus['threads']:
+        part = f"## {thread['title'] or 'Thread'}\nURL: {thread['url'] or 'unknown'}\n{thread['text']}\n"
+        if size + len(part) > max_chars:
+            parts.append(part[:max(max_chars - size, 0)])
+            break
+        parts.append(part)
+        size += len(part)
+    return "\n".join(parts)
+
+
+def _report(
+    prompt: Callable[[str, str], str],
+    location: str,
+    report: Optional[Callable[[float, str], None]],
+    **crawl_options
+) -> str:
+    if report:
+        report(0.05, "Crawling Reddit threads")
+    corpus = crawl_location(location, **crawl_options,
+                            on_progress=(lambda step: report(0.05, step)) if report else None)
+    if report:
+        report(0.7, f"Analyzing {len(corpus['threads'])} Reddit threads")
+    return ask_agent(prompt(location, corpus_text(corpus)),
+                     (lambda step: report(0.7, step)) if report else None)
+
+
+def sentiment_report(location: str, report: Optional[Callable[[float, str], None]] = None) -> str:
+    """
+    Summarize public sentiment about a location from the shared Reddit crawl.
+
+    Args:
+        location (str): The location to report on (eg. Dublin)
+        report (Callable, optional): Progress callback taking a fraction and a message
+
+    Returns:
+        str: Sentiment report
+    """
+    return _report(sentiment_prompt, location, report)
+
+
+def activities_report(
+    location: str,
+    subreddit: Optional[str] = None,
+    max_posts: int = 100,
+    time_filter: str = "month",
+    report: Optional[Callable[[float, str], None]] = None
+) -> str:
+    """
+    List things to do in a location from the shared Reddit crawl.
+
+    Args:
+        location (str): The location to report on (eg. Dublin)
+        subreddit (str, optional): Subreddit to focus the crawl on
+        max_posts (int, optional): Maximum number of threads to crawl
+        time_filter (str, optional): Time period of the threads ("day", "week", "month", "year", "all")
+        report (Callable, optional): Progress callback taking a fraction and a message
+
+    Returns:
+        str: Activities summary with source URLs
+    """
+    return _report(activities_prompt, location, report, subreddit=subreddit,
+                   max_posts=max_posts, time_filter=time_filter)
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {
+        'corpus_cache': _corpora.stats(),
+        'coalesced_crawls': _crawls.coalesced,
+    }
@@ -0,0 +1,296 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.flights import CALENDAR_CONCURRENCY, cheapest_offer, fetch_flight_offers, offer_price
+from utils.metrics import in_context
+load_dotenv()
+
+
+# Largest number of cities solved exactly; above this a heuristic is used
+EXACT_MAX_CITIES = int(os.getenv("ROUTE_EXACT_MAX_CITIES", "6"))
+
+# Hard limits that keep one optimization from draining the RapidAPI quota
+MAX_CITIES = int(os.getenv("ROUTE_MAX_CITIES", "8"))
+MAX_ROUTE_SEARCHES = int(os.getenv("ROUTE_MAX_SEARCHES", "200"))
+
+
+class PriceMatrix:
+    """
+    Lazily filled (origin, destination, date) -> cheapest fare matrix.
+
+    Missing cells are fetched concurrently through the flight search cache.
+    A route without any priced offer, or whose search failed, costs infinity.
+    """
+
+    def __init__(
+        self,
+        adults: int = 1,
+        children_ages: Optional[List[int]] = None,
+        cabin_class: str = "ECONOMY",
+        max_workers: int = CALENDAR_CONCURRENCY,
+        max_searches: int = MAX_ROUTE_SEARCHES
+    ):
+        self.adults = adults
+        self.children_ages = children_ages
+        self.cabin_class = cabin_class
+        self.max_workers = max_workers
+        self.max_searches = max_searches
+        self.currency = None
+        self.stale = False
+        self.failed = 0
+        self._prices: Dict[Tuple[str, str, str], float] = {}
+
+    @property
+    def searches(self) -> int:
+        return len(self._prices)
+
+    def _search(self, cell: Tuple[str, str, str]) -> float:
+        origin, destination, day = cell
+        try:
+            result = fetch_flight_offers(origin, destination, day, self.adults,
+                                         self.children_ages, self.cabin_class)
+        except Exception as e:
+            print(f"Route search {origin}->{destination} on {day} failed: {e}")
+            self.failed += 1
+            return math.inf
+
+        self.stale = self.stale or result.stale
+        offer = cheapest_offer(result.data.get('flightOffers', []))
+        if offer is None:
+            return math.inf
+        self.currency = self.currency or offer['priceBreakdown']['total'].get(
+            'currencyCode')
+        return offer_price(offer)
+
+    def prefetch(self, cells: List[Tuple[str, str, str]]):
+        """
+        Fetch every missing cell concurrently.
+
+        Raises:
+            ValueError: If the cells would exceed the search budget
+        """
+        missing = list(dict.fromkeys(
+            cell for cell in cells if cell not in self._prices))
+        if not missing:
+            return
+        if self.searches + len(missing) > self.max_searches:
+            raise ValueError(
+                f"Route needs more than {self.max_searches} flight searches, use fewer cities")
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            for cell, price in zip(missing, executor.map(in_context(self._search), missing)):
+                self._prices[cell] = price
+
+    def price(self, origin: str, destination: str, day: str) -> float:
+        cell = (origin, destination, day)
+        if cell not in self._prices:
+            self.prefetch([cell])
+        return self._prices[cell]
+
+
+def _leg_dates(start_date: str, legs: int, nights_per_city: int) -> List[str]:
+    first_day = date.fromisoformat(start_date)
+    return [(first_day + timedelta(days=leg * nights_per_city)).isoformat()
+            for leg in range(legs)]
+
+
+def _route_cost(
+    matrix: PriceMatrix,
+    home: str,
+    order: List[str],
+    dates: List[str],
+    return_home: bool
+) -> float:
+    stops = [home] + order + ([home] if return_home else [])
+    return sum(matrix.price(stops[leg], stops[leg + 1], dates[leg])
+               for leg in range(len(stops) - 1))
+
+
+def solve_exact(
+    matrix: PriceMatrix,
+    home: str,
+    cities: List[str],
+    dates: List[str],
+    return_home: bool
+) -> Tuple[float, List[str]]:
+    """
+    Held-Karp dynamic program over (visited set, last city).
+
+    Leg k always departs on dates[k] because every city is stayed in for the
+    same number of nights, so the date of the next leg only depends on how
+    many cities have been visited, which is the size of the visited set.
+    """
+    n = len(cities)
+    best: Dict[Tuple[int, int], Tuple[float, Optional[int]]] = {}
+
+    for city in range(n):
+        best[(1 << city, city)] = (matrix.price(home, cities[city], dates[0]), None)
+
+    for mask in range(1, 1 << n):
+        leg = bin(mask).count("1")
+        if leg == n:
+            continue
+        for last in range(n):
+            state = best.get((mask, last))
+            if state is None or not (mask >> last) & 1:
+                continue
+            for city in range(n):
+                if (mask >> city) & 1:
+                    continue
+                cost = state[0] + matrix.price(cities[last], cities[city], dates[leg])
+                key = (mask | (1 << city), city)
+                if key not in best or cost < best[key][0]:
+                    best[key] = (cost, last)
+
+    full = (1 << n) - 1
+    total, last = math.inf, None
+    for city in range(n):
+        cost = best[(full, city)][0]
+        if return_home:
+            cost += matrix.price(cities[city], home, dates[n])
+        if cost < total:
+            total, last = cost, city
+
+    # Walk the predecessors back to rebuild the order
+    order = []
+    mask = full
+    while last is not None:
+        order.append(cities[last])
+        previous = best[(mask, last)][1]
+        mask ^= 1 << last
+        last = previous
+    return total, order[::-1]
+
+
+def solve_heuristic(
+    matrix: PriceMatrix,
+    home: str,
+    cities: List[str],
+    dates: List[str],
+    return_home: bool
+) -> Tuple[float, List[str]]:
+    """
+    Greedy nearest-neighbour construction followed by adjacent-swap local search.
+
+    Prices are fetched lazily, one batch per greedy step, so only a small
+    part of the full city x city x date matrix is ever searched.
+    """
+    order = []
+    remaining = list(cities)
+    current = home
+    while remaining:
+        day = dates[len(order)]
+        matrix.prefetch([(current, city, day) for city in remaining])
+        current = min(remaining, key=lambda city: matrix.price(current, city, day))
+        order.append(current)
+        remaining.remove(current)
+
+    total = _route_cost(matrix, home, order, dates, return_home)
+    improved = True
+    while improved:
+        improved = False
+        for index in range(len(order) - 1):
+            candidate = list(order)
+            candidate[index], candidate[index + 1] = candidate[index + 1], candidate[index]
+            try:
+                cost = _route_cost(matrix, home, candidate, dates, return_home)
+            except ValueError:
+                # Search budget spent, keep the best order found so far
+                return total, order
+            if cost < total:
+                order, total = candidate, cost
+                improved = True
+    return total, order
+
+
+def optimize_route(
+    home: str,
+    cities: List[str],
+    start_date: str,
+    nights_per_city: int,
+    return_home: bool = True,
+    adults: int = 1,
+    children_ages: Optional[List[int]] = None,
+    cabin_class: str = "ECONOMY"
+) -> Dict[str, Any]:
+    """
+    Find the cheapest order to visit a set of cities, starting from home.
+
+    Args:
+        home (str): Airport/city code the trip starts from
+        cities (List[str]): Airport/city codes to visit, in any order
+        start_date (str): Departure date of the first flight in YYYY-MM-DD format
+        nights_per_city (int): Nights spent in each city
+        return_home (bool, optional): Whether the trip ends with a flight home
+        adults (int, optional): Number of adult passengers. Defaults to 1.
+        children_ages (List[int], optional): List of children's ages
+        cabin_class (str, optional): Cabin class preference. Defaults to "ECONOMY".
+
+    Returns:
+        dict: The 'order', each leg with its date and price, the 'total',
+              the 'solver' used and the matrix and solver timings
+
+    Raises:
+        ValueError: If there are too many cities or no complete route is priced
+    """
+    cities = list(dict.fromkeys(city for city in cities if city != home))
+    if not cities:
+        raise ValueError("At least one city other than home is required")
+    if len(cities) > MAX_CITIES:
+        raise ValueError(f"At most {MAX_CITIES} cities can be optimized at once")
+
+    legs = len(cities) + (1 if return_home else 0)
+    dates = _leg_dates(start_date, legs, nights_per_city)
+    matrix = PriceMatrix(adults, children_ages, cabin_class)
+    exact = len(cities) <= EXACT_MAX_CITIES
+
+    matrix_start = time.perf_counter()
+    if exact:
+        # Every fare the dynamic program can ask for, fetched up front
+        cells = [(home, city, dates[0]) for city in cities]
+        cells += [(origin, destination, dates[leg])
+                  for leg in range(1, len(cities))
+                  for origin in cities
+                  for destination in cities
+                  if origin != destination]
+        if return_home:
+            cells += [(city, home, dates[len(cities)]) for city in cities]
+        matrix.prefetch(cells)
+    matrix_ms = (time.perf_counter() - matrix_start) * 1000
+
+    solver_start = time.perf_counter()
+    if exact:
+        total, order = solve_exact(matrix, home, cities, dates, return_home)
+    else:
+        total, order = solve_heuristic(matrix, home, cities, dates, return_home)
+    solver_ms = (time.perf_counter() - solver_start) * 1000
+
+    if math.isinf(total):
+        raise ValueError("No complete route has priced flights for every leg")
+
+    stops = [home] + order + ([home] if return_home else [])
+    route_legs = [{
+        'from': stops[leg],
+        'to': stops[leg + 1],
+        'date': dates[leg],
+        'price': round(matrix.price(stops[leg], stops[leg + 1], dates[leg]), 2)
+    } for leg in range(len(stops) - 1)]
+
+    return {
+        'order': order,
+        'legs': route_legs,
+        'total': round(total, 2),
+        'currency': matrix.currency,
+        'solver': 'exact' if exact else 'heuristic',
+        'solver_ms': round(solver_ms, 2),
+        'matrix_ms': round(matrix_ms, 2),
+        'flight_searches': matrix.searches,
+        'failed_searches': matrix.failed,
+        'stale': matrix.stale
+    }
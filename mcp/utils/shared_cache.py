@@ -0,0 +1,140 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# SQLite file shared by every worker process on the host. Empty disables
+# sharing, which is the default for a single process
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+
+# Expired rows are deleted at most this often, in seconds
+PURGE_INTERVAL = 60
+
+
+class SharedStore:
+    """
+    Cross-process key/value store with expiry, backed by SQLite in WAL mode.
+
+    Lets worker processes on one host share cached upstream results, offer
+    references and job state, so any worker can serve any tool call. Values
+    are pickled; the file is local to the host and only written by the
+    server itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_purge = 0.0
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT, key TEXT, value BLOB, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and per process since forked children
+        # must not reuse their parent's connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, seconds left to live), or None if the key is missing or expired."""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key)).fetchone()
+        now = time.time()
+        if row is None or row[1] < now:
+            return None
+        return pickle.loads(row[0]), row[1] - now
+
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        """All (key, value) pairs of a namespace that haven't expired."""
+        rows = self._conn().execute(
+            "SELECT key, value FROM entries WHERE namespace = ? AND expires_at >= ?",
+            (namespace, time.time())).fetchall()
+        return [(key, pickle.loads(value)) for key, value in rows]
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, pickle.dumps(value), time.time() + ttl))
+        now = time.time()
+        if now - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = now
+            conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def enable(path: str) -> SharedStore:
+    """Turn on sharing through the SQLite file at path, for this process and its children."""
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = SharedStore(path)
+        os.environ["SHARED_CACHE_PATH"] = path
+    return _store
+
+
+def shared_store() -> Optional[SharedStore]:
+    """The shared store, or None when running as a single process."""
+    if _store is None and SHARED_CACHE_PATH:
+        enable(SHARED_CACHE_PATH)
+    return _store
+
+
+def shared_get(namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+    """(value, seconds left) from the shared store, or None if sharing is off or the key is absent."""
+    store = shared_store()
+    if store is None:
+        return None
+    try:
+        return store.get(namespace, key)
+    except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        print(f"Shared cache read failed: {e}")
+        return None
+
+
+def shared_items(namespace: str) -> List[Tuple[str, Any]]:
+    """Unexpired (key, value) pairs of a namespace, empty if sharing is off."""
+    store = shared_store()
+    if store is None:
+        return []
+    try:
+        return store.items(namespace)
+    except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        print(f"Shared cache read failed: {e}")
+        return []
+
+
+def shared_set(namespace: str, key: str, value: Any, ttl: float):
+    store = shared_store()
+    if store is None:
+        return
+    try:
+        store.set(namespace, key, value, ttl)
+    except (sqlite3.Error, pickle.PicklingError, TypeError, AttributeError) as e:
+        print(f"Shared cache write failed: {e}")
+
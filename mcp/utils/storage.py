@@ -0,0 +1,232 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Directory the generated calendars are written to
+CALENDAR_DIR = os.getenv("CALENDAR_DIR", "calendars")
+
+# Directory holding the event list behind each calendar, used for editing.
+# Kept apart from CALENDAR_DIR so it is never served
+CALENDAR_STATE_DIR = os.getenv("CALENDAR_STATE_DIR", "data/calendar_state")
+
+# Retention policy: calendars unused for longer than this many days are
+# removed, then the oldest ones until the directory fits in the size cap
+CALENDAR_MAX_AGE_DAYS = float(os.getenv("CALENDAR_MAX_AGE_DAYS", "30"))
+CALENDAR_MAX_BYTES = int(os.getenv("CALENDAR_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Seconds between background garbage collection passes
+CALENDAR_GC_INTERVAL = int(os.getenv("CALENDAR_GC_INTERVAL", "3600"))
+
+CALENDAR_SUFFIX = ".ics"
+
+
+class CalendarStore:
+    """
+    Content-addressed calendar files with a retention policy.
+
+    Files are named after a hash of their canonical content, so storing the
+    same calendar twice reuses the existing file. Reusing a file refreshes
+    its modification time, which the garbage collector treats as last use.
+
+    Each calendar also has a JSON state (its events) that lets it be edited
+    in place under the same name. An edited calendar no longer matches its
+    content hash, so it is never handed out again for a new identical calendar.
+
+    Writes take a file lock as well as a thread lock, so worker processes
+    sharing the directories don't lose each other's edits.
+    """
+
+    def __init__(self, directory: str = CALENDAR_DIR, state_directory: str = CALENDAR_STATE_DIR):
+        self.directory = directory
+        self.state_directory = state_directory
+        self.written = 0
+        self.reused = 0
+        self.edited = 0
+        self.removed = 0
+        self.last_gc = None
+        self._lock = threading.Lock()
+        self._gc_thread = None
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            os.makedirs(self.state_directory, exist_ok=True)
+            with open(os.path.join(self.state_directory, ".lock"), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def filename(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()[:32] + CALENDAR_SUFFIX
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _state_path(self, filename: str) -> str:
+        return os.path.join(self.state_directory, filename[:-len(CALENDAR_SUFFIX)] + ".json")
+
+    def load_state(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Return the saved state of a calendar, or None if it has none."""
+        try:
+            with open(self._state_path(filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path: str, content: Union[str, Iterable[str]]):
+        """Atomically write text, or chunks of text streamed one at a time."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', newline='') as f:
+            if isinstance(content, str):
+                f.write(content)
+            else:
+                for chunk in content:
+                    f.write(chunk)
+        os.replace(temp_path, path)
+
+    def store(self, key: str, render: Callable[[], Iterable[str]], state: Dict[str, Any]) -> str:
+        """
+        Store the calendar identified by a canonical key.
+
+        Args:
+            key (str): Canonical description of the calendar's content
+            render (Callable): Builds the ICS text or its chunks, only called when the file doesn't exist yet
+            state (dict): Editable state saved alongside a new calendar
+
+        Returns:
+            str: The calendar's filename
+        """
+        with self._locked():
+            attempt = 0
+            while True:
+                filename = self.filename(key if attempt == 0 else f"{key}#{attempt}")
+                path = self.path(filename)
+                if not os.path.exists(path):
+                    break
+                if not (self.load_state(filename) or {}).get('edited'):
+                    os.utime(path)
+                    self.reused += 1
+                    return filename
+                attempt += 1
+
+            self._write(self._state_path(filename), json.dumps(state))
+            self._write(path, render())
+            self.written += 1
+        return filename
+
+    def update(self, filename: str, edit: Callable[[Dict[str, Any]], Dict[str, Any]],
+               render: Callable[[Dict[str, Any]], Iterable[str]]) -> Dict[str, Any]:
+        """
+        Edit a stored calendar in place, keeping its filename.
+
+        Args:
+            filename (str): The calendar to edit
+            edit (Callable): Takes the current state and returns the new one
+            render (Callable): Builds the ICS text or its chunks from the new state
+
+        Returns:
+            dict: The new state
+
+        Raises:
+            KeyError: If the calendar doesn't exist or can't be edited
+        """
+        with self._locked():
+            state = self.load_state(filename)
+            if state is None or not os.path.exists(self.path(filename)):
+                raise KeyError(filename)
+            state = edit(state)
+            state['edited'] = True
+            self._write(self._state_path(filename), json.dumps(state))
+            self._write(self.path(filename), render(state))
+            self.edited += 1
+        return state
+
+    def _files(self):
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(CALENDAR_SUFFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def gc(self) -> int:
+        """
+        Apply the retention policy.
+
+        Returns:
+            int: Number of calendars removed
+        """
+        cutoff = time.time() - CALENDAR_MAX_AGE_DAYS * 86400
+        removed = 0
+        with self._locked():
+            files = sorted(self._files())
+            total = sum(size for _, size, _ in files)
+            for mtime, size, path in files:
+                if mtime >= cutoff and total <= CALENDAR_MAX_BYTES:
+                    break
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Couldn't remove calendar {path}: {e}")
+                    continue
+                try:
+                    os.remove(self._state_path(os.path.basename(path)))
+                except OSError:
+                    pass
+                total -= size
+                removed += 1
+            self.removed += removed
+            self.last_gc = time.time()
+        return removed
+
+    def start_background_gc(self):
+        """Start the daemon thread that applies the retention policy."""
+        if self._gc_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.gc()
+                except Exception as e:
+                    print(f"Calendar garbage collection failed: {e}")
+                time.sleep(CALENDAR_GC_INTERVAL)
+
+        self._gc_thread = threading.Thread(
+            target=run, name="calendar-gc", daemon=True)
+        self._gc_thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._files()
+        return {
+            'files': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'max_bytes': CALENDAR_MAX_BYTES,
+            'max_age_days': CALENDAR_MAX_AGE_DAYS,
+            'written': self.written,
+            'reused': self.reused,
+            'edited': self.edited,
+            'removed': self.removed,
+            'last_gc': self.last_gc,
+        }
+
+
+calendar_store = CalendarStore()
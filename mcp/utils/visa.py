@@ -0,0 +1,420 @@
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.gateway import PRIORITY_LOW, PRIORITY_NORMAL, rapidapi_json
+from utils.shared_cache import shared_get, shared_items, shared_set, shared_store
+load_dotenv()
+
+
+VISA_API_URL = "https://visa-requirement.p.rapidapi.com/"
+
+# Where the matrix is persisted between restarts
+VISA_MATRIX_PATH = os.getenv("VISA_MATRIX_PATH", "data/visa_matrix.json")
+
+# Age after which a cell is refreshed in the background, in seconds
+VISA_TTL = int(os.getenv("VISA_TTL", str(7 * 24 * 3600)))
+
+# Background refresh pacing: seconds between passes, cells per pass and
+# the maximum number of requests per second the refresh job makes
+VISA_REFRESH_INTERVAL = int(os.getenv("VISA_REFRESH_INTERVAL", "300"))
+VISA_REFRESH_BATCH = int(os.getenv("VISA_REFRESH_BATCH", "50"))
+VISA_REFRESH_RATE = float(os.getenv("VISA_REFRESH_RATE", "0.5"))
+
+# Optional pairs to keep warm, as comma separated country codes
+VISA_SEED_PASSPORTS = os.getenv("VISA_SEED_PASSPORTS", "")
+VISA_SEED_DESTINATIONS = os.getenv("VISA_SEED_DESTINATIONS", "")
+
+# Capacity of each matrix axis, there are fewer than 256 country codes
+MAX_COUNTRIES = 256
+
+UNKNOWN_DURATION = -1
+
+# Seconds fetched cells are kept in the store shared by worker processes.
+# Cells past VISA_TTL are still served while they are refreshed
+SHARED_CELL_TTL = 365 * 24 * 3600
+
+# ISO 3166-1 alpha-2 codes, the only countries the matrix accepts
+ISO_COUNTRIES = frozenset('''
+AD AE AF AG AI AL AM AO AQ AR AS AT AU AW AX AZ BA BB BD BE BF BG BH BI BJ BL BM BN BO BQ BR BS
+BT BV BW BY BZ CA CC CD CF CG CH CI CK CL CM CN CO CR CU CV CW CX CY CZ DE DJ DK DM DO DZ EC EE
+EG EH ER ES ET FI FJ FK FM FO FR GA GB GD GE GF GG GH GI GL GM GN GP GQ GR GS GT GU GW GY HK HM
+HN HR HT HU ID IE IL IM IN IO IQ IR IS IT JE JM JO JP KE KG KH KI KM KN KP KR KW KY KZ LA LB LC
+LI LK LR LS LT LU LV LY MA MC MD ME MF MG MH MK ML MM MN MO MP MQ MR MS MT MU MV MW MX MY MZ NA
+NC NE NF NG NI NL NO NP NR NU NZ OM PA PE PF PG PH PK PL PM PN PR PS PT PW PY QA RE RO RS RU RW
+SA SB SC SD SE SG SH SI SJ SK SL SM SN SO SR SS ST SV SX SY SZ TC TD TF TG TH TJ TK TL TM TN TO
+TR TT TV TW TZ UA UG UM US UY UZ VA VC VE VG VI VN VU WF WS YE YT ZA ZM ZW
+'''.split())
+
+# Common codes that aren't ISO 3166-1
+COUNTRY_ALIASES = {'UK': 'GB', 'EL': 'GR'}
+
+
+def normalize_country(code: Any) -> str:
+    """
+    Upper-case ISO 3166-1 alpha-2 code of a country.
+
+    Raises:
+        ValueError: If code isn't a known country code
+    """
+    country = str(code).strip().upper()
+    country = COUNTRY_ALIASES.get(country, country)
+    if country not in ISO_COUNTRIES:
+        raise ValueError(f"Unknown country code {code!r}, use an ISO 3166-1 alpha-2 code like 'US'")
+    return country
+
+
+def _parse_duration(value: Any) -> int:
+    """Turn '30 days', '3 months' or 90 into a number of days, -1 if unknown."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str):
+        return UNKNOWN_DURATION
+    match = re.search(r"(\d+)\s*(day|week|month|year)?", value.lower())
+    if not match:
+        return UNKNOWN_DURATION
+    amount = int(match.group(1))
+    unit = match.group(2) or "day"
+    return amount * {'day': 1, 'week': 7, 'month': 30, 'year': 365}[unit]
+
+
+def parse_requirement(payload: Dict[str, Any]) -> Tuple[str, int]:
+    """
+    Pull the requirement name and allowed stay out of a visa API response.
+
+    The API has returned the rule in a few shapes, so each known one is
+    tried in turn.
+    """
+    rule = (payload.get('visa_rules') or {}).get('primary_rule') or {}
+    category = payload.get('category')
+    if isinstance(category, dict):
+        category = category.get('name') or category.get('code')
+
+    name = rule.get('name') or category or payload.get('status') or 'unknown'
+    duration = rule.get('duration') or payload.get('dur') or payload.get('duration')
+    return str(name), _parse_duration(duration)
+
+
+class VisaMatrix:
+    """
+    Passport x destination visa requirement matrix with O(1) lookups.
+
+    Countries are mapped to row/column indexes and every cell is stored in
+    flat typed arrays: a requirement enum code (0 means never fetched), the
+    allowed stay in days and the time the cell was last refreshed. The raw
+    API answer is kept per fetched cell so lookups can return full details.
+
+    With several worker processes, fetched cells are also written to the
+    shared store. Workers pick up cells they are missing, or hold a stale
+    copy of, from there, and the worker running the background refresh
+    syncs every shared cell and is the only one saving the file.
+    """
+
+    def __init__(self, path: str = VISA_MATRIX_PATH):
+        self.path = path
+        self.countries: Dict[str, int] = {}
+        # Code 0 marks a cell that was never fetched
+        self.categories: List[str] = ['not_fetched', 'unknown']
+        self.codes = array('B', bytes(MAX_COUNTRIES * MAX_COUNTRIES))
+        self.durations = array('h', [UNKNOWN_DURATION] * (MAX_COUNTRIES * MAX_COUNTRIES))
+        self.updated = array('d', [0.0] * (MAX_COUNTRIES * MAX_COUNTRIES))
+        self.details: Dict[int, Dict[str, Any]] = {}
+        self.lookups = 0
+        self.network_fetches = 0
+        self.refreshed = 0
+        self._pending = set()
+        self._dirty = False
+        self._lock = threading.RLock()
+        # Keeps saves in order, so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._refresh_thread = None
+        self.load()
+
+    def _index(self, country: str) -> int:
+        # Called with the lock held, and only once an answer for the country came back
+        if country not in self.countries:
+            used = set(self.countries.values())
+            free = next((index for index in range(MAX_COUNTRIES) if index not in used), None)
+            if free is None:
+                raise ValueError("Visa matrix country capacity exceeded")
+            self.countries[country] = free
+        return self.countries[country]
+
+    def _cell(self, passport: str, destination: str) -> int:
+        return self._index(passport) * MAX_COUNTRIES + self._index(destination)
+
+    def _known_cell(self, passport: str, destination: str) -> Optional[int]:
+        """The pair's cell if it was ever fetched, without adding countries to the matrix."""
+        if passport not in self.countries or destination not in self.countries:
+            return None
+        cell = self.countries[passport] * MAX_COUNTRIES + self.countries[destination]
+        return cell if self.codes[cell] != 0 else None
+
+    def _category_code(self, name: str) -> int:
+        if name not in self.categories:
+            if len(self.categories) >= 256:
+                return self.categories.index('unknown')
+            self.categories.append(name)
+        return self.categories.index(name)
+
+    def store(self, passport: str, destination: str, payload: Dict[str, Any],
+              fetched_at: Optional[float] = None, share: bool = True):
+        """Write one API answer into the matrix, and into the shared store unless share is False."""
+        passport, destination = normalize_country(passport), normalize_country(destination)
+        name, duration = parse_requirement(payload)
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            cell = self._cell(passport, destination)
+            self.codes[cell] = self._category_code(name)
+            self.durations[cell] = max(min(duration, 32767), UNKNOWN_DURATION)
+            self.updated[cell] = fetched_at
+            self.details[cell] = payload
+            self._pending.discard(cell)
+            self._dirty = True
+        if share:
+            shared_set("visa", f"{passport}:{destination}", (payload, fetched_at), SHARED_CELL_TTL)
+
+    def _adopt(self, passport: str, destination: str, payload: Dict[str, Any], fetched_at: float) -> bool:
+        """Store a cell fetched by another worker if it is newer than ours."""
+        with self._lock:
+            cell = self._known_cell(passport, destination)
+            if cell is not None and self.updated[cell] >= fetched_at:
+                return False
+        self.store(passport, destination, payload, fetched_at, share=False)
+        return True
+
+    def _adopt_shared(self, passport: str, destination: str) -> bool:
+        entry = shared_get("visa", f"{passport}:{destination}")
+        return entry is not None and self._adopt(passport, destination, *entry[0])
+
+    def sync(self) -> int:
+        """
+        Adopt every newer cell other workers wrote to the shared store.
+
+        Returns:
+            int: Number of cells adopted
+        """
+        adopted = 0
+        for key, (payload, fetched_at) in shared_items("visa"):
+            passport, _, destination = key.partition(':')
+            try:
+                adopted += self._adopt(passport, destination, payload, fetched_at)
+            except ValueError as e:
+                print(f"Ignoring shared visa cell {key}: {e}")
+        return adopted
+
+    def _fetch(self, passport: str, destination: str, priority: int):
+        data = {'passport': passport, 'destination': destination}
+        result = rapidapi_json('POST', VISA_API_URL, data=data, priority=priority)
+        # Stale fallbacks keep their original fetch time so they stay due for refresh
+        self.store(passport, destination, result.data, result.fetched_at)
+        if not result.stale:
+            self.network_fetches += 1
+        return result
+
+    def lookup(self, passport: str, destination: str) -> Dict[str, Any]:
+        """
+        Look up the requirement for a passport and destination.
+
+        Cells already in the matrix are answered without touching the
+        network; stale ones are queued for the background refresh. Only a
+        pair that has never been fetched triggers a request, and a country
+        only takes a row or column once an answer for it came back.
+
+        Returns:
+            dict: passport, destination, requirement, duration_days, updated and details
+
+        Raises:
+            ValueError: If either code isn't an ISO 3166-1 alpha-2 country code
+            CircuitOpenError: If a never fetched pair cannot be fetched right now
+            requests.RequestException: If fetching a never fetched pair fails
+        """
+        passport, destination = normalize_country(passport), normalize_country(destination)
+        with self._lock:
+            self.lookups += 1
+            cell = self._known_cell(passport, destination)
+            stale = cell is not None and time.time() - self.updated[cell] > VISA_TTL
+
+        if (cell is None or stale) and self._adopt_shared(passport, destination):
+            # Another worker fetched or refreshed the pair
+            with self._lock:
+                cell = self._known_cell(passport, destination)
+                stale = time.time() - self.updated[cell] > VISA_TTL
+
+        if stale:
+            with self._lock:
+                self._pending.add(cell)
+        if cell is None:
+            self._fetch(passport, destination, PRIORITY_NORMAL)
+            self.save()
+
+        with self._lock:
+            cell = self._cell(passport, destination)
+            updated = datetime.fromtimestamp(self.updated[cell], timezone.utc)
+            duration = self.durations[cell]
+            return {
+                'passport': passport,
+                'destination': destination,
+                'requirement': self.categories[self.codes[cell]],
+                'duration_days': None if duration == UNKNOWN_DURATION else duration,
+                'updated': updated.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'details': self.details.get(cell)
+            }
+
+    def _stale_cells(self, limit: int) -> List[Tuple[str, str]]:
+        """Pairs most in need of a refresh: queued first, then the oldest known cells."""
+        now = time.time()
+        with self._lock:
+            names = {index: code for code, index in self.countries.items()}
+            candidates = set(self._pending)
+            for cell in self.details:
+                if now - self.updated[cell] > VISA_TTL:
+                    candidates.add(cell)
+            ordered = sorted(candidates, key=lambda cell: self.updated[cell])[:limit]
+            return [(names[cell // MAX_COUNTRIES], names[cell % MAX_COUNTRIES])
+                    for cell in ordered]
+
+    @staticmethod
+    def _seed_countries(value: str) -> List[str]:
+        countries = []
+        for code in value.split(','):
+            if not code.strip():
+                continue
+            try:
+                countries.append(normalize_country(code))
+            except ValueError as e:
+                print(f"Ignoring visa seed country: {e}")
+        return countries
+
+    def _seed_pairs(self) -> List[Tuple[str, str]]:
+        passports = self._seed_countries(VISA_SEED_PASSPORTS)
+        destinations = self._seed_countries(VISA_SEED_DESTINATIONS)
+        pairs = []
+        with self._lock:
+            for passport in passports:
+                for destination in destinations:
+                    if passport != destination and self._known_cell(passport, destination) is None:
+                        pairs.append((passport, destination))
+        return pairs
+
+    def refresh_once(self, limit: int = VISA_REFRESH_BATCH) -> int:
+        """
+        Refresh up to `limit` stale or seeded cells at the background pace.
+
+        Returns:
+            int: Number of cells refreshed
+        """
+        self.sync()
+        pairs = (self._seed_pairs() + self._stale_cells(limit))[:limit]
+        refreshed = 0
+        for passport, destination in pairs:
+            try:
+                if not self._fetch(passport, destination, PRIORITY_LOW).stale:
+                    refreshed += 1
+            except Exception as e:
+                print(f"Visa refresh {passport}->{destination} failed: {e}")
+            time.sleep(1 / VISA_REFRESH_RATE)
+        self.refreshed += refreshed
+        self.save()
+        return refreshed
+
+    def start_background_refresh(self):
+        """Start the daemon thread that keeps the matrix fresh."""
+        if self._refresh_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh_once()
+                except Exception as e:
+                    print(f"Visa matrix refresh failed: {e}")
+                time.sleep(VISA_REFRESH_INTERVAL)
+
+        self._refresh_thread = threading.Thread(
+            target=run, name="visa-matrix-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def save(self):
+        """Persist the filled cells to disk if the matrix changed since the last save."""
+        if shared_store() is not None and self._refresh_thread is None:
+            # Workers share cells through the shared store, only the one
+            # refreshing them writes the file
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                cells = [[cell, self.codes[cell], self.durations[cell], self.updated[cell],
+                          self.details.get(cell)]
+                         for cell in self.details]
+                # Serialized under the lock, the request and refresh threads both write cells
+                snapshot = json.dumps({
+                    'countries': self.countries,
+                    'categories': self.categories,
+                    'cells': cells,
+                })
+                self._dirty = False
+
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'w') as f:
+                    f.write(snapshot)
+                os.replace(temp_path, self.path)
+            except OSError:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def load(self):
+        """Load a previously saved matrix, if there is one."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable visa matrix {self.path}: {e}")
+            return
+
+        countries = {code: index for code, index in snapshot.get('countries', {}).items()
+                     if code in ISO_COUNTRIES}
+        valid = set(countries.values())
+        cells = [entry for entry in snapshot.get('cells', [])
+                 if entry[0] // MAX_COUNTRIES in valid and entry[0] % MAX_COUNTRIES in valid]
+        # Older files could hold countries that were never fetched, or aren't countries at all
+        used = {entry[0] // MAX_COUNTRIES for entry in cells} | {entry[0] % MAX_COUNTRIES for entry in cells}
+
+        with self._lock:
+            self.countries = {code: index for code, index in countries.items() if index in used}
+            self.categories = snapshot.get('categories', self.categories)
+            for cell, code, duration, updated, details in cells:
+                self.codes[cell] = code
+                self.durations[cell] = duration
+                self.updated[cell] = updated
+                self.details[cell] = details
+            self._dirty = len(self.countries) != len(snapshot.get('countries', {}))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'countries': len(self.countries),
+                'cells_filled': sum(1 for code in self.codes if code),
+                'lookups': self.lookups,
+                'network_fetches': self.network_fetches,
+                'background_refreshed': self.refreshed,
+                'pending_refresh': len(self._pending),
+            }
+
+
+visa_matrix = VisaMatrix()
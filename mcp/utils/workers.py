@@ -0,0 +1,158 @@
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+
+from utils.gateway import set_worker_share
+from utils.shared_cache import enable as enable_shared_cache
+load_dotenv()
+
+
+# Worker processes started by the streamable-HTTP launcher
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", str(os.cpu_count() or 1)))
+
+# SQLite file the workers share caches and job state through
+WORKER_SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH") or "data/shared_cache.db"
+
+# A worker that exits sooner than this after starting is restarted after a
+# delay, doubled on every early exit up to the maximum, so a broken
+# configuration doesn't turn into a fork loop
+MIN_WORKER_UPTIME = float(os.getenv("MCP_MIN_WORKER_UPTIME", "5"))
+WORKER_RESTART_DELAY = float(os.getenv("MCP_WORKER_RESTART_DELAY", "1"))
+WORKER_RESTART_MAX_DELAY = float(os.getenv("MCP_WORKER_RESTART_MAX_DELAY", "60"))
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, workers: int, sock: socket.socket, make_app: Callable,
+                on_start: Optional[Callable[[int], None]], log_level: str):
+    # Restore default signal handling, uvicorn installs its own handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    set_worker_share(workers)
+    if on_start is not None:
+        on_start(index)
+    config = uvicorn.Config(make_app(), log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_workers(
+    make_app: Callable,
+    host: str,
+    port: int,
+    workers: int = MCP_WORKERS,
+    on_start: Optional[Callable[[int], None]] = None,
+    log_level: str = "info"
+):
+    """
+    Serve an ASGI app from several forked worker processes on one port.
+
+    The parent binds the socket once and every worker accepts connections
+    from it, so the kernel spreads requests across them. Workers share
+    caches and job state through a SQLite file and split every upstream
+    rate limit between them. A worker that dies is started again, after a
+    growing delay if it keeps dying right after starting; SIGTERM or SIGINT
+    on the parent stops all of them.
+
+    Args:
+        make_app (Callable): Builds the ASGI app, called inside each worker
+        host (str): Interface to listen on
+        port (int): Port to listen on
+        workers (int, optional): Number of worker processes
+        on_start (Callable, optional): Called with the worker index when a
+                                       worker starts, before it serves requests
+        log_level (str, optional): uvicorn log level
+    """
+    workers = max(1, workers)
+    enable_shared_cache(WORKER_SHARED_CACHE_PATH)
+    sock = _bind(host, port)
+    print(f"Starting {workers} workers on {host}:{port}, sharing {WORKER_SHARED_CACHE_PATH}")
+
+    children: Dict[int, tuple] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(index, workers, sock, make_app, on_start, log_level)
+            except BaseException as e:
+                print(f"Worker {index} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(workers):
+        spawn(index)
+
+    # Monotonic times at which workers that exited early are started again,
+    # and how many times in a row each exited early
+    restarts: Dict[int, float] = {}
+    early_exits: Dict[int, int] = {}
+
+    while children or (restarts and not stopping):
+        now = time.monotonic()
+        for index, at in list(restarts.items()):
+            if stopping:
+                restarts.clear()
+            elif at <= now:
+                del restarts[index]
+                spawn(index)
+        if not children:
+            if restarts:
+                time.sleep(min(1.0, max(min(restarts.values()) - now, 0.0)))
+            continue
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG if restarts else 0)
+        except ChildProcessError:
+            children.clear()
+            continue
+        except InterruptedError:
+            continue
+        if pid == 0:
+            # No worker exited, wait for the next restart
+            time.sleep(min(1.0, max(min(restarts.values()) - now, 0.0)))
+            continue
+        index, started = children.pop(pid, (None, 0.0))
+        if index is None or stopping:
+            continue
+        uptime = time.monotonic() - started
+        print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)} "
+              f"after {uptime:.0f}s")
+        if uptime >= MIN_WORKER_UPTIME:
+            early_exits.pop(index, None)
+            spawn(index)
+            continue
+        early_exits[index] = early_exits.get(index, 0) + 1
+        delay = min(WORKER_RESTART_DELAY * 2 ** (early_exits[index] - 1), WORKER_RESTART_MAX_DELAY)
+        print(f"Worker {index} exited within {MIN_WORKER_UPTIME:g}s of starting, restarting it in {delay:g}s")
+        restarts[index] = time.monotonic() + delay
+
+    sock.close()